@@ -0,0 +1,105 @@
+"""
+Benchmark: original scraper extraction vs the bounded extraction in modules/html_extract.py.
+
+Runs every saved page in benchmarks/fixtures through
+- "legacy":  full BeautifulSoup(html.parser) parse, full get_text(), then text[:15000]
+- each available backend of extract_content (byte-capped body, budgeted text)
+
+`--scale N` repeats each fixture's <body> N times to model multi-megabyte pages.
+
+    python benchmarks/bench_scraper.py --scale 1 --scale 40
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+from modules import html_extract
+from modules.html_extract import EMAIL_PATTERN
+
+# Same settings as modules/scraper.py (not imported here so no database is needed)
+SCRAPER_MAX_BYTES = int(os.getenv("SCRAPER_MAX_BYTES", 2 * 1024 * 1024))
+SCRAPER_MAX_CHARS = int(os.getenv("SCRAPER_MAX_CHARS", 15000))
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def legacy_extract(html):
+    """The scraper's extraction before bounded streaming / pluggable backends"""
+    soup = BeautifulSoup(html, 'html.parser')
+    for script in soup(["script", "style", "nav", "footer", "header", "noscript", "iframe", "svg"]):
+        script.decompose()
+    text = soup.get_text(separator=' ')
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    text = '\n'.join(chunk for chunk in chunks if chunk)
+    found_emails = list(set(re.findall(EMAIL_PATTERN, html)))
+    return text[:SCRAPER_MAX_CHARS], found_emails
+
+
+def bounded_extract(html, backend):
+    """Current scraper path: body capped at SCRAPER_MAX_BYTES, text budgeted"""
+    capped = html.encode('utf-8')[:SCRAPER_MAX_BYTES].decode('utf-8', errors='replace')
+    text = html_extract.extract_text(capped, SCRAPER_MAX_CHARS, backend)
+    found_emails = list(set(re.findall(EMAIL_PATTERN, capped)))
+    return text, found_emails
+
+
+def scale_page(html, factor):
+    if factor <= 1:
+        return html
+    start = html.index('<body>') + len('<body>')
+    end = html.rindex('</body>')
+    return html[:start] + html[start:end] * factor + html[end:]
+
+
+def timeit(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, action='append', help='body repetition factor (repeatable)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    scales = args.scale or [1, 40]
+
+    backends = html_extract.available_backends()
+    print(f"Backends available: {', '.join(backends)}")
+    print(f"SCRAPER_MAX_BYTES={SCRAPER_MAX_BYTES} SCRAPER_MAX_CHARS={SCRAPER_MAX_CHARS}\n")
+    print(f"{'fixture':<28}{'size':>10}  {'variant':<14}{'median ms':>10}{'speedup':>9}  same text")
+
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+            base_html = f.read()
+        for factor in scales:
+            html = scale_page(base_html, factor)
+            label = f"{name} x{factor}"
+            size = f"{len(html.encode('utf-8')) / 1024:.0f} KB"
+
+            reference_text, _ = legacy_extract(html)
+            legacy_ms = timeit(lambda: legacy_extract(html), args.repeat)
+            print(f"{label:<28}{size:>10}  {'legacy':<14}{legacy_ms:>10.1f}{'1.0x':>9}")
+
+            for backend in backends:
+                text, _ = bounded_extract(html, backend)
+                ms = timeit(lambda: bounded_extract(html, backend), args.repeat)
+                print(f"{'':<28}{'':>10}  {backend:<14}{ms:>10.1f}{legacy_ms / ms:>8.1f}x  {text == reference_text}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -269,6 +269,257 @@ class SentEmail(SQLModel, table=True):
     sent_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class LLMCacheEntry(SQLModel, table=True):
+    """
+    Persistent layer of the LLM response cache (see modules/llm_cache.py),
+    keyed by a hash of (model, prompt)
+    """
+    __tablename__ = "llm_cache"
+
+    key: str = Field(primary_key=True, max_length=64)
+    model: str = Field(max_length=100)
+    response: str = Field(sa_column=Column(Text, nullable=False))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
+
+
+class ScrapeCacheEntry(SQLModel, table=True):
+    """
+    Cached scrape result per normalized URL, with the validators used for conditional GETs
+    (see modules/scrape_cache.py)
+    """
+    __tablename__ = "scrape_cache"
+
+    url: str = Field(
+        max_length=500,
+        sa_column=Column(String(500), primary_key=True)
+    )
+    content: str = Field(sa_column=Column(Text, nullable=False))
+    emails: Optional[List[str]] = Field(default_factory=list, sa_column=Column(JSON))
+    # Structured-markup contacts from modules/contact_extractor.py
+    contacts: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    etag: Optional[str] = Field(default=None, max_length=255)
+    last_modified: Optional[str] = Field(default=None, max_length=100)
+    fetched_at: datetime = Field(default_factory=datetime.utcnow)
+    validated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class LeadJob(SQLModel, table=True):
+    """
+    Background lead-generation batch (see modules/job_queue.py)
+    """
+    __tablename__ = "lead_jobs"
+
+    id: uuid.UUID = Field(
+        default_factory=uuid.uuid4,
+        primary_key=True
+    )
+    kind: str = Field(default="generate", max_length=50)  # generate, draft
+    status: str = Field(default="queued", max_length=20, index=True)  # queued, running, completed, failed, cancelled
+    options: Optional[dict] = Field(default_factory=dict, sa_column=Column(JSON))
+    total: int = Field(default=0)
+    error: Optional[str] = Field(default=None, sa_column=Column(Text))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class LeadJobItem(SQLModel, table=True):
+    """
+    One URL / lead of a LeadJob, with its result once processed
+    """
+    __tablename__ = "lead_job_items"
+    __table_args__ = (
+        Index('ix_lead_job_items_job_status', 'job_id', 'status'),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_id: uuid.UUID = Field(foreign_key="lead_jobs.id")
+    position: int = Field(default=0)
+    url: str = Field(max_length=500)
+    payload: Optional[dict] = Field(default_factory=dict, sa_column=Column(JSON))
+    status: str = Field(default="pending", max_length=20)  # pending, running, done, failed, skipped
+    result: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    error: Optional[str] = Field(default=None, sa_column=Column(Text))
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class LeadBatch(SQLModel, table=True):
+    """
+    Offline bulk run through the OpenAI Batch API (see modules/batch_mode.py)
+    """
+    __tablename__ = "lead_batches"
+
+    id: uuid.UUID = Field(
+        default_factory=uuid.uuid4,
+        primary_key=True
+    )
+    # queued -> analyzing -> drafting -> completed (or failed, cancelled)
+    status: str = Field(default="queued", max_length=20, index=True)
+    openai_batch_id: Optional[str] = Field(default=None, max_length=255)
+    options: Optional[dict] = Field(default_factory=dict, sa_column=Column(JSON))
+    total: int = Field(default=0)
+    error: Optional[str] = Field(default=None, sa_column=Column(Text))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+
+class LeadBatchItem(SQLModel, table=True):
+    """
+    One prospect of a LeadBatch: its analysis after the first batch, its drafts after the second
+    """
+    __tablename__ = "lead_batch_items"
+    __table_args__ = (
+        Index('ix_lead_batch_items_batch_status', 'batch_id', 'status'),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    batch_id: uuid.UUID = Field(foreign_key="lead_batches.id")
+    position: int = Field(default=0)
+    url: str = Field(max_length=500)
+    company_name: Optional[str] = Field(default=None, max_length=255)
+    primary_email: Optional[str] = Field(default=None, max_length=255)
+    status: str = Field(default="pending", max_length=20)  # pending, analyzed, done, failed, skipped
+    analysis: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    result: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    error: Optional[str] = Field(default=None, sa_column=Column(Text))
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class CompanyIntelligence(SQLModel, table=True):
+    """
+    Structured analysis of a prospect, per canonical domain, reused by every outreach path
+    (see modules/company_intel.py)
+    """
+    __tablename__ = "company_intelligence"
+
+    domain: str = Field(
+        max_length=255,
+        sa_column=Column(String(255), primary_key=True)
+    )
+    company_name: Optional[str] = Field(default=None, max_length=255)
+    website_url: Optional[str] = Field(default=None, max_length=500)
+    source: str = Field(default="website", max_length=20)  # website, fallback (name only), batch
+    company_info: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    market_analysis: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    service_matches: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    # Incremented on every re-analysis
+    version: int = Field(default=1)
+    analyzed_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class OutboxMessage(SQLModel, table=True):
+    """
+    Email accepted by /send-lead, /send or a campaign and delivered by the outbox
+    workers (see modules/outbox.py). Credentials are never stored here.
+    """
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str = Field(default="send", max_length=20)  # outreach, inbound, send, campaign
+    to_email: str = Field(max_length=255)
+    cc_emails: Optional[List[str]] = Field(default=None, sa_column=Column(JSON))  # None = default CCs
+    subject: str = Field(max_length=500)
+    body: str = Field(sa_column=Column(Text, nullable=False))
+    html: bool = Field(default=True)
+    sender_email: str = Field(max_length=255)
+    smtp_server: str = Field(max_length=255)
+    smtp_port: int = Field(default=587)
+    imap_server: Optional[str] = Field(default=None, max_length=255)
+    client_id: Optional[int] = Field(default=None, foreign_key="client_profiles.id")
+    company_id: Optional[uuid.UUID] = Field(default=None, foreign_key="companies.id")
+    email_log_id: Optional[uuid.UUID] = Field(default=None, foreign_key="email_logs.id")  # the EmailLog row this send is counted in
+    status: str = Field(default="pending", max_length=20)  # pending, sending, sent, failed
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+    last_error: Optional[str] = Field(default=None, sa_column=Column(Text))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    sent_at: Optional[datetime] = None
+
+
+class Campaign(SQLModel, table=True):
+    """
+    Bulk send of prepared drafts, paced per sender (see modules/campaigns.py)
+    """
+    __tablename__ = "campaigns"
+
+    id: uuid.UUID = Field(
+        default_factory=uuid.uuid4,
+        primary_key=True
+    )
+    name: Optional[str] = Field(default=None, max_length=255)
+    # queued -> sending -> completed (every recipient queued or skipped), or cancelled
+    status: str = Field(default="queued", max_length=20, index=True)
+    options: Optional[dict] = Field(default_factory=dict, sa_column=Column(JSON))
+    total: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+
+class CampaignRecipient(SQLModel, table=True):
+    """
+    One email of a Campaign; once queued, its delivery is tracked by its outbox message
+    """
+    __tablename__ = "campaign_recipients"
+    __table_args__ = (
+        Index('ix_campaign_recipients_campaign_status', 'campaign_id', 'status'),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    campaign_id: uuid.UUID = Field(foreign_key="campaigns.id")
+    position: int = Field(default=0)
+    to_email: str = Field(max_length=255)
+    company_name: Optional[str] = Field(default=None, max_length=255)
+    website_url: Optional[str] = Field(default=None, max_length=500)
+    subject: str = Field(max_length=500)
+    body: str = Field(sa_column=Column(Text, nullable=False))
+    spanish_body: Optional[str] = Field(default=None, sa_column=Column(Text))
+    status: str = Field(default="pending", max_length=20)  # pending, queued, skipped, failed, cancelled
+    sender_email: Optional[str] = Field(default=None, max_length=255)
+    outbox_id: Optional[int] = Field(default=None, foreign_key="email_outbox.id")
+    error: Optional[str] = Field(default=None, sa_column=Column(Text))
+    queued_at: Optional[datetime] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class SentCopy(SQLModel, table=True):
+    """
+    Sent message waiting to be appended to the sender's IMAP Sent folder
+    (see modules/sent_appender.py). Credentials are never stored here.
+    """
+    __tablename__ = "sent_copies"
+    __table_args__ = (
+        Index('ix_sent_copies_status_account', 'status', 'account'),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    account: str = Field(max_length=255)
+    imap_server: str = Field(max_length=255)
+    imap_port: int = Field(default=993)
+    message: str = Field(sa_column=Column(Text, nullable=False))
+    status: str = Field(default="pending", max_length=20)  # pending, failed (deleted once appended)
+    attempts: int = Field(default=0)
+    error: Optional[str] = Field(default=None, sa_column=Column(Text))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class SendRateBucket(SQLModel, table=True):
+    """
+    Emails reserved per sender and minute (see modules/send_limiter.py), so the
+    hourly window survives restarts. Rows older than the window are deleted.
+    """
+    __tablename__ = "send_rate_buckets"
+
+    sender_email: str = Field(primary_key=True, max_length=255)
+    bucket: datetime = Field(primary_key=True)  # start of the minute (UTC)
+    count: int = Field(default=0)
+
+
 def create_db_and_tables():
     """
     Create all database tables (drops existing tables first to ensure schema matches)
@@ -290,7 +541,9 @@ def create_db_and_tables():
         "ALTER TABLE client_profiles ADD COLUMN \"outbound_email_sent\" BOOLEAN DEFAULT FALSE",
         "ALTER TABLE client_profiles ADD COLUMN \"inbound_email_sent\" BOOLEAN DEFAULT FALSE",
         "ALTER TABLE email_logs ADD COLUMN \"subject\" VARCHAR(500)",
-        "ALTER TABLE email_logs ADD COLUMN \"content\" TEXT"
+        "ALTER TABLE email_logs ADD COLUMN \"content\" TEXT",
+        "ALTER TABLE scrape_cache ADD COLUMN \"contacts\" JSON",
+        f"ALTER TABLE email_outbox ADD COLUMN \"email_log_id\" {'UUID' if engine.dialect.name == 'postgresql' else 'CHAR(32)'}"
     ]
     
     with engine.connect() as conn:
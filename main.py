@@ -1,5 +1,6 @@
 import asyncio
 import sys
+import json
 
 import os
 import uuid
@@ -16,7 +17,7 @@ import traceback
 
 from fastapi import FastAPI, Request, Form, Depends, HTTPException, BackgroundTasks, Body, File, UploadFile
 from pydantic import BaseModel
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.concurrency import run_in_threadpool
@@ -42,26 +43,36 @@ from database import (
 )
 
 # AI & Scraping Modules
-from modules.scraper import scrape_website
+from modules.scraper import close_http_client
 from modules.llm_engine import analyze_content, generate_email, analyze_document
 from modules.market_analyzer import analyze_market, match_services
 from modules.serp_hawk_email import generate_serp_hawk_email
 from modules.fallback_analyzer import analyze_company_name_fallback
 from modules.image_generator import generate_email_image
-from modules.email_sender import send_email_outlook
+from modules.smtp_pool import smtp_pool
+from modules.async_smtp import async_smtp_pool
+from modules.sent_appender import sent_appender
+from modules.outbox import outbox, queue_email, get_outbox_message, list_outbox
+from modules.send_limiter import send_limiter
+from modules.sender_pool import sender_pool
+from modules.openai_client import close_openai_client
+from modules.llm_cache import llm_cache
+from modules.llm_telemetry import llm_telemetry
+from modules.llm_limiter import llm_limiter
+from modules.singleflight import singleflight
+from modules.scrape_cache import scrape_cache_stats, SCRAPE_CACHE_ENABLED, SCRAPE_CACHE_TTL_SECONDS
+from modules.lead_pipeline import generate_for_urls, stream_generate, build_lead_draft, normalize_url, analyze_prospect, derive_company_name
+from modules.company_intel import get_intel, intel_stats
+from modules.job_queue import job_queue, get_job, list_jobs, cancel_job
+from modules.batch_mode import batch_runner, get_batch, list_batches
+from modules.campaigns import campaign_runner, get_campaign, list_campaigns, cancel_campaign
 
 # Load environment variables
 load_dotenv(override=True)
 
 # Configuration
 SENDER_EMAIL = os.getenv("SENDER_EMAIL", "padilla@dapros.com") # Default sender for UI
-HOURLY_EMAIL_LIMIT = int(os.getenv("HOURLY_EMAIL_LIMIT", 50))
-OUTLOOK_EMAIL = os.getenv('OUTLOOK_EMAIL')
-OUTLOOK_PASSWORD = os.getenv('OUTLOOK_PASSWORD')
-SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-
-SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
-IMAP_SERVER = os.getenv('IMAP_SERVER') # Optional: For saving to Sent folder if auto-detect fails
+# Sending mailboxes (OUTLOOK_EMAIL / SENDER_POOL, SMTP and IMAP settings) are configured in modules/sender_pool.py
 
 # Create output directories
 os.makedirs('static/generated_images', exist_ok=True)
@@ -82,18 +93,6 @@ class RateLimitExceededError(OutreachError):
     """Raised when hourly email limit is reached"""
     pass
 
-def sync_scrape_website_wrapper(url):
-    """
-    Wrapper to run the async scraper in a fresh nested loop.
-    This fixes the NotImplementedError on Windows by ensuring a ProactorEventLoop is used.
-    """
-    if sys.platform == 'win32':
-        asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
-    
-    # Import here to avoid circular dependencies if any
-    from modules.scraper import scrape_website
-    return asyncio.run(scrape_website(url))
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -143,6 +142,22 @@ async def lifespan(app: FastAPI):
         print(f"Schema update note: {e}")
 
     print("Database ready!")
+
+    # Background workers for queued lead jobs (resumes unfinished jobs)
+    await job_queue.start()
+    # Offline bulk runs through the OpenAI Batch API (resumes polling unfinished runs)
+    await batch_runner.start()
+    # Sender mailboxes: their passwords are kept in memory by the appender and the outbox
+    for sender in sender_pool.senders:
+        sent_appender.register_account(sender.email, sender.password)
+        outbox.register_account(sender.email, sender.password)
+    print(f"Sender pool: {', '.join(s.email for s in sender_pool.senders) or 'no mailboxes configured'}")
+    # Background copies of sent emails to the IMAP Sent folder (resumes the persisted queue)
+    sent_appender.start()
+    # Outbox workers deliver the emails accepted by /send-lead, /send and campaigns
+    await outbox.start()
+    # Paced release of campaign recipients into the outbox (resumes active campaigns)
+    await campaign_runner.start()
     
     # Try to install playwright browsers if needed (optional check)
     # print("Checking Playwright browsers...")
@@ -150,6 +165,15 @@ async def lifespan(app: FastAPI):
     
     yield
     print("Shutting down Cold Outreach CRM...")
+    await job_queue.stop()
+    await batch_runner.stop()
+    await campaign_runner.stop()
+    await outbox.stop()
+    await close_openai_client()
+    await close_http_client()
+    await run_in_threadpool(smtp_pool.close_all)
+    await async_smtp_pool.close_all()
+    await run_in_threadpool(sent_appender.stop)
 
 
 # Initialize FastAPI app
@@ -289,26 +313,37 @@ def check_outreach_eligibility(session: Session, website_url: str) -> dict:
                 f"({existing_company.website_url}) on {existing_company.created_at.strftime('%Y-%m-%d %H:%M')}"
             )
     
-    # Rule B: Rate Limiter
-    one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-    
-    rate_limit_statement = select(func.count(EmailLog.id)).where(
-        EmailLog.sender_email == SENDER_EMAIL,
-        EmailLog.sent_at > one_hour_ago
-    )
-    emails_sent_count = session.exec(rate_limit_statement).one()
+    # Rule B: Rate Limiter (checked only; the slots are reserved when sending)
+    emails_sent_count = sender_pool.used()
     result["emails_sent_last_hour"] = emails_sent_count
     
-    if emails_sent_count >= HOURLY_EMAIL_LIMIT:
-        raise RateLimitExceededError(
-            f"⏳ Hourly email limit ({HOURLY_EMAIL_LIMIT}) reached. "
-            f"You've sent {emails_sent_count} emails in the last hour. "
-            f"Please wait before sending more."
-        )
+    if sender_pool.senders and sender_pool.remaining() == 0:
+        raise_rate_limited(emails_sent_count)
     
     return result
 
 
+def raise_rate_limited(emails_sent_count: int):
+    raise RateLimitExceededError(
+        f"⏳ Email limits reached on all {len(sender_pool.senders)} sender mailbox(es). "
+        f"You've sent {emails_sent_count} emails in the last hour. "
+        f"Please wait before sending more."
+    )
+
+
+async def reserve_send_slots(count: int = 1):
+    """
+    Picks the least-loaded healthy sender mailbox and atomically reserves `count` of its
+    emails. Raises RateLimitExceededError if no sender has room; release the slots with
+    send_limiter.release(sender.email, count) if the emails end up not being queued.
+    """
+    # The limiter writes its counters to the DB: keep it off the event loop
+    sender = await run_in_threadpool(sender_pool.reserve, count)
+    if sender is None:
+        raise_rate_limited(await run_in_threadpool(sender_pool.used))
+    return sender
+
+
 # ============================================================================
 # ROUTES - API
 # ============================================================================
@@ -356,104 +391,27 @@ async def draft_lead(
     company_name: str = Form(...),
     website_url: str = Form(...),
     primary_email: str = Form(...),
+    fused: Optional[bool] = Form(None),
+    crawl: Optional[bool] = Form(None),
+    refresh: bool = Form(False),
     session: Session = Depends(get_session)
 ):
     """
     Step 1: Check eligibility, analyze URL, and return Draft (NO SENDING)
+    Pass fused=true to run company/market/service analysis as a single LLM call,
+    and crawl=true to also scrape the site's contact/about/team pages.
+    Stored company intelligence for the domain is reused unless refresh=true.
     """
     try:
-        # Normalize URL
-        normalized_url = website_url.strip().lower()
-        if not normalized_url.startswith(('http://', 'https://')):
-            normalized_url = 'https://' + normalized_url
-        
+        normalized_url = normalize_url(website_url)
+
         # Check eligibility (just for info, but don't block drafting yet? Or do block?)
         # Let's BLOCK if already sent, to warn user.
-        eligibility = check_outreach_eligibility(session, normalized_url)
-        
-        print(f"Analyzing {normalized_url} for personalization...")
-        
-        # Scrape & Analyze
-        scraped_text = await run_in_threadpool(scrape_website, normalized_url)
-        
-        subject = f"Partnership Opportunity with {company_name}"
-        body_html = f"<p>Hi {company_name} Team,</p><p>We'd love to partner.</p>" 
+        # The sender limiter may read its counters from the DB: keep it off the event loop
+        eligibility = await run_in_threadpool(check_outreach_eligibility, session, normalized_url)
         
-        if scraped_text and not scraped_text.startswith("ERROR SCRAPING"):
-            company_info = await run_in_threadpool(analyze_content, scraped_text)
-            market_analysis = await run_in_threadpool(analyze_market, scraped_text, company_name)
-            service_matches = await run_in_threadpool(match_services, market_analysis, company_info)
-        else:
-            # Enhanced fallback: Use AI to analyze company name for industry hints
-            company_info = await run_in_threadpool(analyze_company_name_fallback, company_name)
-            # IMPORTANT: inject company_name so the email generator doesn't default to 'your company'
-            company_info['company_name'] = company_name
-            company_info.setdefault('contacts', [])
-            market_analysis = {
-                'industry': company_info.get('likely_industry', 'Unknown'), 
-                'sub_category': company_info.get('sub_category', ''),
-                'business_model': company_info.get('business_model', 'B2B'),
-                'pain_points': company_info.get('common_pain_points', ['Lead Generation', 'Online Visibility']), 
-                'growth_potential': 'High',
-                'online_presence': {'seo_status': 'Needs improvement'}
-            }
-            # Build dynamic service recommendations from AI knowledge
-            growth_opps = company_info.get('growth_opportunities', [])
-            recommended_services = []
-            for opp in growth_opps[:3]:
-                recommended_services.append({
-                    'service_name': opp,
-                    'why_relevant': f"Based on {company_info.get('likely_industry', 'industry')} dynamics and {company_name}'s market position",
-                    'expected_impact': 'Increased organic visibility, traffic and qualified leads'
-                })
-            if not recommended_services:
-                recommended_services = [
-                    {'service_name': 'Organic SEO', 'why_relevant': 'Improve online visibility and search rankings', 'expected_impact': 'More qualified leads from search'},
-                    {'service_name': 'Local SEO', 'why_relevant': 'Dominate local search results', 'expected_impact': 'Increased local customer acquisition'}
-                ]
-            service_matches = {
-                'recommended_services': recommended_services,
-                'email_hook': f'Growth opportunities for {company_info.get("likely_industry", "your business")}',
-                'package_suggestion': 'Growth'
-            }
-
-        # Extract dynamically found primary email from AI contacts if available
-        ai_extracted_email = None
-        if company_info and company_info.get("contacts"):
-            for c in company_info["contacts"]:
-                if c.get("email") and "@" in c["email"]:
-                    ai_extracted_email = c["email"]
-                    break
-        
-        # Determine the best email to use
-        final_email = ai_extracted_email or primary_email or ""
-        
-        contact = {'name': company_name, 'email': final_email, 'role': 'Decision Maker'}
-        email_draft = await run_in_threadpool(
-            generate_serp_hawk_email,
-            company_info, market_analysis, service_matches, contact
-        )
-        
-        if email_draft:
-            subject = email_draft.get('subject', subject)
-            body_html = email_draft.get('body_html', body_html)
-
-        # Get services string
-        services = service_matches.get('recommended_services', [])
-        service_names = [s.get('service_name') for s in services]
-        recommended_services_str = ", ".join(service_names) if service_names else None
-
-        return JSONResponse({
-            'success': True,
-            'draft': {
-                'subject': subject,
-                'body': body_html,
-                'company_name': company_name,
-                'website_url': normalized_url,
-                'primary_email': final_email, # Return the dynamically extracted email
-                'recommended_services': recommended_services_str
-            }
-        })
+        draft = await build_lead_draft(company_name, normalized_url, primary_email, fused, crawl, refresh)
+        return JSONResponse({'success': True, 'draft': draft})
 
     except Exception as e:
         traceback.print_exc()
@@ -464,12 +422,15 @@ async def draft_lead(
 async def send_lead_merged(data: dict = Body(...), session: Session = Depends(get_session)):
     """
     Master Route for SERP Hawk Lead Processing:
-    1. Sends Outbound/Inbound emails (if not manual)
+    1. Queues Outbound/Inbound emails in the outbox (if not manual)
     2. Creates/Updates ClientProfile
     3. Saves to SentEmail (bilingual history)
     4. Records ActivityLog
     5. Syncs to Company & EmailLog
+    Everything is committed in one transaction; the outbox workers (modules/outbox.py)
+    deliver the emails afterwards, so the response does not wait for SMTP.
     """
+    sender = None
     try:
         company_name = data.get('company_name', 'Unknown')
         email = data.get('primary_email')
@@ -487,45 +448,15 @@ async def send_lead_merged(data: dict = Body(...), session: Session = Depends(ge
             else:
                 return JSONResponse({'success': False, 'error': 'Target email is required to send emails. Please provide an email or choose Log Manually.'}, status_code=400)
 
-        # 1. Email Sending Logic
-        outbound_sent = False
-        inbound_sent = False
-
-        if not is_manual and OUTLOOK_EMAIL and OUTLOOK_PASSWORD:
-            try:
-                # Outbound
-                send_email_outlook(
-                    to_email=email,
-                    subject=outreach.get('subject', f"Partnership Opportunity with {company_name}"),
-                    body=outreach.get('english_body') or outreach.get('body', ''),
-                    sender_email=OUTLOOK_EMAIL,
-                    sender_password=OUTLOOK_PASSWORD,
-                    smtp_server=SMTP_SERVER,
-                    smtp_port=SMTP_PORT,
-                    html=True,
-                    imap_server=IMAP_SERVER
-                )
-                outbound_sent = True
-
-                # Inbound (Simulated reply)
-                send_email_outlook(
-                    to_email=email, 
-                    subject=inbound.get('subject', f"Inquiry regarding {company_name}"),
-                    body=inbound.get('english_body') or inbound.get('body', ''),
-                    sender_email=OUTLOOK_EMAIL,
-                    sender_password=OUTLOOK_PASSWORD,
-                    smtp_server=SMTP_SERVER,
-                    smtp_port=SMTP_PORT,
-                    html=True,
-                    imap_server=IMAP_SERVER
-                )
-                inbound_sent = True
-            except Exception as e:
-                print(f"SMTP Error: {e}")
-        else:
+        # 1. Email Sending Logic: queued below, in the same transaction as the CRM records.
+        # The flags are reset by the outbox if delivery finally fails.
+        queue_send = bool(not is_manual and sender_pool.senders)
+        if queue_send:
+            sender = await reserve_send_slots(2)  # outreach + inbound, from the same mailbox
+        outbound_sent = True
+        inbound_sent = True
+        if not queue_send:
             print(f"Manual/Simulated Send Mode for {email}")
-            outbound_sent = True
-            inbound_sent = True
 
         # 2. Client Profile Persistence
         stmt = select(User).where(User.email == email)
@@ -533,8 +464,7 @@ async def send_lead_merged(data: dict = Body(...), session: Session = Depends(ge
         if not user:
             user = User(email=email, password="password123", name=company_name, role="Client")
             session.add(user)
-            session.commit()
-            session.refresh(user)
+            session.flush()
 
         stmt_profile = select(ClientProfile).where(ClientProfile.userId == user.id)
         profile = session.exec(stmt_profile).first()
@@ -559,8 +489,7 @@ async def send_lead_merged(data: dict = Body(...), session: Session = Depends(ge
                 profile.services_offered = recommended_services_str
             session.add(profile)
         
-        session.commit()
-        session.refresh(profile)
+        session.flush()
 
         # 3. SentEmail Persistence (Bilingual History)
         # Store both outreach and inbound as separate entries or one combined? 
@@ -589,6 +518,8 @@ async def send_lead_merged(data: dict = Body(...), session: Session = Depends(ge
         session.add(activity)
 
         # 5. Company & EmailLog Sync
+        comp_id = None
+        elog = None
         try:
             from sqlalchemy import or_
             company_stmt = select(Company).where(or_(Company.primary_email == email, Company.website_url == website_url))
@@ -609,14 +540,13 @@ async def send_lead_merged(data: dict = Body(...), session: Session = Depends(ge
                     email_sent_status=outbound_sent
                 )
                 session.add(new_comp)
-                session.commit()
-                session.refresh(new_comp)
+                session.flush()
                 comp_id = new_comp.id
 
             # Add to EmailLog for rate limit tracking
             elog = EmailLog(
                 company_id=comp_id,
-                sender_email=OUTLOOK_EMAIL or "system@serphawk.ai",
+                sender_email=sender.email if sender else SENDER_EMAIL,
                 subject=outreach.get('subject', 'Outreach'),
                 content=outreach.get('body', ''),
                 sent_at=datetime.utcnow()
@@ -625,17 +555,47 @@ async def send_lead_merged(data: dict = Body(...), session: Session = Depends(ge
         except Exception as e:
             print(f"Company Sync Error: {e}")
 
+        # 6. Outbox: delivered by the background workers once this transaction commits
+        outbox_messages = []
+        if queue_send:
+            outbox_messages = [
+                queue_email(
+                    session, email,
+                    subject=outreach.get('subject', f"Partnership Opportunity with {company_name}"),
+                    body=outreach.get('english_body') or outreach.get('body', ''),
+                    sender_email=sender.email, smtp_server=sender.smtp_server, smtp_port=sender.smtp_port,
+                    imap_server=sender.imap_server, kind='outreach', client_id=profile.id, company_id=comp_id,
+                    email_log_id=elog.id if elog else None
+                ),
+                # Inbound (Simulated reply)
+                queue_email(
+                    session, email,
+                    subject=inbound.get('subject', f"Inquiry regarding {company_name}"),
+                    body=inbound.get('english_body') or inbound.get('body', ''),
+                    sender_email=sender.email, smtp_server=sender.smtp_server, smtp_port=sender.smtp_port,
+                    imap_server=sender.imap_server, kind='inbound', client_id=profile.id, company_id=comp_id
+                ),
+            ]
+
         session.commit()
+        if outbox_messages:
+            outbox.notify()
 
         return JSONResponse({
             'success': True,
             'outbound_sent': outbound_sent,
             'inbound_sent': inbound_sent,
+            'queued': queue_send,
+            'outbox_ids': [m.id for m in outbox_messages],
             'client_id': profile.id
         })
 
+    except RateLimitExceededError as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=429)
     except Exception as e:
         traceback.print_exc()
+        if sender is not None:
+            await run_in_threadpool(send_limiter.release, sender.email, 2)
         return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
 
 
@@ -682,221 +642,260 @@ async def get_activities(limit: int = 10, session: Session = Depends(get_session
 @app.post("/generate")
 async def generate_ai_analysis(data: dict):
     """
-    Complete SERP Hawk outreach workflow:
-    1. Scrape website
-    2. Analyze company
-    3. Analyze market & competitors
-    4. Match services
-    5. Generate email
-    6. Create image
+    Complete SERP Hawk outreach workflow for every URL in the batch
+    (see modules.lead_pipeline.process_generate_url).
+    URLs are processed concurrently, capped by `concurrency` (default GENERATE_CONCURRENCY).
+    Set `fused` to analyze each site with one combined LLM call (default FUSED_ANALYSIS),
+    and `crawl` to also scrape each site's contact/about/team pages (default SCRAPER_CRAWL).
+    Sites with fresh stored company intelligence are not re-analyzed unless `refresh` is set.
+    Results are returned in input order.
     """
     urls = data.get('urls', [])
-    results = []
+    results = await generate_for_urls(
+        urls, data.get('concurrency'), data.get('fused'), data.get('crawl'), bool(data.get('refresh'))
+    )
+    return JSONResponse(results)
 
-    for url in urls:
-        try:
-            print(f"Processing: {url}")
-            
-            # Step 1: Scrape
-            try:
-                scraped_text = await run_in_threadpool(sync_scrape_website_wrapper, url)
-                has_error = not scraped_text or "ERROR SCRAPING" in scraped_text.upper()
-            except Exception as e:
-                import traceback
-                print(f"Exception during scraping {url}: {e}")
-                scraped_text = f"ERROR SCRAPING: {str(e)}"
-                has_error = True
-            
-            if has_error:
-                # Try to derive a name from the URL for the fallback
-                derived_name = url.split('//')[-1].split('/')[0].replace('www.', '').split('.')[0].replace('-', ' ').title()
-                company_info = await run_in_threadpool(analyze_company_name_fallback, derived_name)
-                company_name = company_info.get('company_name', derived_name)
-                # IMPORTANT: inject company_name so the email generator doesn't default to 'your company'
-                company_info['company_name'] = company_name
-                company_info.setdefault('contacts', [])
-                
-                market_analysis = {
-                    'industry': company_info.get('likely_industry', 'Unknown'), 
-                    'sub_category': company_info.get('sub_category', ''),
-                    'business_model': company_info.get('business_model', 'B2B'),
-                    'pain_points': company_info.get('common_pain_points', ['Lead Generation', 'Online Visibility']), 
-                    'growth_potential': 'High',
-                    'online_presence': {'seo_status': 'Needs improvement'}
-                }
-                # Build dynamic service recommendations from AI knowledge
-                growth_opps = company_info.get('growth_opportunities', [])
-                recommended_services = []
-                for opp in growth_opps[:3]:
-                    recommended_services.append({
-                        'service_name': opp,
-                        'why_relevant': f"Based on {company_info.get('likely_industry', 'industry')} dynamics and {company_name}'s market position",
-                        'expected_impact': 'Increased organic visibility, traffic and qualified leads'
-                    })
-                if not recommended_services:
-                    recommended_services = [
-                        {'service_name': 'Organic SEO', 'why_relevant': 'Improve online visibility and search rankings', 'expected_impact': 'More qualified leads from search'},
-                        {'service_name': 'Local SEO', 'why_relevant': 'Dominate local search results', 'expected_impact': 'Increased local customer acquisition'}
-                    ]
-                service_matches = {
-                    'recommended_services': recommended_services,
-                    'email_hook': f'Growth opportunities for {company_info.get("likely_industry", "your business")}',
-                    'package_suggestion': 'Growth'
+
+@app.post("/generate/stream")
+async def generate_ai_analysis_stream(data: dict):
+    """
+    Streaming variant of /generate: each URL's result is sent as soon as it finishes.
+    Body: {urls, concurrency?, fused?, crawl?, refresh?, progress?: bool, format?: "ndjson" | "sse"}
+    NDJSON (default) sends one JSON event per line; SSE sends `data: <json>` frames.
+    """
+    urls = data.get('urls', [])
+    use_sse = data.get('format') == 'sse'
+
+    async def event_stream():
+        async for event in stream_generate(
+            urls, data.get('concurrency'), data.get('fused'), bool(data.get('progress')), data.get('crawl'),
+            bool(data.get('refresh'))
+        ):
+            payload = json.dumps(event, default=str)
+            yield f"data: {payload}\n\n" if use_sse else f"{payload}\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ============================================================================
+# BACKGROUND JOB ROUTES - queued /generate and /draft-lead batches
+# ============================================================================
+
+@app.post("/jobs")
+async def create_lead_job(data: dict = Body(...), session: Session = Depends(get_session)):
+    """
+    Queue a lead-generation batch and return its job id immediately.
+    Body:
+      {"kind": "generate", "urls": [...], "concurrency"?, "fused"?, "crawl"?, "refresh"?}
+      {"kind": "draft", "leads": [{"company_name", "website_url", "primary_email"}], "concurrency"?, "fused"?, "crawl"?, "refresh"?}
+    Draft leads that were already contacted are recorded as skipped.
+    """
+    kind = data.get('kind', 'generate')
+    options = {k: data[k] for k in ('concurrency', 'fused', 'crawl', 'refresh') if data.get(k) is not None}
+
+    if kind == 'generate':
+        items = [{'url': url} for url in data.get('urls', []) if url]
+    elif kind == 'draft':
+        items = []
+        for lead in data.get('leads', []):
+            if not lead.get('website_url'):
+                continue
+            normalized_url = normalize_url(lead['website_url'])
+            item = {
+                'url': normalized_url,
+                'payload': {
+                    'company_name': lead.get('company_name'),
+                    'primary_email': lead.get('primary_email', '')
                 }
-            else:
-                # Step 2: Analyze company
-                company_info = await run_in_threadpool(analyze_content, scraped_text)
-                company_name = company_info.get('company_name', 'Unknown Company')
+            }
+            existing = session.exec(select(Company).where(Company.website_url == normalized_url)).first()
+            if existing and existing.email_sent_status:
+                item['status'] = 'skipped'
+                item['error'] = f"Prospecting email already sent to {existing.company_name}"
+            items.append(item)
+    else:
+        return JSONResponse({'success': False, 'error': f"Unknown job kind '{kind}'"}, status_code=400)
 
-                # Step 3: Market analysis
-                market_analysis = await run_in_threadpool(analyze_market, scraped_text, company_name)
+    if not items:
+        return JSONResponse({'success': False, 'error': 'No URLs provided'}, status_code=400)
 
-                # Step 4: Match services
-                service_matches = await run_in_threadpool(match_services, market_analysis, company_info)
+    job_id = await job_queue.submit(kind, items, options)
+    return JSONResponse({'success': True, 'job_id': str(job_id), 'status': 'queued', 'total': len(items)}, status_code=202)
 
-            # Step 5: Generate email
-            contacts = company_info.get('contacts', [])
-            generated_emails = []
-            
-            if contacts:
-                for contact in contacts:
-                    # Type 1: Outreach (Offering)
-                    outreach_draft = await run_in_threadpool(
-                        generate_serp_hawk_email,
-                        company_info, market_analysis, service_matches, contact, "outreach"
-                    )
-                    # Type 2: Inbound (Requesting)
-                    inbound_draft = await run_in_threadpool(
-                        generate_serp_hawk_email,
-                        company_info, market_analysis, service_matches, contact, "inbound"
-                    )
-                    
-                    generated_emails.append({
-                        'to_email': contact.get('email', ''),
-                        'recipient_name': contact.get('name'),
-                        'role': contact.get('role'),
-                        'outreach': {
-                            'subject': outreach_draft.get('subject'),
-                            'body': outreach_draft.get('body', outreach_draft.get('body_html', '')),
-                            'english_body': outreach_draft.get('english_body', ''),
-                            'spanish_body': outreach_draft.get('spanish_body', ''),
-                        },
-                        'inbound': {
-                            'subject': inbound_draft.get('subject'),
-                            'body': inbound_draft.get('body', inbound_draft.get('body_html', '')),
-                            'english_body': inbound_draft.get('english_body', ''),
-                            'spanish_body': inbound_draft.get('spanish_body', ''),
-                        }
-                    })
-            else:
-                # Type 1: Outreach (Offering)
-                outreach_draft = await run_in_threadpool(
-                    generate_serp_hawk_email,
-                    company_info, market_analysis, service_matches, None, "outreach"
-                )
-                # Type 2: Inbound (Requesting)
-                inbound_draft = await run_in_threadpool(
-                    generate_serp_hawk_email,
-                    company_info, market_analysis, service_matches, None, "inbound"
-                )
-                
-                generated_emails.append({
-                    'to_email': '', 
-                    'recipient_name': 'General',
-                    'role': 'N/A',
-                    'outreach': {
-                        'subject': outreach_draft.get('subject'),
-                        'body': outreach_draft.get('body', outreach_draft.get('body_html', '')),
-                        'english_body': outreach_draft.get('english_body', ''),
-                        'spanish_body': outreach_draft.get('spanish_body', ''),
-                    },
-                    'inbound': {
-                        'subject': inbound_draft.get('subject'),
-                        'body': inbound_draft.get('body', inbound_draft.get('body_html', '')),
-                        'english_body': inbound_draft.get('english_body', ''),
-                        'spanish_body': inbound_draft.get('spanish_body', ''),
-                    }
-                })
-
-            # Step 6: Generate beautiful email image
-            services = service_matches.get('recommended_services', [])
-            
-            safe_company_name = "".join(c for c in company_name if c.isalnum() or c in (' ', '-', '_')).strip()
-            safe_company_name = safe_company_name.replace(' ', '_')[:50]
-            
-            image_filename = f"{safe_company_name}_email_image.html"
-            image_path = os.path.join('static', 'generated_images', image_filename)
-            
-            generated_image = await run_in_threadpool(
-                generate_email_image,
-                company_name, services, image_path
-            )
 
-            results.append({
-                'url': url,
-                'analysis': {
-                    'company_name': company_name,
-                    'what_they_do': company_info.get('summary', 'Analysis available'),
-                    'contacts': contacts,
-                    'error': scraped_text if has_error else None
-                },
-                'emails': generated_emails,
-                'recommended_services': ", ".join([s.get('service_name', '') for s in service_matches.get('recommended_services', [])]) if service_matches.get('recommended_services') else None,
-                'image_url': f'/static/generated_images/{image_filename}' if generated_image else None,
-                'error': scraped_text if has_error else None
-            })
+@app.get("/jobs")
+async def list_lead_jobs(limit: int = 20):
+    """Recent jobs with progress counts"""
+    return {"jobs": await run_in_threadpool(list_jobs, limit)}
 
-        except Exception as e:
-            traceback.print_exc()
-            results.append({'url': url, 'error': str(e)})
 
-    return JSONResponse(results)
+@app.get("/jobs/{job_id}")
+async def get_lead_job(job_id: uuid.UUID, include_results: bool = True, offset: int = 0, limit: int = 100):
+    """Job status plus a page of finished item results (partial results while running)"""
+    job = await run_in_threadpool(get_job, job_id, include_results, offset, limit)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_lead_job(job_id: uuid.UUID):
+    """Stop a job; items already in progress finish, pending items are not started"""
+    status = await run_in_threadpool(cancel_job, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, "status": status}
+
+
+# ============================================================================
+# BULK ROUTES - offline analysis + drafting through the OpenAI Batch API
+# ============================================================================
+
+@app.post("/batches")
+async def create_lead_batch(data: dict = Body(...), session: Session = Depends(get_session)):
+    """
+    Start an offline bulk run (see modules/batch_mode.py); results land in Company/ClientProfile.
+    Body: {"urls": [...]} or {"leads": [{"company_name", "website_url", "primary_email"}]}, "crawl"?
+    Prospects that were already contacted are recorded as skipped.
+    """
+    leads = data.get('leads') or [{'website_url': url} for url in data.get('urls', [])]
+    items = []
+    for lead in leads:
+        if not lead.get('website_url'):
+            continue
+        normalized_url = normalize_url(lead['website_url'])
+        item = {
+            'url': normalized_url,
+            'company_name': lead.get('company_name'),
+            'primary_email': lead.get('primary_email', '')
+        }
+        existing = session.exec(select(Company).where(Company.website_url == normalized_url)).first()
+        if existing and existing.email_sent_status:
+            item['status'] = 'skipped'
+            item['error'] = f"Prospecting email already sent to {existing.company_name}"
+        items.append(item)
+
+    if not items:
+        return JSONResponse({'success': False, 'error': 'No URLs provided'}, status_code=400)
+
+    options = {k: data[k] for k in ('crawl',) if data.get(k) is not None}
+    batch_id = await batch_runner.submit(items, options)
+    return JSONResponse({'success': True, 'batch_id': str(batch_id), 'status': 'queued', 'total': len(items)}, status_code=202)
+
+
+@app.get("/batches")
+async def list_lead_batches(limit: int = 20):
+    """Recent bulk runs with progress counts"""
+    return {"batches": await run_in_threadpool(list_batches, limit)}
+
+
+@app.get("/batches/{batch_id}")
+async def get_lead_batch(batch_id: uuid.UUID, include_results: bool = True, offset: int = 0, limit: int = 100):
+    """Bulk run status plus a page of finished prospect results"""
+    batch = await run_in_threadpool(get_batch, batch_id, include_results, offset, limit)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+
+@app.post("/batches/{batch_id}/cancel")
+async def cancel_lead_batch(batch_id: uuid.UUID):
+    """Cancel a bulk run and its OpenAI batch"""
+    status = await batch_runner.cancel(batch_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return {"success": True, "status": status}
+
+
+# ============================================================================
+# CAMPAIGN ROUTES - prepared drafts released at the sender mailboxes' pace
+# ============================================================================
+
+@app.post("/campaigns")
+async def create_email_campaign(data: dict = Body(...)):
+    """
+    Queue a bulk send of prepared drafts (see modules/campaigns.py) and return its id immediately.
+    Body: {"name"?, "recipients": [{"to_email", "subject"?, "body"?, "spanish_body"?, "company_name"?, "website_url"?}],
+           "subject"?, "body"? (defaults for recipients without their own), "cc_emails"?, "html"?}
+    Recipients that were already contacted are recorded as skipped.
+    """
+    if not sender_pool.senders:
+        return JSONResponse({'success': False, 'error': 'Email credentials not configured in .env'}, status_code=500)
+
+    recipients = []
+    for recipient in data.get('recipients', []):
+        to_email = (recipient.get('to_email') or '').strip()
+        subject = recipient.get('subject') or data.get('subject')
+        body = recipient.get('english_body') or recipient.get('body') or data.get('body')
+        if not to_email or not subject or not body:
+            return JSONResponse({'success': False, 'error': f"Recipient {to_email or len(recipients)} needs to_email, subject and body"}, status_code=400)
+        recipients.append({
+            'to_email': to_email,
+            'subject': subject,
+            'body': body,
+            'spanish_body': recipient.get('spanish_body'),
+            'company_name': recipient.get('company_name'),
+            'website_url': normalize_url(recipient['website_url']) if recipient.get('website_url') else None,
+        })
+
+    if not recipients:
+        return JSONResponse({'success': False, 'error': 'No recipients provided'}, status_code=400)
+
+    options = {k: data[k] for k in ('cc_emails', 'html') if data.get(k) is not None}
+    campaign_id, skipped = await campaign_runner.submit(recipients, data.get('name'), options)
+    return JSONResponse({'success': True, 'campaign_id': str(campaign_id), 'status': 'queued', 'total': len(recipients), 'skipped': skipped}, status_code=202)
+
+
+@app.get("/campaigns")
+async def list_email_campaigns(limit: int = 20):
+    """Recent campaigns with progress counts"""
+    return {"campaigns": await run_in_threadpool(list_campaigns, limit)}
+
+
+@app.get("/campaigns/{campaign_id}")
+async def get_email_campaign(campaign_id: uuid.UUID, include_recipients: bool = True, offset: int = 0, limit: int = 100):
+    """Campaign progress, ETA and a page of recipients with their delivery status"""
+    campaign = await run_in_threadpool(get_campaign, campaign_id, include_recipients, offset, limit)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return campaign
+
+
+@app.post("/campaigns/{campaign_id}/cancel")
+async def cancel_email_campaign(campaign_id: uuid.UUID):
+    """Stop a campaign; emails already handed to the outbox are still delivered"""
+    status = await run_in_threadpool(cancel_campaign, campaign_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return {"success": True, "status": status}
 
 
 @app.post("/send")
 async def send_email_api(data: dict, session: Session = Depends(get_session)):
     """
-    Send email using credentials and log to DB (AI Outreach version)
+    Queue an email in the outbox and log to DB (AI Outreach version).
+    Delivery is done by the outbox workers; poll /outbox/{outbox_id} for its status.
     """
     email_data = data.get('email_data')
     if not email_data:
         return JSONResponse({'success': False, 'error': 'No email data provided'}, status_code=400)
 
-    sender_email = OUTLOOK_EMAIL
-    sender_password = OUTLOOK_PASSWORD
-    
-    if not sender_email or not sender_password:
-        return JSONResponse({'success': False, 'error': 'Email credentials not configured in .env'}), 500
+    if not sender_pool.senders:
+        return JSONResponse({'success': False, 'error': 'Email credentials not configured in .env'}, status_code=500)
 
-    try:
-        # Check eligibility/rate limit before sending
-        # Note: We need a URL to check duplicates, but the AI UI sends email_data directly.
-        # We'll treat this as "Ad-hoc" send, but still rate limit.
-        
-        # Rate Limit Check
-        one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-        rate_statement = select(func.count(EmailLog.id)).where(
-            EmailLog.sender_email == SENDER_EMAIL,
-            EmailLog.sent_at > one_hour_ago
-        )
-        emails_sent_count = session.exec(rate_statement).one()
-        
-        if emails_sent_count >= HOURLY_EMAIL_LIMIT:
-             return JSONResponse({'success': False, 'error': 'Hourly rate limit exceeded'}, status_code=429)
+    # Check eligibility/rate limit before sending
+    # Note: We need a URL to check duplicates, but the AI UI sends email_data directly.
+    # We'll treat this as "Ad-hoc" send, but still rate limit.
+    sender = await run_in_threadpool(sender_pool.reserve)
+    if sender is None:
+        return JSONResponse({'success': False, 'error': 'Hourly rate limit exceeded'}, status_code=429)
 
-        # Send Email
-        await run_in_threadpool(
-            send_email_outlook,
-            to_email=email_data['to_email'],
-            subject=email_data['subject'],
-            body=email_data['body'],
-            sender_email=sender_email,
-            sender_password=sender_password,
-            smtp_server=SMTP_SERVER,
-            smtp_port=SMTP_PORT,
-            html=True
-        )
-        
+    try:
         # Log to DB
         # We might not have a Company ID if it came from the AI tool randomly.
         # For now, we'll try to find a company by email or create a "clean" one if needed.
@@ -912,21 +911,19 @@ async def send_email_api(data: dict, session: Session = Depends(get_session)):
                 company_name="AI Outreach Contact",
                 website_url=f"ai-generated-{uuid.uuid4()}@example.com", # Placeholder
                 primary_email=email_data['to_email'],
-                email_sender=SENDER_EMAIL,
+                email_sender=sender.email,
                 email_sent_status=True
             )
             session.add(company)
-            session.commit()
-            session.refresh(company)
+            session.flush()
         else:
             company.email_sent_status = True
             session.add(company)
-            session.commit()
 
-        # Log to EmailLog (rate limiting)
+        # Log to EmailLog
         email_log = EmailLog(
             company_id=company.id,
-            sender_email=SENDER_EMAIL,
+            sender_email=sender.email,
             sent_at=datetime.utcnow(),
             subject=email_data['subject'],
             content=email_data['body']
@@ -946,17 +943,52 @@ async def send_email_api(data: dict, session: Session = Depends(get_session)):
             spanish_body=email_data.get('spanish_body', ''),
         )
         session.add(sent_email)
+
+        # Queue Email: committed together with the logs above, sent by the outbox workers
+        message = queue_email(
+            session, email_data['to_email'],
+            subject=email_data['subject'],
+            body=email_data['body'],
+            sender_email=sender.email, smtp_server=sender.smtp_server, smtp_port=sender.smtp_port,
+            imap_server=sender.imap_server, kind='send', client_id=client_profile.id if client_profile else None, company_id=company.id,
+            email_log_id=email_log.id
+        )
         session.commit()
+        outbox.notify()
 
-        return JSONResponse({'success': True})
+        return JSONResponse({'success': True, 'queued': True, 'outbox_id': message.id})
         
     except Exception as e:
         traceback.print_exc()
+        await run_in_threadpool(send_limiter.release, sender.email)
         return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
 
 # Duplicate route removed to prevent inconsistent behavior
 
 
+@app.get("/rate-limit")
+async def rate_limit_status(sender: Optional[str] = None):
+    """Remaining send capacity and health of the sender mailboxes (or of one sender)"""
+    if sender:
+        return await run_in_threadpool(send_limiter.status, sender)
+    return await run_in_threadpool(sender_pool.snapshot)
+
+
+@app.get("/outbox")
+async def outbox_list(status: Optional[str] = None, limit: int = 50):
+    """Recent outbox messages (optionally filtered by status) and counts per status"""
+    return await run_in_threadpool(list_outbox, status, max(1, min(limit, 500)))
+
+
+@app.get("/outbox/{message_id}")
+async def outbox_status(message_id: int):
+    """Delivery status of a queued email"""
+    message = await run_in_threadpool(get_outbox_message, message_id)
+    if message is None:
+        raise HTTPException(status_code=404, detail="Outbox message not found")
+    return message
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -975,6 +1007,60 @@ async def health_check():
     }
 
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: LLM call latency histograms, tokens, retries and cost per stage"""
+    return PlainTextResponse(llm_telemetry.prometheus() + llm_limiter.prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/llm")
+async def llm_metrics():
+    """Per-stage LLM latency (p50/p95/p99), token usage, retries and estimated cost, plus the adaptive limiter state"""
+    return {**llm_telemetry.summary(), "limiter": llm_limiter.snapshot()}
+
+
+@app.get("/metrics/singleflight")
+async def singleflight_metrics():
+    """Scrapes/analyses started vs. joined by a duplicate in-flight request"""
+    return singleflight.snapshot()
+
+
+@app.get("/metrics/smtp-pool")
+async def smtp_pool_metrics():
+    """SMTP session pool: new connections vs. reused sessions, failed health checks, idle sessions"""
+    return smtp_pool.snapshot()
+
+
+@app.get("/metrics/smtp-async")
+async def smtp_async_metrics():
+    """Asyncio SMTP transport: connections opened vs. reused, pipelined sends, idle connections"""
+    return async_smtp_pool.snapshot()
+
+
+@app.get("/metrics/sent-appender")
+async def sent_appender_metrics():
+    """Background Sent-folder appender: queue size by status, appends, IMAP logins"""
+    return await run_in_threadpool(sent_appender.snapshot)
+
+
+@app.get("/metrics/company-intel")
+async def company_intel_metrics():
+    """Company intelligence store hits (analysis reused), stale entries, misses and stores"""
+    return dict(intel_stats)
+
+
+@app.get("/metrics/llm-cache")
+async def llm_cache_metrics():
+    """LLM response cache hit/miss counters"""
+    return llm_cache.snapshot()
+
+
+@app.get("/metrics/scrape-cache")
+async def scrape_cache_metrics():
+    """Scrape cache counters (fresh hits, 304 revalidations, misses)"""
+    return {**scrape_cache_stats, "enabled": SCRAPE_CACHE_ENABLED, "ttl_seconds": SCRAPE_CACHE_TTL_SECONDS}
+
+
 # ============================================================================
 # CALL TRACKING ROUTES
 # ============================================================================
@@ -1506,9 +1592,39 @@ async def get_client_detail(client_id: int, session: Session = Depends(get_sessi
         "status": profile.status,
         "recommended_services": profile.recommended_services,
         "nextMilestone": profile.nextMilestone,
-        "nextMilestoneDate": profile.nextMilestoneDate
+        "nextMilestoneDate": profile.nextMilestoneDate,
+        "intelligence": get_intel(profile.websiteUrl) if profile.websiteUrl else None
     }
 
+
+# ============================================================================
+# COMPANY INTELLIGENCE ROUTES
+# ============================================================================
+
+@app.get("/intelligence")
+async def get_company_intelligence(url: str):
+    """Stored analysis for a website's domain (with its version, age and freshness)"""
+    intel = get_intel(url)
+    if intel is None:
+        raise HTTPException(status_code=404, detail="No intelligence stored for this domain")
+    return intel
+
+
+@app.post("/intelligence/refresh")
+async def refresh_company_intelligence(data: dict = Body(...)):
+    """
+    Re-scrape and re-analyze a website now, replacing its stored intelligence.
+    Body: {"url", "company_name"?, "fused"?, "crawl"?}
+    """
+    url = data.get('url')
+    if not url:
+        raise HTTPException(status_code=400, detail="url is required")
+    normalized_url = normalize_url(url)
+    company_name = data.get('company_name') or derive_company_name(normalized_url)
+    *_, meta = await analyze_prospect(normalized_url, company_name, data.get('fused'), data.get('crawl'), refresh=True)
+    intel = get_intel(normalized_url)
+    return {'success': meta['version'] is not None, 'refresh': meta, 'intelligence': intel}
+
 # ============================================================================
 # DOCUMENT OCR ROUTES
 # ============================================================================
@@ -1520,7 +1636,7 @@ async def ocr_document(file: UploadFile = File(...), session: Session = Depends(
     """Upload an image and extract details using OCR"""
     try:
         contents = await file.read()
-        result = analyze_document(contents)
+        result = await analyze_document(contents)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,373 @@
+"""
+Asyncio SMTP transport: sends without holding a thread per in-flight message.
+
+A small SMTP client on asyncio transports (no extra dependency), with the same
+connection behavior as the smtplib path (modules/smtp_pool.py): implicit SSL on port
+465, STARTTLS otherwise, then AUTH PLAIN/LOGIN.
+- when the server advertises PIPELINING (RFC 2920), MAIL FROM and every RCPT TO of a
+  message are written at once and their replies read afterwards: one round trip
+  instead of one per recipient (each email carries the default CCs)
+- connections are pooled per (server, port, user) like the smtplib sessions, and at
+  most SMTP_ASYNC_CONNECTIONS are open per key: any number of concurrent sends share
+  them, waiting on a semaphore instead of a thread
+- errors are raised as the smtplib exceptions (and a reply timeout as socket.timeout),
+  so callers handle both transports alike
+- a reused connection found dropped is replaced and the message sent again, but only
+  if the drop came before the message body was written: after that the server may
+  already have accepted it, and a retry would deliver it twice
+
+Enable with SMTP_ASYNC_ENABLED=true; tests/test_async_smtp.py runs it against a local
+aiosmtpd server (pip install -r requirements-dev.txt).
+
+aiosmtplib was considered, but its protocol reads one reply per command and cannot
+pipeline; this client needs nothing beyond the standard library (Python 3.7+).
+"""
+import os
+import re
+import ssl
+import time
+import base64
+import socket
+import asyncio
+import smtplib
+from collections import deque
+
+from modules.smtp_pool import (
+    SMTP_SESSION_MAX_MESSAGES,
+    SMTP_SESSION_MAX_AGE_SECONDS,
+    SMTP_IDLE_TIMEOUT_SECONDS,
+    SMTP_NOOP_AFTER_SECONDS,
+    SMTP_TIMEOUT,
+    SMTP_POOL_MAX_IDLE,
+    _secret_digest,
+)
+
+# Opt-in until it has run against production servers (tests/test_async_smtp.py covers a local one)
+SMTP_ASYNC_ENABLED = os.getenv("SMTP_ASYNC_ENABLED", "false").lower() == "true"
+SMTP_ASYNC_CONNECTIONS = int(os.getenv("SMTP_ASYNC_CONNECTIONS", 4))  # open connections per (server, port, user)
+
+_local_hostname = None
+
+
+async def _get_local_hostname():
+    """EHLO name, resolved like smtplib does (once, off the event loop)"""
+    global _local_hostname
+    if _local_hostname is None:
+        fqdn = await asyncio.get_running_loop().run_in_executor(None, socket.getfqdn)
+        _local_hostname = fqdn if '.' in fqdn else '[127.0.0.1]'
+    return _local_hostname
+
+
+def _encode_message(message):
+    """CRLF line endings and dot-stuffing, as smtplib.SMTP.data does"""
+    if isinstance(message, str):
+        message = re.sub(r'(?:\r\n|\n|\r(?!\n))', "\r\n", message).encode('ascii')
+    else:
+        message = re.sub(br'(?:\r\n|\n|\r(?!\n))', b"\r\n", message)
+    message = re.sub(br'(?m)^\.', b'..', message)
+    if not message.endswith(b"\r\n"):
+        message += b"\r\n"
+    return message + b".\r\n"
+
+
+class _SMTPProtocol(asyncio.Protocol):
+    """Splits the byte stream into replies; replies queue up, so pipelined commands can be read in order"""
+
+    def __init__(self):
+        self.transport = None
+        self._buffer = bytearray()
+        self._lines = []
+        self._replies = deque()
+        self._waiter = None
+        self._closed = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self._buffer.extend(data)
+        while True:
+            end = self._buffer.find(b"\n")
+            if end < 0:
+                break
+            line = bytes(self._buffer[:end + 1])
+            del self._buffer[:end + 1]
+            self._lines.append(line)
+            if line[3:4] != b"-":
+                try:
+                    code = int(line[:3])
+                except ValueError:
+                    code = -1
+                text = b"\n".join(l[4:].strip() for l in self._lines)
+                self._lines = []
+                self._replies.append((code, text))
+        self._wake()
+
+    def connection_lost(self, exc):
+        self._closed = True
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def write(self, data):
+        if self._closed or self.transport is None or self.transport.is_closing():
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.transport.write(data)
+
+    async def read_reply(self, timeout=SMTP_TIMEOUT):
+        while not self._replies:
+            if self._closed:
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                # Not a disconnect: the server may still act on what it was sent
+                raise socket.timeout("Timed out waiting for the server reply")
+        return self._replies.popleft()
+
+
+class AsyncSMTPConnection:
+    def __init__(self, host, port, timeout=SMTP_TIMEOUT):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.protocol = None
+        self.extensions = {}
+        self.data_sent = False  # the current message's body was written to the server
+
+    async def connect(self, user, password):
+        loop = asyncio.get_running_loop()
+        context = ssl.create_default_context()
+        implicit_tls = self.port == 465
+        _, self.protocol = await asyncio.wait_for(
+            loop.create_connection(
+                _SMTPProtocol, self.host, self.port,
+                ssl=context if implicit_tls else None,
+                server_hostname=self.host if implicit_tls else None,
+            ),
+            self.timeout,
+        )
+        try:
+            code, text = await self.protocol.read_reply(self.timeout)
+            if code != 220:
+                raise smtplib.SMTPConnectError(code, text)
+            await self.ehlo()
+            if not implicit_tls:
+                if 'starttls' not in self.extensions:
+                    raise smtplib.SMTPNotSupportedError("STARTTLS extension not supported by server.")
+                code, text = await self.command(b"STARTTLS")
+                if code != 220:
+                    raise smtplib.SMTPResponseException(code, text)
+                transport = await asyncio.wait_for(
+                    loop.start_tls(self.protocol.transport, self.protocol, context, server_hostname=self.host),
+                    self.timeout,
+                )
+                self.protocol.transport = transport
+                await self.ehlo()
+            await self.login(user, password)
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    async def command(self, *parts):
+        self.protocol.write(b" ".join(parts) + b"\r\n")
+        return await self.protocol.read_reply(self.timeout)
+
+    async def ehlo(self):
+        code, text = await self.command(b"EHLO", (await _get_local_hostname()).encode('ascii'))
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, text)
+        self.extensions = {}
+        for line in text.decode('utf-8', 'replace').split("\n")[1:]:
+            keyword, _, params = line.strip().partition(" ")
+            self.extensions[keyword.lower()] = params.upper()
+
+    async def login(self, user, password):
+        mechanisms = self.extensions.get('auth', '').split()
+        if 'PLAIN' in mechanisms or 'LOGIN' not in mechanisms:
+            token = base64.b64encode(f"\0{user}\0{password}".encode('utf-8'))
+            code, text = await self.command(b"AUTH PLAIN", token)
+        else:
+            code, text = await self.command(b"AUTH LOGIN", base64.b64encode(user.encode('utf-8')))
+            if code == 334:
+                code, text = await self.command(base64.b64encode(password.encode('utf-8')))
+        # 503 is "already authenticated": treated as success, as smtplib.SMTP.login does
+        if code not in (235, 503):
+            raise smtplib.SMTPAuthenticationError(code, text)
+
+    async def noop(self):
+        code, _ = await self.command(b"NOOP")
+        return code
+
+    async def sendmail(self, sender, recipients, message):
+        """
+        One mail transaction. Returns the refused recipients ({address: (code, text)});
+        raises SMTPRecipientsRefused if all of them were refused.
+        """
+        self.data_sent = False
+        envelope = [b"MAIL FROM:" + smtplib.quoteaddr(sender).encode('ascii')]
+        envelope += [b"RCPT TO:" + smtplib.quoteaddr(r).encode('ascii') for r in recipients]
+        if 'pipelining' in self.extensions:
+            self.protocol.write(b"".join(line + b"\r\n" for line in envelope))
+            replies = [await self.protocol.read_reply(self.timeout) for _ in envelope]
+        else:
+            replies = [await self.command(line) for line in envelope]
+
+        code, text = replies[0]
+        if code != 250:
+            await self._rset()
+            raise smtplib.SMTPSenderRefused(code, text, sender)
+        refused = {r: reply for r, reply in zip(recipients, replies[1:]) if reply[0] not in (250, 251)}
+        if len(refused) == len(recipients):
+            await self._rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        code, text = await self.command(b"DATA")
+        if code != 354:
+            await self._rset()
+            raise smtplib.SMTPDataError(code, text)
+        self.data_sent = True
+        self.protocol.write(_encode_message(message))
+        code, text = await self.protocol.read_reply(self.timeout)
+        if code != 250:
+            raise smtplib.SMTPDataError(code, text)
+        return refused
+
+    async def _rset(self):
+        try:
+            await self.command(b"RSET")
+        except smtplib.SMTPServerDisconnected:
+            pass
+
+    async def quit(self):
+        try:
+            await self.command(b"QUIT")
+        except Exception:
+            pass
+        self.close()
+
+    def close(self):
+        if self.protocol is not None and self.protocol.transport is not None:
+            self.protocol.transport.close()
+
+
+class _AsyncSession:
+    def __init__(self, key, connection, secret):
+        self.key = key
+        self.connection = connection
+        self.secret = secret
+        self.messages = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.reused = False
+
+
+class AsyncSMTPPool:
+    def __init__(self, connections=SMTP_ASYNC_CONNECTIONS, max_idle=SMTP_POOL_MAX_IDLE):
+        self.connections = connections
+        self.max_idle = max(max_idle, connections)
+        self._idle = {}  # (server, port, user) -> deque of idle _AsyncSession
+        self._slots = {}  # (server, port, user) -> Semaphore bounding open connections
+        self.stats = {"connects": 0, "reuses": 0, "noop_failures": 0, "retired": 0, "reconnects": 0, "sends": 0, "pipelined": 0}
+
+    async def _usable(self, session, secret):
+        now = time.monotonic()
+        if session.secret != secret:
+            return False
+        if now - session.created_at > SMTP_SESSION_MAX_AGE_SECONDS or now - session.last_used > SMTP_IDLE_TIMEOUT_SECONDS:
+            self.stats["retired"] += 1
+            return False
+        if now - session.last_used > SMTP_NOOP_AFTER_SECONDS:
+            try:
+                code = await session.connection.noop()
+            except Exception:
+                code = None
+            if code != 250:
+                self.stats["noop_failures"] += 1
+                return False
+        return True
+
+    async def _acquire(self, key, password):
+        """A healthy session for the key; the caller holds one of the key's connection slots"""
+        secret = _secret_digest(password)
+        idle = self._idle.get(key)
+        while idle:
+            session = idle.pop()
+            if await self._usable(session, secret):
+                session.reused = True
+                self.stats["reuses"] += 1
+                return session
+            await session.connection.quit()
+        server, port, user = key
+        print(f"Connecting to {server}:{port} (async)...")
+        connection = await AsyncSMTPConnection(server, port).connect(user, password)
+        self.stats["connects"] += 1
+        return _AsyncSession(key, connection, secret)
+
+    async def _release(self, session, healthy=True):
+        session.last_used = time.monotonic()
+        if healthy and session.messages < SMTP_SESSION_MAX_MESSAGES:
+            idle = self._idle.setdefault(session.key, deque())
+            if len(idle) < self.max_idle:
+                idle.append(session)
+                return
+        if session.messages >= SMTP_SESSION_MAX_MESSAGES:
+            self.stats["retired"] += 1
+        await session.connection.quit()
+
+    async def sendmail(self, smtp_server, smtp_port, sender_email, sender_password, recipients, message):
+        """
+        Sends one message over a pooled connection (waiting for a free one if all are busy).
+        A reused connection that was dropped by the server before the message body was
+        written is replaced and the message sent once more on a fresh connection. Reply
+        timeouts and drops after the body are raised, never retried here.
+        """
+        key = (smtp_server, int(smtp_port), sender_email)
+        slots = self._slots.setdefault(key, asyncio.Semaphore(self.connections))
+        async with slots:
+            while True:
+                session = await self._acquire(key, sender_password)
+                try:
+                    refused = await session.connection.sendmail(sender_email, recipients, message)
+                except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                    await self._release(session, healthy=False)
+                    if not session.reused or session.connection.data_sent:
+                        raise
+                    print(f"Pooled SMTP connection to {smtp_server} was dropped ({e}); reconnecting")
+                    self.stats["reconnects"] += 1
+                    continue
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused):
+                    # The transaction was reset: the connection stays usable
+                    session.messages += 1
+                    await self._release(session)
+                    raise
+                except BaseException:
+                    await self._release(session, healthy=False)
+                    raise
+                session.messages += 1
+                self.stats["sends"] += 1
+                if 'pipelining' in session.connection.extensions:
+                    self.stats["pipelined"] += 1
+                await self._release(session)
+                return refused
+
+    async def close_all(self):
+        """Closes every idle connection (called on app shutdown)"""
+        sessions = [s for idle in self._idle.values() for s in idle]
+        self._idle.clear()
+        await asyncio.gather(*(s.connection.quit() for s in sessions), return_exceptions=True)
+
+    def snapshot(self):
+        return {
+            **self.stats,
+            "enabled": SMTP_ASYNC_ENABLED,
+            "idle_connections": sum(len(q) for q in self._idle.values()),
+            "max_connections_per_account": self.connections,
+        }
+
+
+async_smtp_pool = AsyncSMTPPool()
@@ -0,0 +1,534 @@
+"""
+Offline bulk mode: lead analysis and email drafting through the OpenAI Batch API.
+
+A bulk run is a LeadBatch row plus one LeadBatchItem per prospect, processed in two
+Batch API rounds:
+
+1. analyzing - every site is scraped, then one JSONL request per prospect (the fused
+   company/market/service analysis, or the name-only fallback when scraping failed)
+   is uploaded and submitted as one batch.
+2. drafting  - once the analysis batch completes, the outreach and inbound email
+   requests for every prospect are submitted as a second batch.
+
+When the drafts are back, each prospect is written to Company and ClientProfile.
+Batch pricing is about half the interactive price, at the cost of up to 24h latency.
+The phase and the OpenAI batch id are stored after every step, so a restarted
+process resumes polling instead of resubmitting. OPENAI_BATCH_BASE_URL points the
+files/batches calls at a local stand-in endpoint for testing.
+"""
+import os
+import json
+import asyncio
+import traceback
+from datetime import datetime
+
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, select, func
+
+from database import engine, LeadBatch, LeadBatchItem, Company, ClientProfile
+from modules.openai_client import get_batch_client, DEFAULT_MODEL
+from modules.fused_analyzer import build_fused_messages, fused_response_format, split_fused_result, fused_error_result
+from modules.fallback_analyzer import build_fallback_messages, complete_fallback_result, fallback_error_result
+from modules.serp_hawk_email import build_serp_hawk_email_messages, format_serp_hawk_email, serp_hawk_email_error
+from modules.lead_pipeline import scrape_site, local_contacts_for, derive_company_name, build_fallback_analysis
+from modules.company_intel import save_intel
+
+# Seconds between Batch API status checks
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", 60))
+# Sites scraped at the same time while preparing the analysis batch
+BATCH_SCRAPE_CONCURRENCY = int(os.getenv("BATCH_SCRAPE_CONCURRENCY", 10))
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+REMOTE_FAILED_STATUSES = ("failed", "expired", "cancelled")
+DRAFT_TYPES = ("outreach", "inbound")
+
+
+# ============================================================================
+# Batch API requests / results
+# ============================================================================
+
+def batch_request(custom_id, messages, response_format=None, model=DEFAULT_MODEL):
+    """One JSONL line of a chat-completions batch"""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": model,
+            "messages": messages,
+            "response_format": response_format or {"type": "json_object"},
+        },
+    }
+
+
+def parse_batch_output(record):
+    """
+    (parsed JSON content, None) for a successful output line, (None, error message) otherwise.
+    """
+    if record is None:
+        return None, "No result returned by the batch"
+    response = record.get("response") or {}
+    if record.get("error") or response.get("status_code") != 200:
+        error = record.get("error") or (response.get("body") or {}).get("error") or response.get("status_code")
+        return None, f"Batch request failed: {error}"
+    try:
+        content = response["body"]["choices"][0]["message"]["content"]
+        return json.loads(content), None
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        return None, f"Unreadable batch output: {e}"
+
+
+async def submit_requests(requests, batch_id, phase):
+    """Uploads the requests as a JSONL file and starts a Batch API job; returns its id"""
+    client = get_batch_client()
+    jsonl = "\n".join(json.dumps(r) for r in requests).encode("utf-8")
+    upload = await client.files.create(file=(f"lead-batch-{batch_id}-{phase}.jsonl", jsonl), purpose="batch")
+    remote = await client.batches.create(
+        input_file_id=upload.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW,
+        metadata={"lead_batch": str(batch_id), "phase": phase},
+    )
+    print(f"Lead batch {batch_id}: submitted {len(requests)} {phase} requests as {remote.id}")
+    return remote.id
+
+
+async def wait_for_batch(openai_batch_id, batch_id):
+    """
+    Polls the Batch API job until it finishes and returns {custom_id: output line}.
+    Returns None if the lead batch was cancelled meanwhile (the remote job is cancelled too).
+    """
+    client = get_batch_client()
+    while True:
+        remote = await client.batches.retrieve(openai_batch_id)
+        if remote.status == "completed":
+            break
+        if remote.status in REMOTE_FAILED_STATUSES:
+            raise RuntimeError(f"OpenAI batch {openai_batch_id} {remote.status}")
+        batch = await run_in_threadpool(_load_batch, batch_id)
+        if batch is None or batch.status == "cancelled":
+            try:
+                await client.batches.cancel(openai_batch_id)
+            except Exception as e:
+                print(f"Could not cancel OpenAI batch {openai_batch_id}: {e}")
+            return None
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+
+    outputs = {}
+    for file_id in (remote.output_file_id, remote.error_file_id):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for line in content.text.splitlines():
+            if line.strip():
+                record = json.loads(line)
+                outputs[record.get("custom_id")] = record
+    return outputs
+
+
+# ============================================================================
+# DB helpers (sync, run in the threadpool)
+# ============================================================================
+
+def create_batch(items, options=None):
+    """
+    Persists a new bulk run. `items` are dicts with 'url', 'company_name', 'primary_email'
+    and optionally 'status'/'error' (e.g. pre-skipped leads). Returns the batch id.
+    """
+    with Session(engine) as session:
+        batch = LeadBatch(options=options or {}, total=len(items))
+        session.add(batch)
+        session.flush()
+        for position, item in enumerate(items):
+            session.add(LeadBatchItem(
+                batch_id=batch.id,
+                position=position,
+                url=item['url'],
+                company_name=item.get('company_name'),
+                primary_email=item.get('primary_email'),
+                status=item.get('status', 'pending'),
+                error=item.get('error')
+            ))
+        session.commit()
+        return batch.id
+
+
+def _load_batch(batch_id):
+    with Session(engine) as session:
+        return session.get(LeadBatch, batch_id)
+
+
+def _items(batch_id, status):
+    with Session(engine) as session:
+        return session.exec(
+            select(LeadBatchItem)
+            .where(LeadBatchItem.batch_id == batch_id, LeadBatchItem.status == status)
+            .order_by(LeadBatchItem.position)
+        ).all()
+
+
+def _set_batch_status(batch_id, status, openai_batch_id=None, error=None):
+    with Session(engine) as session:
+        batch = session.get(LeadBatch, batch_id)
+        if not batch:
+            return None
+        # A cancelled batch stays cancelled
+        if batch.status == 'cancelled' and status != 'cancelled':
+            return batch.status
+        batch.status = status
+        batch.updated_at = datetime.utcnow()
+        if openai_batch_id:
+            batch.openai_batch_id = openai_batch_id
+        if status in FINISHED_STATUSES:
+            batch.finished_at = datetime.utcnow()
+        if error:
+            batch.error = error
+        session.add(batch)
+        session.commit()
+        return batch.status
+
+
+def _save_items(updates):
+    """updates: [(item_id, {field: value})]"""
+    with Session(engine) as session:
+        for item_id, fields in updates:
+            item = session.get(LeadBatchItem, item_id)
+            for key, value in fields.items():
+                setattr(item, key, value)
+            item.updated_at = datetime.utcnow()
+            session.add(item)
+        session.commit()
+
+
+def _item_counts(session, batch_id):
+    rows = session.exec(
+        select(LeadBatchItem.status, func.count(LeadBatchItem.id))
+        .where(LeadBatchItem.batch_id == batch_id)
+        .group_by(LeadBatchItem.status)
+    ).all()
+    return {status: count for status, count in rows}
+
+
+def _batch_to_dict(batch, counts):
+    return {
+        'batch_id': str(batch.id),
+        'status': batch.status,
+        'openai_batch_id': batch.openai_batch_id,
+        'total': batch.total,
+        'counts': counts,
+        'options': batch.options or {},
+        'error': batch.error,
+        'created_at': batch.created_at.isoformat() if batch.created_at else None,
+        'updated_at': batch.updated_at.isoformat() if batch.updated_at else None,
+        'finished_at': batch.finished_at.isoformat() if batch.finished_at else None,
+    }
+
+
+def get_batch(batch_id, include_results=True, offset=0, limit=100):
+    """Bulk run status with item counts and (optionally) a page of finished item results"""
+    with Session(engine) as session:
+        batch = session.get(LeadBatch, batch_id)
+        if not batch:
+            return None
+        data = _batch_to_dict(batch, _item_counts(session, batch.id))
+        if include_results:
+            items = session.exec(
+                select(LeadBatchItem)
+                .where(LeadBatchItem.batch_id == batch.id, LeadBatchItem.status.in_(['done', 'failed', 'skipped']))
+                .order_by(LeadBatchItem.position)
+                .offset(offset)
+                .limit(limit)
+            ).all()
+            data['results'] = [
+                {'index': i.position, 'url': i.url, 'status': i.status, 'result': i.result, 'error': i.error}
+                for i in items
+            ]
+        return data
+
+
+def list_batches(limit=20):
+    with Session(engine) as session:
+        batches = session.exec(select(LeadBatch).order_by(LeadBatch.created_at.desc()).limit(limit)).all()
+        return [_batch_to_dict(batch, _item_counts(session, batch.id)) for batch in batches]
+
+
+def _unfinished_batch_ids():
+    with Session(engine) as session:
+        batches = session.exec(
+            select(LeadBatch).where(LeadBatch.status.in_(['queued', 'analyzing', 'drafting'])).order_by(LeadBatch.created_at)
+        ).all()
+        return [batch.id for batch in batches]
+
+
+def _primary_contact(item, company_info):
+    """Same choice as /draft-lead: first analyzed contact with an email, else the given address"""
+    company_name = item.company_name or company_info.get('company_name') or derive_company_name(item.url)
+    email = next(
+        (c['email'] for c in company_info.get('contacts') or [] if c.get('email') and '@' in c['email']),
+        item.primary_email or ''
+    )
+    return {'name': company_name, 'email': email, 'role': 'Decision Maker'}
+
+
+def store_lead(item_id):
+    """
+    Writes a finished item to Company and ClientProfile (upserted by website URL),
+    and its analysis to the company intelligence store
+    """
+    with Session(engine) as session:
+        item = session.get(LeadBatchItem, item_id)
+        result = item.result or {}
+        services = result.get('recommended_services')
+        analysis = item.analysis or {}
+        url = item.url
+
+        company = session.exec(select(Company).where(Company.website_url == item.url)).first()
+        if company is None:
+            company = Company(
+                company_name=result.get('company_name') or item.url,
+                website_url=item.url,
+                primary_email=result.get('primary_email') or '',
+                recommended_services=services
+            )
+        else:
+            if services:
+                company.recommended_services = services
+            if not company.primary_email and result.get('primary_email'):
+                company.primary_email = result['primary_email']
+        session.add(company)
+
+        profile = session.exec(select(ClientProfile).where(ClientProfile.websiteUrl == item.url)).first()
+        if profile is None:
+            profile = ClientProfile(
+                companyName=result.get('company_name'),
+                websiteUrl=item.url,
+                status="Pending",
+            )
+        if services:
+            profile.recommended_services = services
+            profile.services_offered = services
+        profile.customFields = {
+            **(profile.customFields or {}),
+            'batch_drafts': {draft_type: result.get(draft_type) for draft_type in DRAFT_TYPES},
+        }
+        session.add(profile)
+        session.commit()
+
+    save_intel(
+        url, result.get('company_name'),
+        analysis.get('company_info'), analysis.get('market_analysis'), analysis.get('service_matches'),
+        'fallback' if analysis.get('mode') == 'fallback' else 'batch'
+    )
+
+
+# ============================================================================
+# Phases
+# ============================================================================
+
+async def prepare_analysis(batch_id, options):
+    """Scrapes every pending prospect and builds its analysis request"""
+    semaphore = asyncio.Semaphore(BATCH_SCRAPE_CONCURRENCY)
+    items = await run_in_threadpool(_items, batch_id, 'pending')
+
+    async def prepare(item):
+        company_name = item.company_name or derive_company_name(item.url)
+        async with semaphore:
+            try:
+                scraped = await scrape_site(item.url, options.get('crawl'))
+            except Exception as e:
+                scraped = {'content': f"ERROR SCRAPING: {e}"}
+        content = scraped.get('content') or ''
+        if content and not content.startswith("ERROR SCRAPING"):
+            contacts = local_contacts_for(scraped)
+            include_contacts = contacts is None
+            meta = {'mode': 'fused', 'contacts': contacts}
+            request = batch_request(
+                f"{item.id}:analysis",
+                build_fused_messages(content, company_name, include_contacts),
+                fused_response_format(include_contacts)
+            )
+        else:
+            meta = {'mode': 'fallback', 'scrape_error': content or 'ERROR SCRAPING: empty page'}
+            request = batch_request(f"{item.id}:analysis", build_fallback_messages(company_name))
+        return item.id, meta, request
+
+    prepared = await asyncio.gather(*(prepare(item) for item in items))
+    await run_in_threadpool(_save_items, [(item_id, {'analysis': meta}) for item_id, meta, _ in prepared])
+    return [request for _, _, request in prepared]
+
+
+def apply_analysis(item, record):
+    """(item_id, fields) for an item once its analysis output is back"""
+    meta = item.analysis or {}
+    company_name = item.company_name or derive_company_name(item.url)
+    result, error = parse_batch_output(record)
+
+    if meta.get('mode') == 'fallback':
+        if result is not None:
+            company_info = complete_fallback_result(result, company_name)
+        else:
+            company_info = fallback_error_result(company_name, error)
+        company_name = company_info.get('company_name', company_name)
+        market_analysis, service_matches = build_fallback_analysis(company_info, company_name)
+    elif result is not None:
+        company_info, market_analysis, service_matches = split_fused_result(result, company_name)
+        if meta.get('contacts') is not None:
+            company_info['contacts'] = meta['contacts']
+    else:
+        company_info, market_analysis, service_matches = fused_error_result(company_name, error, meta.get('contacts'))
+
+    analysis = {
+        **meta,
+        'company_info': company_info,
+        'market_analysis': market_analysis,
+        'service_matches': service_matches,
+        'contact': _primary_contact(item, company_info),
+    }
+    return item.id, {'analysis': analysis, 'status': 'analyzed', 'error': error}
+
+
+def draft_requests(item):
+    analysis = item.analysis
+    return [
+        batch_request(
+            f"{item.id}:{draft_type}",
+            build_serp_hawk_email_messages(
+                analysis['company_info'], analysis['market_analysis'], analysis['service_matches'],
+                analysis['contact'], draft_type
+            )
+        )
+        for draft_type in DRAFT_TYPES
+    ]
+
+
+def apply_drafts(item, outputs):
+    """(item_id, fields) for an item once its draft outputs are back"""
+    analysis = item.analysis
+    company_info = analysis['company_info']
+    company_name = company_info.get('company_name', 'your company')
+    drafts = {}
+    for draft_type in DRAFT_TYPES:
+        result, error = parse_batch_output(outputs.get(f"{item.id}:{draft_type}"))
+        drafts[draft_type] = format_serp_hawk_email(result, company_name) if result is not None else serp_hawk_email_error(company_name, error)
+
+    services = analysis['service_matches'].get('recommended_services', [])
+    service_names = [s.get('service_name') for s in services if s.get('service_name')]
+    result = {
+        'company_name': item.company_name or company_name,
+        'website_url': item.url,
+        'primary_email': analysis['contact'].get('email', ''),
+        'what_they_do': company_info.get('what_they_do') or company_info.get('summary'),
+        'contacts': company_info.get('contacts', []),
+        'recommended_services': ", ".join(service_names) if service_names else None,
+        **drafts,
+    }
+    return item.id, {'result': result, 'status': 'done'}
+
+
+# ============================================================================
+# Runner
+# ============================================================================
+
+class BatchRunner:
+    """
+    Drives bulk runs through their phases as background tasks; resumes them on startup.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def start(self):
+        try:
+            batch_ids = await run_in_threadpool(_unfinished_batch_ids)
+        except Exception as e:
+            print(f"Lead batch resume note: {e}")
+            batch_ids = []
+        for batch_id in batch_ids:
+            print(f"Resuming lead batch {batch_id}")
+            self._spawn(batch_id)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = {}
+
+    async def submit(self, items, options=None):
+        """Persists a bulk run and starts it; returns the batch id"""
+        batch_id = await run_in_threadpool(create_batch, items, options)
+        self._spawn(batch_id)
+        return batch_id
+
+    async def cancel(self, batch_id):
+        """Cancels a bulk run and its in-progress OpenAI batch"""
+        batch = await run_in_threadpool(_load_batch, batch_id)
+        if batch is None or batch.status in FINISHED_STATUSES:
+            return batch.status if batch else None
+        status = await run_in_threadpool(_set_batch_status, batch_id, 'cancelled')
+        if batch.openai_batch_id:
+            try:
+                await get_batch_client().batches.cancel(batch.openai_batch_id)
+            except Exception as e:
+                print(f"Could not cancel OpenAI batch {batch.openai_batch_id}: {e}")
+        return status
+
+    def _spawn(self, batch_id):
+        task = asyncio.create_task(self._run(batch_id))
+        self._tasks[batch_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(batch_id, None))
+
+    async def _run(self, batch_id):
+        try:
+            batch = await run_in_threadpool(_load_batch, batch_id)
+            if batch is None or batch.status in FINISHED_STATUSES:
+                return
+            options = batch.options or {}
+
+            if batch.status == 'queued':
+                requests = await prepare_analysis(batch_id, options)
+                openai_batch_id = await submit_requests(requests, batch_id, 'analysis') if requests else None
+                if await run_in_threadpool(_set_batch_status, batch_id, 'analyzing', openai_batch_id) == 'cancelled':
+                    return
+                batch = await run_in_threadpool(_load_batch, batch_id)
+
+            if batch.status == 'analyzing':
+                pending = await run_in_threadpool(_items, batch_id, 'pending')
+                if pending:
+                    outputs = await wait_for_batch(batch.openai_batch_id, batch_id)
+                    if outputs is None:
+                        return
+                    updates = [apply_analysis(item, outputs.get(f"{item.id}:analysis")) for item in pending]
+                    await run_in_threadpool(_save_items, updates)
+                analyzed = await run_in_threadpool(_items, batch_id, 'analyzed')
+                requests = [request for item in analyzed for request in draft_requests(item)]
+                openai_batch_id = await submit_requests(requests, batch_id, 'drafts') if requests else None
+                if await run_in_threadpool(_set_batch_status, batch_id, 'drafting', openai_batch_id) == 'cancelled':
+                    return
+                batch = await run_in_threadpool(_load_batch, batch_id)
+
+            if batch.status == 'drafting':
+                analyzed = await run_in_threadpool(_items, batch_id, 'analyzed')
+                if analyzed:
+                    outputs = await wait_for_batch(batch.openai_batch_id, batch_id)
+                    if outputs is None:
+                        return
+                    for item in analyzed:
+                        item_id, fields = apply_drafts(item, outputs)
+                        await run_in_threadpool(_save_items, [(item_id, fields)])
+                        try:
+                            await run_in_threadpool(store_lead, item_id)
+                        except Exception as e:
+                            traceback.print_exc()
+                            await run_in_threadpool(_save_items, [(item_id, {'status': 'failed', 'error': f"Could not save lead: {e}"})])
+                await run_in_threadpool(_set_batch_status, batch_id, 'completed')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            await run_in_threadpool(_set_batch_status, batch_id, 'failed', None, str(e))
+
+
+batch_runner = BatchRunner()
@@ -0,0 +1,484 @@
+"""
+Bulk send campaigns: a list of prepared drafts, paced out through the outbox.
+
+A campaign is a Campaign row plus one CampaignRecipient per email. Instead of the client
+retrying /send until the hourly limit lets it through, the runner releases recipients
+into the outbox at the rate the sender mailboxes allow:
+
+- each healthy sender of the pool (modules/sender_pool.py) has a token bucket refilled at
+  its hourly limit (or its daily limit, if that is the tighter pace) with a burst of
+  CAMPAIGN_BURST, so a long campaign fills the quota evenly rather than in one burst
+- a token is only spent once the sender's sliding-window limiter (modules/send_limiter.py)
+  also grants the slot, so campaigns share the quota with /send and /send-lead
+- recipients already contacted (Company.email_sent_status, by email or website) are skipped
+  when the campaign is created and again right before queueing
+- campaigns are served oldest first; the state is in the database, so a restart resumes
+
+Once queued, a recipient's delivery (sent / failed after retries) is its outbox message's.
+"""
+import os
+import math
+import time
+import uuid
+import asyncio
+import traceback
+from datetime import datetime
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_
+from sqlmodel import Session, select, func
+
+from database import engine, Campaign, CampaignRecipient, OutboxMessage, Company, EmailLog, SentEmail, ClientProfile, User
+from modules.outbox import outbox, queue_email
+from modules.send_limiter import send_limiter
+from modules.sender_pool import sender_pool
+
+# Emails a sender may send back to back before the steady pace applies
+CAMPAIGN_BURST = float(os.getenv("CAMPAIGN_BURST", 1))
+# Longest wait between pacing rounds (new campaigns and freed quota wake the runner sooner)
+CAMPAIGN_TICK_SECONDS = float(os.getenv("CAMPAIGN_TICK_SECONDS", 5))
+
+ACTIVE_STATUSES = ('queued', 'sending')
+FINISHED_STATUSES = ('completed', 'cancelled')
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=CAMPAIGN_BURST):
+        self.rate = rate  # tokens per second
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        self._refill()
+        return self.tokens
+
+    def peek(self):
+        """Tokens available now, without updating the bucket (safe from other threads)"""
+        return min(self.capacity, self.tokens + (time.monotonic() - self.updated) * self.rate)
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def seconds_until_token(self):
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+
+def sender_rate(sender):
+    """Steady emails per second for a sender: its hourly limit, or its daily limit if tighter"""
+    rate = sender.hourly_limit / 3600
+    if sender.daily_limit:
+        rate = min(rate, sender.daily_limit / 86400)
+    return rate
+
+
+# ============================================================================
+# DB helpers (sync, run in the threadpool)
+# ============================================================================
+
+def _contacted_company(session, to_email, website_url=None):
+    """The Company already emailed at this address or website, if any"""
+    conditions = [Company.primary_email == to_email]
+    if website_url:
+        conditions.append(Company.website_url == website_url)
+    return session.exec(
+        select(Company).where(Company.email_sent_status == True, or_(*conditions))  # noqa: E712
+    ).first()
+
+
+def create_campaign(recipients, name=None, options=None):
+    """
+    Persists a campaign. `recipients` are dicts with 'to_email', 'subject', 'body' and
+    optionally 'company_name', 'website_url' (normalized), 'spanish_body'. Recipients
+    already contacted, or listed twice, are recorded as skipped. Returns (id, skipped).
+    """
+    skipped = 0
+    with Session(engine) as session:
+        campaign = Campaign(name=name, options=options or {}, total=len(recipients))
+        session.add(campaign)
+        session.flush()
+        seen = set()
+        for position, recipient in enumerate(recipients):
+            to_email = recipient['to_email']
+            status, error = 'pending', None
+            if to_email.lower() in seen:
+                status, error = 'skipped', "Duplicate recipient in this campaign"
+            else:
+                existing = _contacted_company(session, to_email, recipient.get('website_url'))
+                if existing:
+                    status, error = 'skipped', f"Prospecting email already sent to {existing.company_name}"
+            seen.add(to_email.lower())
+            skipped += status == 'skipped'
+            session.add(CampaignRecipient(
+                campaign_id=campaign.id,
+                position=position,
+                to_email=to_email,
+                company_name=recipient.get('company_name'),
+                website_url=recipient.get('website_url'),
+                subject=recipient['subject'],
+                body=recipient['body'],
+                spanish_body=recipient.get('spanish_body'),
+                status=status,
+                error=error,
+            ))
+        session.commit()
+        return campaign.id, skipped
+
+
+def _active_campaign_ids():
+    with Session(engine) as session:
+        campaigns = session.exec(
+            select(Campaign).where(Campaign.status.in_(ACTIVE_STATUSES)).order_by(Campaign.created_at)
+        ).all()
+        return [campaign.id for campaign in campaigns]
+
+
+def _reserve_and_queue(campaign_ids, sender):
+    """
+    Takes a send slot for `sender` and queues the next recipient with it, giving the slot
+    back if nothing was queued. Returns _queue_next's outcome, or 'limited' if the sender
+    has no quota left.
+    """
+    if not send_limiter.try_reserve(sender.email):
+        return 'limited'
+    outcome = _queue_next(campaign_ids, sender)
+    if outcome != 'queued':
+        send_limiter.release(sender.email)
+    return outcome
+
+
+def _queue_next(campaign_ids, sender):
+    """
+    Queues the next pending recipient (oldest campaign first) in the outbox with `sender`,
+    recording it like /send does. Returns 'queued', 'skipped', 'failed', or None if no
+    recipient is pending.
+    """
+    with Session(engine) as session:
+        for campaign_id in campaign_ids:
+            recipient = session.exec(
+                select(CampaignRecipient)
+                .where(CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.status == 'pending')
+                .order_by(CampaignRecipient.position)
+                .limit(1)
+            ).first()
+            if recipient is not None:
+                break
+        else:
+            return None
+        campaign = session.get(Campaign, recipient.campaign_id)
+        options = campaign.options or {}
+
+        try:
+            existing = _contacted_company(session, recipient.to_email, recipient.website_url)
+            if existing:
+                recipient.status = 'skipped'
+                recipient.error = f"Prospecting email already sent to {existing.company_name}"
+            else:
+                company = session.exec(select(Company).where(Company.primary_email == recipient.to_email)).first()
+                if company is None and recipient.website_url:
+                    company = session.exec(select(Company).where(Company.website_url == recipient.website_url)).first()
+                if company is None:
+                    company = Company(
+                        company_name=recipient.company_name or "Campaign Contact",
+                        website_url=recipient.website_url or f"campaign-{uuid.uuid4()}@example.com",  # Placeholder
+                        primary_email=recipient.to_email,
+                    )
+                company.email_sender = sender.email
+                company.email_sent_status = True
+                session.add(company)
+                session.flush()
+
+                email_log = EmailLog(
+                    company_id=company.id,
+                    sender_email=sender.email,
+                    sent_at=datetime.utcnow(),
+                    subject=recipient.subject,
+                    content=recipient.body
+                )
+                session.add(email_log)
+                client_profile = session.exec(
+                    select(ClientProfile).join(User).where(User.email == recipient.to_email)
+                ).first()
+                session.add(SentEmail(
+                    client_id=client_profile.id if client_profile else None,
+                    to_email=recipient.to_email,
+                    subject=recipient.subject,
+                    english_body=recipient.body,
+                    spanish_body=recipient.spanish_body or '',
+                ))
+                message = queue_email(
+                    session, recipient.to_email,
+                    subject=recipient.subject,
+                    body=recipient.body,
+                    sender_email=sender.email, smtp_server=sender.smtp_server, smtp_port=sender.smtp_port,
+                    imap_server=sender.imap_server, cc_emails=options.get('cc_emails'), html=options.get('html', True),
+                    kind='campaign', client_id=client_profile.id if client_profile else None, company_id=company.id,
+                    email_log_id=email_log.id
+                )
+                session.flush()
+                recipient.status = 'queued'
+                recipient.sender_email = sender.email
+                recipient.outbox_id = message.id
+                recipient.queued_at = datetime.utcnow()
+                if campaign.status == 'queued':
+                    campaign.status = 'sending'
+            recipient.updated_at = campaign.updated_at = datetime.utcnow()
+            session.add(recipient)
+            session.add(campaign)
+            session.commit()
+            return recipient.status
+        except Exception as e:
+            traceback.print_exc()
+            session.rollback()
+            recipient = session.get(CampaignRecipient, recipient.id)
+            recipient.status = 'failed'
+            recipient.error = f"Could not queue email: {e}"
+            recipient.updated_at = datetime.utcnow()
+            session.add(recipient)
+            session.commit()
+            return 'failed'
+
+
+def _finish_drained(campaign_ids):
+    """Marks campaigns without pending recipients as completed"""
+    with Session(engine) as session:
+        for campaign_id in campaign_ids:
+            pending = session.exec(
+                select(func.count(CampaignRecipient.id))
+                .where(CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.status == 'pending')
+            ).one()
+            if pending:
+                continue
+            campaign = session.get(Campaign, campaign_id)
+            if campaign.status in ACTIVE_STATUSES:
+                campaign.status = 'completed'
+                campaign.updated_at = campaign.finished_at = datetime.utcnow()
+                session.add(campaign)
+        session.commit()
+
+
+def cancel_campaign(campaign_id):
+    """Stops a campaign: pending recipients are cancelled, emails already queued are still delivered"""
+    with Session(engine) as session:
+        campaign = session.get(Campaign, campaign_id)
+        if not campaign:
+            return None
+        if campaign.status in FINISHED_STATUSES:
+            return campaign.status
+        campaign.status = 'cancelled'
+        campaign.updated_at = campaign.finished_at = datetime.utcnow()
+        session.add(campaign)
+        for recipient in session.exec(
+            select(CampaignRecipient)
+            .where(CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.status == 'pending')
+        ).all():
+            recipient.status = 'cancelled'
+            recipient.updated_at = datetime.utcnow()
+            session.add(recipient)
+        session.commit()
+        return campaign.status
+
+
+def _recipient_counts(session, campaign_id):
+    """Counts per recipient state; queued recipients are counted by their outbox status (sent, failed, queued)"""
+    rows = session.exec(
+        select(CampaignRecipient.status, OutboxMessage.status, func.count(CampaignRecipient.id))
+        .outerjoin(OutboxMessage, OutboxMessage.id == CampaignRecipient.outbox_id)
+        .where(CampaignRecipient.campaign_id == campaign_id)
+        .group_by(CampaignRecipient.status, OutboxMessage.status)
+    ).all()
+    counts = {}
+    for status, delivery, count in rows:
+        if status == 'queued':
+            status = delivery if delivery in ('sent', 'failed') else 'queued'
+        counts[status] = counts.get(status, 0) + count
+    return counts
+
+
+def _pending_ahead(session, campaign):
+    """Pending recipients that will be queued before this campaign's last one (older active campaigns first)"""
+    return session.exec(
+        select(func.count(CampaignRecipient.id))
+        .join(Campaign, Campaign.id == CampaignRecipient.campaign_id)
+        .where(
+            Campaign.status.in_(ACTIVE_STATUSES),
+            Campaign.created_at <= campaign.created_at,
+            CampaignRecipient.status == 'pending',
+        )
+    ).one()
+
+
+def _campaign_to_dict(campaign, counts, eta_seconds=None):
+    total = campaign.total or 0
+    done = total - counts.get('pending', 0) - counts.get('queued', 0)
+    return {
+        'campaign_id': str(campaign.id),
+        'name': campaign.name,
+        'status': campaign.status,
+        'total': total,
+        'counts': counts,
+        'progress': round(done / total, 4) if total else 1.0,
+        'eta_seconds': eta_seconds,
+        'options': campaign.options or {},
+        'created_at': campaign.created_at.isoformat() if campaign.created_at else None,
+        'updated_at': campaign.updated_at.isoformat() if campaign.updated_at else None,
+        'finished_at': campaign.finished_at.isoformat() if campaign.finished_at else None,
+    }
+
+
+def get_campaign(campaign_id, include_recipients=True, offset=0, limit=100):
+    """Campaign progress, ETA for its pending recipients and (optionally) a page of recipients"""
+    with Session(engine) as session:
+        campaign = session.get(Campaign, campaign_id)
+        if not campaign:
+            return None
+        counts = _recipient_counts(session, campaign.id)
+        eta_seconds = None
+        if campaign.status in ACTIVE_STATUSES:
+            eta_seconds = campaign_runner.eta_seconds(_pending_ahead(session, campaign)) if counts.get('pending') else 0
+        data = _campaign_to_dict(campaign, counts, eta_seconds)
+        if include_recipients:
+            recipients = session.exec(
+                select(CampaignRecipient, OutboxMessage.status)
+                .outerjoin(OutboxMessage, OutboxMessage.id == CampaignRecipient.outbox_id)
+                .where(CampaignRecipient.campaign_id == campaign.id)
+                .order_by(CampaignRecipient.position)
+                .offset(offset)
+                .limit(limit)
+            ).all()
+            data['recipients'] = [
+                {
+                    'index': r.position,
+                    'to_email': r.to_email,
+                    'status': r.status,
+                    'delivery': delivery,
+                    'sender_email': r.sender_email,
+                    'outbox_id': r.outbox_id,
+                    'error': r.error,
+                }
+                for r, delivery in recipients
+            ]
+        return data
+
+
+def list_campaigns(limit=20):
+    with Session(engine) as session:
+        campaigns = session.exec(select(Campaign).order_by(Campaign.created_at.desc()).limit(limit)).all()
+        return [_campaign_to_dict(campaign, _recipient_counts(session, campaign.id)) for campaign in campaigns]
+
+
+# ============================================================================
+# Runner
+# ============================================================================
+
+class CampaignRunner:
+    """
+    Releases pending campaign recipients into the outbox at the senders' pace;
+    one background task serves every active campaign.
+    """
+
+    def __init__(self):
+        self._buckets = {}  # sender email -> TokenBucket
+        self._task = None
+        self._wake = None
+
+    async def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def submit(self, recipients, name=None, options=None):
+        """Persists a campaign and wakes the runner; returns (campaign id, skipped count)"""
+        campaign_id, skipped = await run_in_threadpool(create_campaign, recipients, name, options)
+        self.notify()
+        return campaign_id, skipped
+
+    def notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def _bucket(self, sender):
+        rate = sender_rate(sender)
+        bucket = self._buckets.get(sender.email)
+        if bucket is None or bucket.rate != rate:
+            bucket = self._buckets[sender.email] = TokenBucket(rate)
+        return bucket
+
+    def eta_seconds(self, backlog):
+        """Seconds until `backlog` more recipients are queued at the healthy senders' pace"""
+        senders = [s for s in sender_pool.senders if s.healthy()]
+        rate = sum(sender_rate(s) for s in senders)
+        if not rate:
+            return None
+        # Read-only: runs in a worker thread, the buckets belong to the runner's loop
+        buckets = dict(self._buckets)
+        available = sum(
+            min(int(buckets[s.email].peek() if s.email in buckets else max(1.0, CAMPAIGN_BURST)), send_limiter.remaining(s.email))
+            for s in senders
+        )
+        return math.ceil(max(0, backlog - available) / rate)
+
+    async def _run(self):
+        while True:
+            try:
+                delay = await self._release_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                traceback.print_exc()
+                delay = CAMPAIGN_TICK_SECONDS
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _release_due(self):
+        """Queues every recipient the senders have tokens and quota for; returns the seconds until the next token"""
+        campaign_ids = await run_in_threadpool(_active_campaign_ids)
+        if not campaign_ids:
+            return CAMPAIGN_TICK_SECONDS
+
+        queued = 0
+        drained = False
+        waits = []
+        for sender in sender_pool.senders:
+            if not sender.healthy():
+                continue
+            bucket = self._bucket(sender)
+            limited = False
+            while not drained and bucket.available() >= 1:
+                outcome = await run_in_threadpool(_reserve_and_queue, campaign_ids, sender)
+                if outcome == 'limited':
+                    # Quota used by other sends: look again on the next round
+                    limited = True
+                    break
+                if outcome == 'queued':
+                    bucket.take()
+                    queued += 1
+                    continue
+                drained = outcome is None
+            if not limited and not drained:
+                waits.append(bucket.seconds_until_token())
+
+        if queued:
+            outbox.notify()
+        await run_in_threadpool(_finish_drained, campaign_ids)
+        return max(0.05, min(waits + [CAMPAIGN_TICK_SECONDS]))
+
+
+campaign_runner = CampaignRunner()
@@ -0,0 +1,126 @@
+"""
+Company intelligence store: the structured analysis (company_info, market_analysis,
+service_matches) of each prospect, keyed by canonical domain.
+
+/draft-lead, /generate, background jobs and bulk batches read it before scraping, so
+re-drafting a known prospect costs no scrape and no analysis calls. An entry is
+re-analyzed once older than its TTL (shorter for name-only fallback analyses, whose
+website may be reachable next time) or when the caller passes refresh=true.
+Failed analyses are never stored.
+"""
+import os
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from sqlmodel import Session
+
+from database import engine, CompanyIntelligence
+
+COMPANY_INTEL_ENABLED = os.getenv("COMPANY_INTEL_ENABLED", "true").lower() == "true"
+COMPANY_INTEL_TTL_DAYS = float(os.getenv("COMPANY_INTEL_TTL_DAYS", 30))
+COMPANY_INTEL_FALLBACK_TTL_DAYS = float(os.getenv("COMPANY_INTEL_FALLBACK_TTL_DAYS", 3))
+
+intel_stats = {
+    "hits": 0,
+    "stale": 0,
+    "misses": 0,
+    "stores": 0,
+    "errors": 0,
+}
+
+
+def canonical_domain(url):
+    """Lower-cased host without www. and port: 'https://WWW.Acme.com:443/about' -> 'acme.com'"""
+    url = (url or '').strip()
+    if not url.lower().startswith(('http://', 'https://')):
+        url = 'https://' + url
+    host = (urlsplit(url).hostname or '').lower().rstrip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    return host
+
+
+def is_fresh(entry):
+    ttl_days = COMPANY_INTEL_FALLBACK_TTL_DAYS if entry.source == 'fallback' else COMPANY_INTEL_TTL_DAYS
+    return entry.analyzed_at > datetime.utcnow() - timedelta(days=ttl_days)
+
+
+def intel_dict(entry):
+    return {
+        "domain": entry.domain,
+        "company_name": entry.company_name,
+        "website_url": entry.website_url,
+        "source": entry.source,
+        "version": entry.version,
+        "analyzed_at": entry.analyzed_at.isoformat(),
+        "fresh": is_fresh(entry),
+        "company_info": entry.company_info,
+        "market_analysis": entry.market_analysis,
+        "service_matches": entry.service_matches,
+    }
+
+
+def get_intel(url):
+    """Stored intelligence for the URL's domain (fresh or not), or None"""
+    domain = canonical_domain(url)
+    if not domain:
+        return None
+    with Session(engine) as session:
+        entry = session.get(CompanyIntelligence, domain)
+        return intel_dict(entry) if entry is not None else None
+
+
+def load_intel(url):
+    """Fresh intelligence for the URL's domain, or None (missing, stale or disabled)"""
+    if not COMPANY_INTEL_ENABLED:
+        return None
+    try:
+        intel = get_intel(url)
+    except Exception as e:
+        intel_stats["errors"] += 1
+        print(f"Company intelligence lookup failed for {url}: {e}")
+        return None
+    if intel is None:
+        intel_stats["misses"] += 1
+        return None
+    if not intel["fresh"]:
+        intel_stats["stale"] += 1
+        return None
+    intel_stats["hits"] += 1
+    return intel
+
+
+def save_intel(url, company_name, company_info, market_analysis, service_matches, source="website"):
+    """
+    Stores (or re-versions) the analysis for the URL's domain.
+    Skipped when any stage failed, so a fallback never overwrites a good analysis.
+    """
+    if not COMPANY_INTEL_ENABLED:
+        return None
+    stages = (company_info, market_analysis, service_matches)
+    if any(not stage or stage.get('error') for stage in stages):
+        return None
+    domain = canonical_domain(url)
+    if not domain:
+        return None
+    try:
+        with Session(engine) as session:
+            entry = session.get(CompanyIntelligence, domain)
+            if entry is None:
+                entry = CompanyIntelligence(domain=domain, version=0)
+            entry.company_name = company_name
+            entry.website_url = url
+            entry.source = source
+            entry.company_info = company_info
+            entry.market_analysis = market_analysis
+            entry.service_matches = service_matches
+            entry.version += 1
+            entry.analyzed_at = datetime.utcnow()
+            session.add(entry)
+            session.commit()
+            intel_stats["stores"] += 1
+            return entry.version
+    except Exception as e:
+        intel_stats["errors"] += 1
+        print(f"Could not store company intelligence for {domain}: {e}")
+        return None
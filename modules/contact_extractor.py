@@ -0,0 +1,272 @@
+"""
+Deterministic contact extraction from structured markup, no LLM involved.
+
+Sources, in order of trust:
+- schema.org JSON-LD (Person, Organization/LocalBusiness, ContactPoint, employee/founder)
+- hCard / microformats2 h-card (vcard, fn, title, email, tel)
+- mailto: and tel: links
+
+When a named person with an email address is found this way the pipeline uses these
+contacts directly and leaves contact extraction out of the analysis prompt (see
+is_confident); a bare mailto: link is not enough.
+"""
+import os
+import re
+import json
+from urllib.parse import unquote
+
+from bs4 import BeautifulSoup
+
+from modules.html_extract import available_backends, EMAIL_PATTERN
+
+# Use locally extracted contacts instead of asking the LLM for them
+LOCAL_CONTACTS = os.getenv("LOCAL_CONTACTS", "true").lower() == "true"
+# Structured emails needed (besides a named person) before the LLM contact extraction is skipped
+LOCAL_CONTACTS_MIN_EMAILS = int(os.getenv("LOCAL_CONTACTS_MIN_EMAILS", 1))
+
+EMAIL_RE = re.compile(EMAIL_PATTERN)
+PLACEHOLDER_EMAIL_DOMAINS = ("example.com", "domain.com", "email.com", "yourdomain.com", "sentry.io", "wixpress.com")
+# Words of mailto: anchor texts that invite contact rather than name someone
+CALL_TO_ACTION_WORDS = frozenset(
+    "contact contacts email e-mail mail write message send get touch reach us our me here click "
+    "ask talk call book request quote support sales info hello enquiries inquiries team office "
+    "help customer service now today".split()
+)
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp")
+
+# Cheap pre-check: pages without any of these are not parsed a second time
+MARKERS = ("mailto:", "tel:", "ld+json", "vcard", "h-card")
+
+PERSON_LINK_KEYS = ("employee", "employees", "founder", "founders", "member", "members", "author", "contactPoint")
+
+
+def _bs4_features():
+    return "lxml" if "lxml" in available_backends() else "html.parser"
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def clean_email(value):
+    """Lower-cased address from a raw value or mailto: href, or None if it isn't a real one"""
+    if not value or not isinstance(value, str):
+        return None
+    value = unquote(value.strip())
+    if value.lower().startswith('mailto:'):
+        value = value[7:]
+    value = value.split('?')[0].strip().lower()
+    if not EMAIL_RE.fullmatch(value):
+        return None
+    if value.endswith(IMAGE_SUFFIXES) or value.split('@')[1] in PLACEHOLDER_EMAIL_DOMAINS:
+        return None
+    return value
+
+
+def clean_phone(value):
+    """Phone number with only digits and a leading +, or None if too short to be one"""
+    if not value or not isinstance(value, str):
+        return None
+    value = unquote(value.strip())
+    if value.lower().startswith('tel:'):
+        value = value[4:]
+    digits = re.sub(r'\D', '', value)
+    if len(digits) < 7:
+        return None
+    return ('+' if value.strip().startswith('+') else '') + digits
+
+
+def _looks_like_name(text):
+    """Anchor text such as 'Maria Lopez' (not 'Contact Us', 'Get in Touch' or an address)"""
+    if not text or '@' in text or any(c.isdigit() for c in text):
+        return False
+    words = text.split()
+    if not 2 <= len(words) <= 4 or not all(w[:1].isupper() for w in words):
+        return False
+    return not any(re.sub(r'\W', '', w).lower() in CALL_TO_ACTION_WORDS for w in words)
+
+
+class _Collector:
+    def __init__(self):
+        self.emails = []
+        self.phones = []
+        self.people = []
+
+    def add_email(self, value):
+        email = clean_email(value)
+        if email and email not in self.emails:
+            self.emails.append(email)
+        return email
+
+    def add_phone(self, value):
+        phone = clean_phone(value)
+        if phone and phone not in self.phones:
+            self.phones.append(phone)
+        return phone
+
+    def add_person(self, name=None, role=None, email=None, phone=None, source=None):
+        email = self.add_email(email)
+        phone = self.add_phone(phone)
+        name = (name or '').strip() or None
+        role = (role or '').strip() or None
+        if not (name or role) or not (email or phone):
+            return
+        for person in self.people:
+            same = (email and person['email'] == email) or (name and person['name'] == name)
+            if same:
+                # Fill gaps from a later source
+                for key, value in (('name', name), ('role', role), ('email', email), ('phone', phone)):
+                    if not person[key] and value:
+                        person[key] = value
+                return
+        self.people.append({'name': name, 'role': role, 'email': email, 'phone': phone, 'source': source})
+
+    def result(self):
+        return {'emails': self.emails, 'phones': self.phones, 'people': self.people}
+
+
+def _walk_json_ld(node, out):
+    if isinstance(node, list):
+        for item in node:
+            _walk_json_ld(item, out)
+        return
+    if not isinstance(node, dict):
+        return
+    types = [str(t).lower() for t in _as_list(node.get('@type'))]
+    if 'person' in types:
+        out.add_person(
+            node.get('name'), node.get('jobTitle'),
+            next(iter(_as_list(node.get('email'))), None),
+            next(iter(_as_list(node.get('telephone'))), None),
+            'json-ld'
+        )
+    elif 'contactpoint' in types or node.get('contactType'):
+        out.add_person(
+            node.get('name'), node.get('contactType'),
+            next(iter(_as_list(node.get('email'))), None),
+            next(iter(_as_list(node.get('telephone'))), None),
+            'json-ld'
+        )
+    else:
+        for email in _as_list(node.get('email')):
+            out.add_email(email)
+        for phone in _as_list(node.get('telephone')):
+            out.add_phone(phone)
+    for key in ('@graph',) + PERSON_LINK_KEYS:
+        if key in node:
+            _walk_json_ld(node[key], out)
+
+
+def _first_text(card, classes):
+    tag = card.find(class_=classes)
+    return tag.get_text(' ', strip=True) if tag else None
+
+
+def _card_link(card, classes, scheme):
+    tag = card.find(class_=classes)
+    if tag is not None:
+        return tag.get('href') or tag.get_text(strip=True)
+    link = card.find('a', href=re.compile(f'^{scheme}', re.IGNORECASE))
+    return link['href'] if link else None
+
+
+def extract_contacts(html):
+    """
+    Emails, phone numbers and people found in structured markup:
+        {'emails': [...], 'phones': [...], 'people': [{'name', 'role', 'email', 'phone', 'source'}]}
+    CPU-bound, so callers run it in the threadpool.
+    """
+    out = _Collector()
+    lowered = html.lower()
+    if not any(marker in lowered for marker in MARKERS):
+        return out.result()
+
+    soup = BeautifulSoup(html, _bs4_features())
+
+    # 1. schema.org JSON-LD
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            _walk_json_ld(json.loads(script.string or ''), out)
+        except (ValueError, TypeError):
+            continue
+
+    # 2. hCard / h-card
+    for card in soup.find_all(class_=['vcard', 'h-card']):
+        out.add_person(
+            _first_text(card, ['fn', 'p-name']),
+            _first_text(card, ['title', 'role', 'p-job-title', 'p-role']),
+            _card_link(card, ['email', 'u-email'], 'mailto:'),
+            _card_link(card, ['tel', 'p-tel'], 'tel:'),
+            'hcard'
+        )
+
+    # 3. mailto: / tel: links
+    for link in soup.find_all('a', href=True):
+        href = link['href'].strip()
+        if href.lower().startswith('mailto:'):
+            text = link.get_text(' ', strip=True)
+            if _looks_like_name(text):
+                out.add_person(text, None, href, None, 'mailto')
+            else:
+                out.add_email(href)
+        elif href.lower().startswith('tel:'):
+            out.add_phone(href)
+
+    return out.result()
+
+
+def merge_contacts(results):
+    """Combines extract_contacts results from several pages of one site"""
+    out = _Collector()
+    for result in results:
+        if not result:
+            continue
+        for person in result.get('people', []):
+            out.add_person(person.get('name'), person.get('role'), person.get('email'), person.get('phone'), person.get('source'))
+        for email in result.get('emails', []):
+            out.add_email(email)
+        for phone in result.get('phones', []):
+            out.add_phone(phone)
+    return out.result()
+
+
+def is_confident(local):
+    """
+    True when the structured markup named at least one person (JSON-LD Person / hCard)
+    with an email, and gave enough email addresses, to skip LLM contact extraction.
+    People taken from mailto: anchor text alone do not count.
+    """
+    if not LOCAL_CONTACTS or not local:
+        return False
+    if not any(
+        person.get('name') and person.get('email') and person.get('source') in ('json-ld', 'hcard')
+        for person in local.get('people', [])
+    ):
+        return False
+    return len(local.get('emails', [])) >= max(1, LOCAL_CONTACTS_MIN_EMAILS)
+
+
+def to_analysis_contacts(local):
+    """
+    Local contacts in the shape analyze_content returns (name, role, email, context):
+    named people first, then addresses not tied to a person.
+    """
+    contacts = []
+    used = set()
+    for person in local.get('people', []):
+        if not person.get('email'):
+            continue
+        used.add(person['email'])
+        contacts.append({
+            'name': person.get('name'),
+            'role': person.get('role') or 'Contact',
+            'email': person['email'],
+            'context': f"Phone: {person['phone']}" if person.get('phone') else None,
+        })
+    phone_context = f"Phone: {local['phones'][0]}" if local.get('phones') else None
+    for email in local.get('emails', []):
+        if email not in used:
+            contacts.append({'name': None, 'role': 'General Inquiries', 'email': email, 'context': phone_context})
+    return contacts
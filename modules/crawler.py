@@ -0,0 +1,227 @@
+"""
+Multi-page crawl of a prospect's site: the homepage plus its likely contact pages.
+
+The homepage and /sitemap.xml are fetched together. Contact, team and about pages found
+in the homepage links or the sitemap are then fetched concurrently. If none are found,
+the common paths are tried instead. The text and emails of every page are merged into
+one final_content payload, in the same format scrape_website returns, so the analysis
+stages see real contact pages rather than only the homepage.
+"""
+import os
+import re
+import html as html_lib
+import asyncio
+import logging
+import weakref
+from urllib.parse import urljoin, urldefrag, urlsplit
+
+from fastapi.concurrency import run_in_threadpool
+
+from modules.html_extract import extract_text, extract_links, EMAIL_PATTERN
+from modules.contact_extractor import extract_contacts, merge_contacts
+from modules.scraper import (
+    SCRAPER_MAX_CHARS,
+    fetch_html,
+    format_content,
+    scrape_error_message,
+    scrape_result,
+)
+from modules.scrape_cache import (
+    SCRAPE_CACHE_ENABLED,
+    scrape_cache_stats,
+    normalize_cache_url,
+    is_fresh,
+    get_entry,
+    save_entry,
+)
+
+logger = logging.getLogger(__name__)
+
+# Default for the per-request `crawl` option of /generate, /draft-lead and jobs
+SCRAPER_CRAWL = os.getenv("SCRAPER_CRAWL", "false").lower() == "true"
+# Pages fetched per site, homepage included
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", 5))
+# Concurrent requests to one host, across all crawls in this process
+CRAWL_HOST_CONCURRENCY = int(os.getenv("CRAWL_HOST_CONCURRENCY", 3))
+# Characters of text kept from each extra page (the homepage gets the rest of SCRAPER_MAX_CHARS)
+CRAWL_PAGE_MAX_CHARS = int(os.getenv("CRAWL_PAGE_MAX_CHARS", 2500))
+
+# Words / phrases in a link's path or anchor text -> priority (lower is fetched first)
+CRAWL_KEYWORDS = {
+    "contact": 0, "kontakt": 0, "contacto": 0, "contactanos": 0, "get in touch": 0,
+    "team": 1, "equipo": 1, "staff": 1, "people": 1, "leadership": 1, "management": 1,
+    "about": 2, "nosotros": 2, "quienes somos": 2, "impressum": 2, "imprint": 2, "company": 3,
+}
+CRAWL_GUESS_PATHS = ("/contact", "/about", "/team")
+SKIP_EXTENSIONS = (".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".zip", ".doc", ".docx", ".xml", ".mp4")
+
+SITEMAP_LOC_PATTERN = re.compile(r'<loc>\s*([^<\s]+)\s*</loc>', re.IGNORECASE)
+
+# host -> semaphore; entries disappear once no crawl is using them
+_host_slots = weakref.WeakValueDictionary()
+
+
+def _host_semaphore(host):
+    semaphore = _host_slots.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(CRAWL_HOST_CONCURRENCY)
+        _host_slots[host] = semaphore
+    return semaphore
+
+
+async def _fetch(url):
+    async with _host_semaphore(urlsplit(url).hostname or ''):
+        return await fetch_html(url)
+
+
+def _site_host(url):
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def _link_priority(url, anchor=''):
+    """Priority of a same-site link as a contact page candidate, or None if it isn't one"""
+    path = urlsplit(url).path.lower()
+    if path.endswith(SKIP_EXTENSIONS):
+        return None
+    # '/contact-us/' + 'Get in touch' -> ' contact us get in touch '
+    words = ' ' + ' '.join(re.findall(r'[a-z0-9]+', f"{path} {anchor.lower()}")) + ' '
+    priorities = [p for keyword, p in CRAWL_KEYWORDS.items() if f' {keyword} ' in words]
+    return min(priorities) if priorities else None
+
+
+def select_pages(base_url, links, sitemap_urls, limit):
+    """
+    Up to `limit` contact page URLs on the same site as base_url, best first,
+    from homepage links [(href, anchor text)] and sitemap URLs.
+    """
+    site = _site_host(base_url)
+    seen = {normalize_cache_url(base_url)}
+    candidates = []
+    for position, (href, anchor) in enumerate(list(links) + [(u, '') for u in sitemap_urls]):
+        href = (href or '').strip()
+        if not href or href.startswith(('mailto:', 'tel:', 'javascript:', '#')):
+            continue
+        url = urldefrag(urljoin(base_url, href))[0]
+        if not url.startswith(('http://', 'https://')) or _site_host(url) != site:
+            continue
+        priority = _link_priority(url, anchor)
+        key = normalize_cache_url(url)
+        if priority is None or key in seen:
+            continue
+        seen.add(key)
+        candidates.append((priority, position, url))
+    candidates.sort()
+    return [url for _, _, url in candidates[:limit]]
+
+
+def _parse_homepage(html):
+    """(text, emails, contacts, links) of the homepage; CPU-bound"""
+    text = extract_text(html, SCRAPER_MAX_CHARS)
+    return text, re.findall(EMAIL_PATTERN, html), extract_contacts(html), extract_links(html)
+
+
+def _parse_page(html):
+    """(text, emails, contacts) of an extra page, text capped at CRAWL_PAGE_MAX_CHARS; CPU-bound"""
+    return extract_text(html, CRAWL_PAGE_MAX_CHARS), re.findall(EMAIL_PATTERN, html), extract_contacts(html)
+
+
+async def _fetch_sitemap(url):
+    parts = urlsplit(url)
+    try:
+        _, xml = await _fetch(f"{parts.scheme}://{parts.netloc}/sitemap.xml")
+    except Exception:
+        return []
+    return [html_lib.unescape(loc) for loc in SITEMAP_LOC_PATTERN.findall(xml)]
+
+
+async def _fetch_page(url):
+    try:
+        final_url, page_html = await _fetch(url)
+        text, emails, contacts = await run_in_threadpool(_parse_page, page_html)
+        return final_url, text, emails, contacts
+    except Exception as e:
+        logger.info(f"Crawl skipped {url}: {e}")
+        return None
+
+
+def merge_pages(url, home_text, pages, emails):
+    """
+    One final_content payload for the whole site: homepage text first (trimmed so the
+    extra pages fit in SCRAPER_MAX_CHARS), then one section per extra page.
+    """
+    sections = [f"--- Page: {page_url} ---\n{text}" for page_url, text in pages if text]
+    extra = '\n\n'.join(sections)
+    home_budget = max(0, SCRAPER_MAX_CHARS - len(extra) - 2)
+    text = '\n\n'.join(part for part in [home_text[:home_budget], extra] if part)
+    return format_content(url, emails, text)
+
+
+async def crawl_website(url, use_cache=True, max_pages=None):
+    """
+    Fetches the homepage and up to max_pages - 1 likely contact/about/team pages
+    (CRAWL_MAX_PAGES by default) and returns their merged final_content.
+    Errors on the homepage return the same 'ERROR SCRAPING: ...' payload as scrape_website;
+    failing extra pages are left out.
+    """
+    return (await crawl_website_detailed(url, use_cache, max_pages))['content']
+
+
+async def crawl_website_detailed(url, use_cache=True, max_pages=None):
+    """crawl_website, returning scrape_result() with the contacts merged across pages"""
+    if not url.startswith('http'):
+        url = 'https://' + url
+    max_pages = CRAWL_MAX_PAGES if max_pages is None else max_pages
+
+    use_cache = use_cache and SCRAPE_CACHE_ENABLED
+    cache_key = "crawl:" + normalize_cache_url(url)
+    if use_cache:
+        try:
+            cached = await run_in_threadpool(get_entry, cache_key)
+        except Exception as e:
+            scrape_cache_stats["errors"] += 1
+            logger.warning(f"Scrape cache read failed for {url}: {e}")
+            cached = None
+        if cached is not None and is_fresh(cached):
+            scrape_cache_stats["fresh_hits"] += 1
+            logger.info(f"Crawl cache hit: {url}")
+            return scrape_result(cached.content, cached.emails, cached.contacts)
+
+    logger.info(f"Crawling URL: {url}")
+
+    # Round 1: homepage and sitemap together
+    home_result, sitemap_urls = await asyncio.gather(
+        _fetch(url), _fetch_sitemap(url), return_exceptions=True
+    )
+    if isinstance(home_result, BaseException):
+        return scrape_result(scrape_error_message(url, home_result))
+    if isinstance(sitemap_urls, BaseException):
+        sitemap_urls = []
+    home_url, home_html = home_result
+
+    try:
+        home_text, home_emails, home_contacts, links = await run_in_threadpool(_parse_homepage, home_html)
+    except Exception as e:
+        return scrape_result(scrape_error_message(url, e))
+
+    # Round 2: the best candidate pages, all at once
+    targets = select_pages(home_url, links, sitemap_urls, max_pages - 1)
+    if not targets and max_pages > 1:
+        targets = [urljoin(home_url, path) for path in CRAWL_GUESS_PATHS][:max_pages - 1]
+    results = [r for r in await asyncio.gather(*(_fetch_page(t) for t in targets)) if r]
+
+    # Homepage emails first, then new ones in page order
+    emails = list(dict.fromkeys(home_emails + [e for _, _, page_emails, _ in results for e in page_emails]))
+    contacts = merge_contacts([home_contacts] + [page_contacts for _, _, _, page_contacts in results])
+    content = merge_pages(url, home_text, [(page_url, text) for page_url, text, _, _ in results], emails)
+    logger.info(f"Crawled {url}: {1 + len(results)} pages, {len(emails)} emails")
+
+    if use_cache:
+        scrape_cache_stats["misses"] += 1
+        try:
+            await run_in_threadpool(save_entry, cache_key, content, emails, None, None, contacts)
+        except Exception as e:
+            scrape_cache_stats["errors"] += 1
+            logger.warning(f"Scrape cache write failed for {url}: {e}")
+
+    return scrape_result(content, emails, contacts)
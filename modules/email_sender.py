@@ -1,10 +1,15 @@
-import smtplib
 import imaplib
 import time
-import ssl
+import asyncio
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+from fastapi.concurrency import run_in_threadpool
+
+from modules.smtp_pool import smtp_pool
+from modules.async_smtp import async_smtp_pool
+from modules.sent_appender import sent_appender, find_sent_folder, SENT_APPEND_BACKGROUND
+
 DEFAULT_CC_EMAILS = [
     "dapros.mx.com@gmail.com",
     "contacto@dapros.com.mx",
@@ -16,46 +21,15 @@ DEFAULT_CC_EMAILS = [
 
 def save_to_sent(to_email, msg, sender_email, sender_password, imap_server, imap_port=993):
     """
-    Saves the email to the IMAP Sent folder.
+    Saves the email to the IMAP Sent folder right away, on a new connection.
+    send_email_outlook queues the copy for the background appender instead (modules/sent_appender.py).
     """
     try:
         print(f"Connecting to IMAP {imap_server} to save copy...")
         mail = imaplib.IMAP4_SSL(imap_server, imap_port)
         mail.login(sender_email, sender_password)
-        
-        # Get list of folders
-        status, folder_list = mail.list()
-        folders = []
-        if status == 'OK':
-            for f in folder_list:
-                # Parse folder name from bytes: b'(\HasNoChildren) "/" "Sent"'
-                name = f.decode().split(' "|" ')[-1].split(' "/" ')[-1].strip('"')
-                # simpler parsing for common formats
-                if '"' in f.decode():
-                    name = f.decode().split('"')[-2]
-                else:
-                    name = f.decode().split(' ')[-1]
-                folders.append(name)
-        
-        print(f"Available folders: {folders}")
 
-        # Intelligent Sent folder detection
-        sent_candidates = ['Expected Sent Folder', 'Sent Items', 'Sent', 'INBOX.Sent', 'INBOX.Sent Items', 'Enviados']
-        target_folder = None
-        
-        # 1. Try exact matches from our list
-        for candidate in sent_candidates:
-            if candidate in folders:
-                target_folder = candidate
-                break
-                
-        # 2. If not found, look for "Sent" in the name (case insensitive)
-        if not target_folder:
-            for folder in folders:
-                if 'sent' in folder.lower():
-                    target_folder = folder
-                    break
-        
+        target_folder = find_sent_folder(mail)
         if target_folder:
             print(f"Saving to folder: {target_folder}")
             # Append the message
@@ -64,19 +38,13 @@ def save_to_sent(to_email, msg, sender_email, sender_password, imap_server, imap
             now = imaplib.Time2Internaldate(time.time())
             mail.append(f'"{target_folder}"', '\\Seen', now, msg.as_bytes())
             print(f"✓ Successfully saved copy to {target_folder}")
-        else:
-            print(f"⚠ Could not find a 'Sent' folder. Available: {folders}")
             
         mail.logout()
     except Exception as e:
         print(f"❌ Failed to save copy to Sent folder: {e}")
 
-def send_email_outlook(to_email, subject, body, sender_email, sender_password, smtp_server='smtp.office365.com', smtp_port=587, html=True, cc_emails=None, imap_server=None):
-    """
-    Sends an email using SMTP.
-    Supports both HTML and plain text emails.
-    Supports both TLS (port 587) and SSL (port 465).
-    """
+def build_message(to_email, subject, body, sender_email, html=True, cc_emails=None):
+    """The MIME message and its envelope recipients (To + CCs; default CCs unless cc_emails is given)"""
     # Use default CCs if not provided (and not explicitly empty list)
     if cc_emails is None:
         cc_emails = DEFAULT_CC_EMAILS
@@ -95,47 +63,101 @@ def send_email_outlook(to_email, subject, body, sender_email, sender_password, s
     else:
         msg.attach(MIMEText(body, 'plain'))
 
+    # Combine recipients for the envelope
+    recipients = [to_email] + cc_emails if cc_emails else [to_email]
+    return msg, recipients
+
+
+def sent_folder_server(smtp_server, imap_server=None):
+    """IMAP server holding the Sent folder: imap_server, or guessed from the SMTP server"""
+    if imap_server:
+        return imap_server
+    # Heuristic detection if not provided
+    if 'smtp.' in smtp_server:
+        return smtp_server.replace('smtp.', 'imap.')
+    elif 'office365' in smtp_server:
+        return 'outlook.office365.com'
+    return smtp_server  # mail.* is already in the correct format
+
+
+def queue_sent_copy(to_email, msg, sender_email, sender_password, target_imap):
+    """Hands the copy to the background appender; returns False if it has to be saved inline"""
+    if not SENT_APPEND_BACKGROUND:
+        return False
+    try:
+        sent_appender.enqueue(sender_email, sender_password, target_imap, msg)
+        return True
+    except Exception as e:
+        print(f"Could not queue copy for the Sent folder ({e}); saving it now")
+        return False
+
+
+def send_email_outlook(to_email, subject, body, sender_email, sender_password, smtp_server='smtp.office365.com', smtp_port=587, html=True, cc_emails=None, imap_server=None):
+    """
+    Sends an email using SMTP.
+    Supports both HTML and plain text emails.
+    Supports both TLS (port 587) and SSL (port 465).
+    The SMTP session is taken from / returned to the shared pool (modules/smtp_pool.py).
+    """
+    msg, recipients = build_message(to_email, subject, body, sender_email, html, cc_emails)
+
     try:
-        smtp_port = int(smtp_port)
-        print(f"Connecting to {smtp_server}:{smtp_port}...")
-        
-        # Prepare SSL context
-        context = ssl.create_default_context()
-
-        # Use SSL for port 465, TLS for port 587
-        if smtp_port == 465:
-            # SSL connection
-            server = smtplib.SMTP_SSL(smtp_server, smtp_port, context=context, timeout=30)
-        else:
-            # TLS connection
-            server = smtplib.SMTP(smtp_server, smtp_port, timeout=30)
-            server.starttls(context=context)
-        
-        server.login(sender_email, sender_password)
         text = msg.as_string()
-        
-        # Combine recipients for the envelope
-        recipients = [to_email] + cc_emails if cc_emails else [to_email]
-        
-        server.sendmail(sender_email, recipients, text)
-        server.quit()
-        print(f"Email sent to {to_email} (CC: {cc_emails})")
+        smtp_pool.sendmail(smtp_server, int(smtp_port), sender_email, sender_password, recipients, text)
+        print(f"Email sent to {to_email} (CC: {recipients[1:]})")
         
         # Try to save to sent folder
-        target_imap = imap_server
-        if not target_imap:
-            # Heuristic detection if not provided
-            target_imap = smtp_server
-            if 'smtp.' in smtp_server:
-                target_imap = smtp_server.replace('smtp.', 'imap.')
-            elif 'office365' in smtp_server:
-                target_imap = 'outlook.office365.com'
-            elif 'mail.' in smtp_server:
-                target_imap = smtp_server  # Already in correct format
-            
-        save_to_sent(to_email, msg, sender_email, sender_password, target_imap)
+        target_imap = sent_folder_server(smtp_server, imap_server)
+        if not queue_sent_copy(to_email, msg, sender_email, sender_password, target_imap):
+            save_to_sent(to_email, msg, sender_email, sender_password, target_imap)
         
         return True
     except Exception as e:
         print(f"Failed to send email: {e}")
         raise e
+
+
+async def send_email_outlook_async(to_email, subject, body, sender_email, sender_password, smtp_server='smtp.office365.com', smtp_port=587, html=True, cc_emails=None, imap_server=None):
+    """
+    send_email_outlook on the asyncio SMTP transport (modules/async_smtp.py): same
+    arguments, same TLS (587) / SSL (465) behavior, no thread held while sending.
+    """
+    msg, recipients = build_message(to_email, subject, body, sender_email, html, cc_emails)
+
+    try:
+        await async_smtp_pool.sendmail(smtp_server, int(smtp_port), sender_email, sender_password, recipients, msg.as_string())
+        print(f"Email sent to {to_email} (CC: {recipients[1:]})")
+
+        target_imap = sent_folder_server(smtp_server, imap_server)
+        # Both write to the DB / IMAP: keep them off the event loop
+        if not await run_in_threadpool(queue_sent_copy, to_email, msg, sender_email, sender_password, target_imap):
+            await run_in_threadpool(save_to_sent, to_email, msg, sender_email, sender_password, target_imap)
+
+        return True
+    except Exception as e:
+        print(f"Failed to send email: {e}")
+        raise e
+
+
+async def send_emails_outlook_async(emails, sender_email, sender_password, smtp_server='smtp.office365.com', smtp_port=587, imap_server=None):
+    """
+    Sends many emails from one account concurrently over the account's few pooled
+    connections (SMTP_ASYNC_CONNECTIONS), with pipelined envelopes where supported.
+    `emails` are dicts with to_email, subject, body and optionally html / cc_emails.
+    Returns one entry per email, in order: True, or the exception it failed with.
+    """
+    return await asyncio.gather(*(
+        send_email_outlook_async(
+            to_email=email['to_email'],
+            subject=email['subject'],
+            body=email['body'],
+            sender_email=sender_email,
+            sender_password=sender_password,
+            smtp_server=smtp_server,
+            smtp_port=smtp_port,
+            html=email.get('html', True),
+            cc_emails=email.get('cc_emails'),
+            imap_server=imap_server,
+        )
+        for email in emails
+    ), return_exceptions=True)
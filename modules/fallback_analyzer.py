@@ -1,21 +1,8 @@
-import os
-import json
-from openai import OpenAI
+from modules.openai_client import chat_json, is_throttled
 
-def get_openai_client():
-    api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not found in environment variables")
-    return OpenAI(api_key=api_key)
-
-def analyze_company_name_fallback(company_name):
-    """
-    Deep company analysis using GPT's knowledge base when website scraping fails.
-    Returns a rich company_info dict ready for email personalization.
-    """
-    try:
-        client = get_openai_client()
-        prompt = f"""You are a business intelligence researcher with deep knowledge of companies worldwide.
+def build_fallback_messages(company_name):
+    """Chat messages for the name-only company analysis (also used by the batch mode)"""
+    prompt = f"""You are a business intelligence researcher with deep knowledge of companies worldwide.
 
 Analyze the company: "{company_name}"
 
@@ -42,31 +29,44 @@ Return a JSON object with these exact fields:
 
 Be specific and accurate. If this is a major brand (like Flipkart, Zomato, etc.), describe their real products and services."""
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a business intelligence expert. Return accurate, specific company analysis in valid JSON only."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-        result = json.loads(response.choices[0].message.content)
-        # Always ensure these keys exist
-        result.setdefault('company_name', company_name)
-        result.setdefault('contacts', [])
-        result.setdefault('summary', f'{company_name} is a company in the digital space.')
-        return result
+    return [
+        {"role": "system", "content": "You are a business intelligence expert. Return accurate, specific company analysis in valid JSON only."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def complete_fallback_result(result, company_name):
+    """Fills in the keys the email generator and routes rely on"""
+    result.setdefault('company_name', company_name)
+    result.setdefault('contacts', [])
+    result.setdefault('summary', f'{company_name} is a company in the digital space.')
+    return result
+
+
+def fallback_error_result(company_name, error, throttled=False):
+    return {
+        "company_name": company_name,
+        "likely_industry": "General Business",
+        "sub_category": "",
+        "business_model": "B2B",
+        "common_pain_points": ["Lead Generation", "Online Visibility"],
+        "growth_opportunities": ["Organic Search Traffic", "Local Discovery"],
+        "key_products_services": [],
+        "target_market": "General consumers and businesses",
+        "summary": f"{company_name} is a business looking to grow its digital presence.",
+        "contacts": [],
+        "error": error,
+        "throttled": throttled
+    }
+
+
+async def analyze_company_name_fallback(company_name):
+    """
+    Deep company analysis using GPT's knowledge base when website scraping fails.
+    Returns a rich company_info dict ready for email personalization.
+    """
+    try:
+        result = await chat_json(build_fallback_messages(company_name), cache=True, stage="fallback_analysis")
+        return complete_fallback_result(result, company_name)
     except Exception as e:
-        return {
-            "company_name": company_name,
-            "likely_industry": "General Business",
-            "sub_category": "",
-            "business_model": "B2B",
-            "common_pain_points": ["Lead Generation", "Online Visibility"],
-            "growth_opportunities": ["Organic Search Traffic", "Local Discovery"],
-            "key_products_services": [],
-            "target_market": "General consumers and businesses",
-            "summary": f"{company_name} is a business looking to grow its digital presence.",
-            "contacts": [],
-            "error": str(e)
-        }
+        return fallback_error_result(company_name, str(e), is_throttled(e))
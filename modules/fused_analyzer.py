@@ -0,0 +1,166 @@
+"""
+Fused single-call analysis: company analysis, market analysis and service matching
+from one structured-output OpenAI call instead of three.
+
+The returned dicts have the same shapes as analyze_content, analyze_market and
+match_services, so generate_serp_hawk_email and the routes consume them unchanged.
+"""
+import os
+
+from modules.openai_client import chat_json, is_throttled
+from modules.prompt_budget import fit_text
+from modules.market_analyzer import SERP_HAWK_SERVICES
+
+# Enables fused mode by default for /generate and /draft-lead (requests can still override)
+FUSED_ANALYSIS = os.getenv("FUSED_ANALYSIS", "false").lower() == "true"
+
+
+def _obj(properties):
+    """Strict JSON-schema object: every property required, nothing extra"""
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties.keys()),
+        "additionalProperties": False,
+    }
+
+
+_STR = {"type": "string"}
+_STR_LIST = {"type": "array", "items": _STR}
+
+_CONTACTS = {"type": "array", "items": _obj({
+    "name": _STR,
+    "role": _STR,
+    "email": {"type": ["string", "null"]},
+    "context": {"type": ["string", "null"]},
+})}
+
+
+def fused_schema(include_contacts=True):
+    """Response schema; without contacts when they were extracted locally"""
+    company_info = {"company_name": _STR, "what_they_do": _STR}
+    if include_contacts:
+        company_info["contacts"] = _CONTACTS
+    company_info["key_value_props"] = _STR_LIST
+    return _obj({
+        "company_info": _obj(company_info),
+        "market_analysis": _obj({
+            "industry": _STR,
+            "sub_category": _STR,
+            "business_model": _STR,
+            "pain_points": _STR_LIST,
+            "growth_potential": _STR,
+            "online_presence": _obj({"seo_status": _STR}),
+        }),
+        "service_matches": _obj({
+            "recommended_services": {"type": "array", "items": _obj({
+                "service_name": _STR,
+                "why_relevant": _STR,
+                "expected_impact": _STR,
+            })},
+            "email_hook": _STR,
+            "package_suggestion": _STR,
+        }),
+    })
+
+
+FUSED_ANALYSIS_SCHEMA = fused_schema()
+
+
+def build_fused_messages(text, company_name=None, include_contacts=True):
+    """Chat messages for the fused analysis prompt"""
+    name_hint = f"Company name hint (from the request or URL): {company_name}\n" if company_name else ""
+    contacts_hint = (
+        "\n   every contact person found (name, role/job title, email if found else null, any specific context else null),"
+        if include_contacts else ""
+    )
+    prompt = f"""Analyze the following website content in three parts and return one JSON object.
+
+1. company_info: the company's name, a brief summary of their business (2-3 sentences) as what_they_do,{contacts_hint}
+   and their key value propositions.
+2. market_analysis: industry, sub_category, business_model, pain_points, growth_potential,
+   and online_presence.seo_status.
+3. service_matches: recommend SERP Hawk services for the company based on parts 1 and 2, each with
+   service_name, why_relevant and expected_impact, plus a compelling email_hook sentence and a
+   package_suggestion (Starter/Growth/Enterprise).
+
+Available SERP Hawk services: {SERP_HAWK_SERVICES}
+{name_hint}
+Website Content:
+{fit_text(text, "fused")}
+"""
+    return [{"role": "user", "content": prompt}]
+
+
+def fused_response_format(include_contacts=True):
+    schema = FUSED_ANALYSIS_SCHEMA if include_contacts else fused_schema(False)
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "fused_analysis", "strict": True, "schema": schema},
+    }
+
+
+FUSED_RESPONSE_FORMAT = fused_response_format()
+
+
+def split_fused_result(result, company_name=None):
+    """Splits a fused response into (company_info, market_analysis, service_matches)"""
+    company_info = result.get("company_info") or {}
+    company_info.setdefault("company_name", company_name or "Unknown")
+    company_info.setdefault("contacts", [])
+    return company_info, result.get("market_analysis") or {}, result.get("service_matches") or {}
+
+
+def fused_error_result(company_name, error, contacts=None, throttled=False):
+    """Fallback (company_info, market_analysis, service_matches) when the fused call fails"""
+    company_info = {
+        "company_name": company_name or "Unknown",
+        "what_they_do": "Analysis failed",
+        "contacts": contacts or [],
+        "error": error,
+        "throttled": throttled
+    }
+    market_analysis = {
+        "industry": "General Business",
+        "sub_category": "",
+        "business_model": "B2B",
+        "pain_points": ["Lead Generation", "Online Visibility"],
+        "growth_potential": "High",
+        "online_presence": {"seo_status": "Needs improvement"},
+        "error": error,
+        "throttled": throttled
+    }
+    service_matches = {
+        "recommended_services": [
+            {"service_name": "Organic SEO", "why_relevant": "Improve online visibility", "expected_impact": "More qualified leads"},
+            {"service_name": "Local SEO", "why_relevant": "Dominate local search", "expected_impact": "Increased local customers"}
+        ],
+        "email_hook": "Growth opportunities for your business",
+        "package_suggestion": "Growth",
+        "error": error,
+        "throttled": throttled
+    }
+    return company_info, market_analysis, service_matches
+
+
+async def analyze_fused(text, company_name=None, contacts=None):
+    """
+    Runs company analysis, market analysis and service matching in one call.
+    Locally extracted `contacts`, if given, replace the model's contact extraction.
+    Returns (company_info, market_analysis, service_matches).
+    """
+    include_contacts = contacts is None
+    try:
+        result = await chat_json(
+            build_fused_messages(text, company_name, include_contacts),
+            cache=True,
+            stage="fused_analysis",
+            response_format=FUSED_RESPONSE_FORMAT if include_contacts else fused_response_format(False),
+        )
+        company_info, market_analysis, service_matches = split_fused_result(result, company_name)
+        if not include_contacts:
+            company_info["contacts"] = contacts
+        return company_info, market_analysis, service_matches
+    except Exception as e:
+        print(f"Fused analysis error: {e}")
+        return fused_error_result(company_name, str(e), contacts, is_throttled(e))
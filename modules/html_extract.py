@@ -0,0 +1,128 @@
+"""
+HTML -> text extraction backends for the scraper.
+
+Backends, fastest first:
+- selectolax (lexbor engine, C)        pip install selectolax
+- lxml (through BeautifulSoup)         pip install lxml
+- html.parser (through BeautifulSoup)  always available
+
+All of them drop the same non-content tags and produce the same whitespace-cleaned text
+as the original BeautifulSoup pipeline. Text nodes are consumed lazily and extraction
+stops as soon as the character budget is filled.
+"""
+import os
+import importlib.util
+
+from bs4 import BeautifulSoup
+
+# auto | selectolax | lxml | html.parser
+SCRAPER_PARSER = os.getenv("SCRAPER_PARSER", "auto")
+
+EMAIL_PATTERN = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
+
+STRIP_TAGS = ["script", "style", "nav", "footer", "header", "noscript", "iframe", "svg"]
+
+
+def available_backends():
+    backends = []
+    if importlib.util.find_spec("selectolax") is not None:
+        backends.append("selectolax")
+    if importlib.util.find_spec("lxml") is not None:
+        backends.append("lxml")
+    backends.append("html.parser")
+    return backends
+
+
+def resolve_backend(name=None):
+    """Requested backend if installed, otherwise the fastest available one"""
+    name = name or SCRAPER_PARSER
+    backends = available_backends()
+    if name in backends:
+        return name
+    return backends[0]
+
+
+def _strings_bs4(html, features):
+    soup = BeautifulSoup(html, features)
+    for tag in soup(STRIP_TAGS):
+        tag.decompose()
+    # Same node walk as soup.get_text(), but lazy
+    return soup.strings
+
+
+def _strings_selectolax(html):
+    from selectolax.lexbor import LexborHTMLParser
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(STRIP_TAGS)
+    if tree.root is None:
+        return
+    for node in tree.root.traverse(include_text=True):
+        if node.tag == '-text':
+            yield node.text_content
+
+
+def _has_linebreak(s):
+    parts = s.splitlines(True)
+    return len(parts) > 1 or (len(parts) == 1 and parts[0].splitlines()[0] != parts[0])
+
+
+def _clean_line(line, out):
+    for phrase in line.strip().split("  "):
+        phrase = phrase.strip()
+        if phrase:
+            out.append(phrase)
+
+
+def clean_text(strings, max_chars=None):
+    """
+    Equivalent to:
+        text = ' '.join(strings)
+        lines = (line.strip() for line in text.splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        '\n'.join(chunk for chunk in chunks if chunk)[:max_chars]
+    but stops consuming `strings` once max_chars of output are produced.
+    """
+    out = []
+    size = 0
+    pending = None
+    for piece in strings:
+        pending = piece if pending is None else pending + ' ' + piece
+        # Only the new piece can complete a line
+        if not _has_linebreak(piece):
+            continue
+        lines = pending.splitlines(True)
+        # The last line may continue in the next text node
+        pending = '' if _has_linebreak(lines[-1]) else lines.pop()
+        before = len(out)
+        for line in lines:
+            _clean_line(line, out)
+        size += sum(len(chunk) + 1 for chunk in out[before:])
+        # Joined length is size - 1 (no separator after the last chunk)
+        if max_chars is not None and size > max_chars:
+            pending = None
+            break
+    if pending:
+        _clean_line(pending, out)
+    text = '\n'.join(out)
+    return text[:max_chars] if max_chars is not None else text
+
+
+def extract_text(html, max_chars=None, backend=None):
+    """Cleaned visible text of an HTML document, at most max_chars long"""
+    backend = resolve_backend(backend)
+    if backend == "selectolax":
+        strings = _strings_selectolax(html)
+    else:
+        strings = _strings_bs4(html, backend)
+    return clean_text(strings, max_chars)
+
+
+def extract_links(html, backend=None):
+    """(href, anchor text) for every <a href> in the document"""
+    backend = resolve_backend(backend)
+    if backend == "selectolax":
+        from selectolax.lexbor import LexborHTMLParser
+        tree = LexborHTMLParser(html)
+        return [(a.attributes.get('href') or '', a.text(strip=True)) for a in tree.css('a[href]')]
+    soup = BeautifulSoup(html, backend)
+    return [(a['href'], a.get_text(' ', strip=True)) for a in soup.find_all('a', href=True)]
@@ -0,0 +1,303 @@
+"""
+Persistent background job queue for lead-generation batches.
+
+A job is a LeadJob row plus one LeadJobItem row per URL/lead. Workers run inside the app
+process; every item result is written as soon as it is ready, so a restart only loses the
+items that were in flight. On startup, unfinished jobs are put back on the queue and only
+their pending items are processed.
+"""
+import os
+import asyncio
+import traceback
+from datetime import datetime
+
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, select, func
+
+from database import engine, LeadJob, LeadJobItem
+from modules.lead_pipeline import process_generate_url, build_lead_draft, resolve_concurrency
+
+# Number of jobs processed at the same time, and URLs processed at the same time within one job
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_ITEM_CONCURRENCY = int(os.getenv("JOB_ITEM_CONCURRENCY", 5))
+
+JOB_KINDS = ("generate", "draft")
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+
+async def _run_generate_item(item, options):
+    return await process_generate_url(
+        item.url, options.get('fused'), None, options.get('crawl'), bool(options.get('refresh'))
+    )
+
+
+async def _run_draft_item(item, options):
+    payload = item.payload or {}
+    return await build_lead_draft(
+        payload.get('company_name') or item.url,
+        item.url,
+        payload.get('primary_email', ''),
+        options.get('fused'),
+        options.get('crawl'),
+        bool(options.get('refresh'))
+    )
+
+
+# kind -> coroutine(item, options) producing the item's result dict
+JOB_HANDLERS = {
+    "generate": _run_generate_item,
+    "draft": _run_draft_item,
+}
+
+
+# ============================================================================
+# DB helpers (sync, run in the threadpool)
+# ============================================================================
+
+def create_job(kind, items, options=None):
+    """
+    Persists a new job. `items` is a list of dicts with 'url' and optionally
+    'payload' and 'status'/'error' (e.g. pre-skipped leads). Returns the job id.
+    """
+    with Session(engine) as session:
+        job = LeadJob(kind=kind, options=options or {}, total=len(items))
+        session.add(job)
+        session.flush()
+        for position, item in enumerate(items):
+            session.add(LeadJobItem(
+                job_id=job.id,
+                position=position,
+                url=item['url'],
+                payload=item.get('payload') or {},
+                status=item.get('status', 'pending'),
+                error=item.get('error')
+            ))
+        session.commit()
+        return job.id
+
+
+def _job_counts(session, job_id):
+    rows = session.exec(
+        select(LeadJobItem.status, func.count(LeadJobItem.id))
+        .where(LeadJobItem.job_id == job_id)
+        .group_by(LeadJobItem.status)
+    ).all()
+    return {status: count for status, count in rows}
+
+
+def _job_to_dict(job, counts):
+    processed = sum(counts.get(s, 0) for s in ('done', 'failed', 'skipped'))
+    return {
+        'job_id': str(job.id),
+        'kind': job.kind,
+        'status': job.status,
+        'total': job.total,
+        'processed': processed,
+        'counts': counts,
+        'options': job.options or {},
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def get_job(job_id, include_results=True, offset=0, limit=100):
+    """Job status with item counts and (optionally) a page of finished item results"""
+    with Session(engine) as session:
+        job = session.get(LeadJob, job_id)
+        if not job:
+            return None
+        data = _job_to_dict(job, _job_counts(session, job.id))
+        if include_results:
+            items = session.exec(
+                select(LeadJobItem)
+                .where(LeadJobItem.job_id == job.id, LeadJobItem.status.in_(['done', 'failed', 'skipped']))
+                .order_by(LeadJobItem.position)
+                .offset(offset)
+                .limit(limit)
+            ).all()
+            data['results'] = [
+                {
+                    'index': i.position,
+                    'url': i.url,
+                    'status': i.status,
+                    'result': i.result,
+                    'error': i.error,
+                }
+                for i in items
+            ]
+        return data
+
+
+def list_jobs(limit=20):
+    with Session(engine) as session:
+        jobs = session.exec(select(LeadJob).order_by(LeadJob.created_at.desc()).limit(limit)).all()
+        return [_job_to_dict(job, _job_counts(session, job.id)) for job in jobs]
+
+
+def _set_job_status(job_id, status, error=None):
+    with Session(engine) as session:
+        job = session.get(LeadJob, job_id)
+        if not job:
+            return None
+        # A cancelled job stays cancelled even if a worker finishes afterwards
+        if job.status == 'cancelled' and status != 'cancelled':
+            return job.status
+        job.status = status
+        if status == 'running' and not job.started_at:
+            job.started_at = datetime.utcnow()
+        if status in FINISHED_STATUSES:
+            job.finished_at = datetime.utcnow()
+        if error:
+            job.error = error
+        session.add(job)
+        session.commit()
+        return job.status
+
+
+def cancel_job(job_id):
+    """Marks a job cancelled; items not yet started are left pending and never run"""
+    with Session(engine) as session:
+        job = session.get(LeadJob, job_id)
+        if not job:
+            return None
+        if job.status in FINISHED_STATUSES:
+            return job.status
+    return _set_job_status(job_id, 'cancelled')
+
+
+def _load_job(job_id):
+    with Session(engine) as session:
+        return session.get(LeadJob, job_id)
+
+
+def _pending_items(job_id):
+    with Session(engine) as session:
+        return session.exec(
+            select(LeadJobItem)
+            .where(LeadJobItem.job_id == job_id, LeadJobItem.status == 'pending')
+            .order_by(LeadJobItem.position)
+        ).all()
+
+
+def _save_item(item_id, status, result=None, error=None):
+    with Session(engine) as session:
+        item = session.get(LeadJobItem, item_id)
+        item.status = status
+        item.result = result
+        item.error = error
+        item.updated_at = datetime.utcnow()
+        session.add(item)
+        session.commit()
+
+
+def _unfinished_job_ids():
+    """Jobs to resume after a restart; their in-flight items go back to pending"""
+    with Session(engine) as session:
+        jobs = session.exec(
+            select(LeadJob).where(LeadJob.status.in_(['queued', 'running'])).order_by(LeadJob.created_at)
+        ).all()
+        job_ids = [job.id for job in jobs]
+        if job_ids:
+            running = session.exec(
+                select(LeadJobItem).where(LeadJobItem.job_id.in_(job_ids), LeadJobItem.status == 'running')
+            ).all()
+            for item in running:
+                item.status = 'pending'
+                session.add(item)
+            session.commit()
+        return job_ids
+
+
+# ============================================================================
+# Worker pool
+# ============================================================================
+
+class JobQueue:
+    """
+    In-process worker pool backed by the lead_jobs / lead_job_items tables.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, item_concurrency=JOB_ITEM_CONCURRENCY):
+        self.workers = workers
+        self.item_concurrency = item_concurrency
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        """Starts the workers and re-queues jobs left unfinished by a previous process"""
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        try:
+            job_ids = await run_in_threadpool(_unfinished_job_ids)
+        except Exception as e:
+            print(f"Job resume note: {e}")
+            job_ids = []
+        for job_id in job_ids:
+            print(f"Resuming lead job {job_id}")
+            self._queue.put_nowait(job_id)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind, items, options=None):
+        """Persists a job and queues it; returns the job id"""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind '{kind}'. Expected one of: {', '.join(JOB_KINDS)}")
+        job_id = await run_in_threadpool(create_job, kind, items, options)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                traceback.print_exc()
+                await run_in_threadpool(_set_job_status, job_id, 'failed', str(e))
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id):
+        job = await run_in_threadpool(_load_job, job_id)
+        if not job or job.status in FINISHED_STATUSES:
+            return
+        if await run_in_threadpool(_set_job_status, job_id, 'running') == 'cancelled':
+            return
+
+        handler = JOB_HANDLERS[job.kind]
+        options = job.options or {}
+        items = await run_in_threadpool(_pending_items, job_id)
+        semaphore = asyncio.Semaphore(resolve_concurrency(options.get('concurrency', self.item_concurrency)))
+        cancelled = False
+
+        async def run_item(item):
+            nonlocal cancelled
+            async with semaphore:
+                if cancelled:
+                    return
+                current = await run_in_threadpool(_load_job, job_id)
+                if current.status == 'cancelled':
+                    cancelled = True
+                    return
+                await run_in_threadpool(_save_item, item.id, 'running')
+                try:
+                    result = await handler(item, options)
+                    await run_in_threadpool(_save_item, item.id, 'done', result)
+                except Exception as e:
+                    traceback.print_exc()
+                    await run_in_threadpool(_save_item, item.id, 'failed', None, str(e))
+
+        await asyncio.gather(*(run_item(item) for item in items))
+        if not cancelled:
+            await run_in_threadpool(_set_job_status, job_id, 'completed')
+
+
+job_queue = JobQueue()
@@ -0,0 +1,422 @@
+"""
+SERP Hawk lead pipeline: scrape -> analyze -> match services -> draft emails -> image.
+Shared by the /generate and /draft-lead routes.
+"""
+import os
+import asyncio
+import traceback
+
+from fastapi.concurrency import run_in_threadpool
+
+from modules.scraper import scrape_website_detailed
+from modules.crawler import crawl_website_detailed, SCRAPER_CRAWL
+from modules.contact_extractor import is_confident, to_analysis_contacts
+from modules.llm_engine import analyze_content
+from modules.market_analyzer import analyze_market, match_services
+from modules.serp_hawk_email import generate_serp_hawk_email
+from modules.fallback_analyzer import analyze_company_name_fallback
+from modules.image_generator import generate_email_image
+from modules.fused_analyzer import analyze_fused, FUSED_ANALYSIS
+from modules.singleflight import singleflight
+from modules.company_intel import load_intel, save_intel
+
+# How many URLs of one /generate batch are processed at the same time
+GENERATE_CONCURRENCY = int(os.getenv("GENERATE_CONCURRENCY", 5))
+MAX_GENERATE_CONCURRENCY = int(os.getenv("MAX_GENERATE_CONCURRENCY", 20))
+
+
+def normalize_url(url):
+    """Lower-cased URL with an https:// scheme if none was given"""
+    normalized_url = url.strip().lower()
+    if not normalized_url.startswith(('http://', 'https://')):
+        normalized_url = 'https://' + normalized_url
+    return normalized_url
+
+
+def derive_company_name(url):
+    """Best-effort company name from a URL, e.g. https://www.acme-corp.com -> 'Acme Corp'"""
+    return url.split('//')[-1].split('/')[0].replace('www.', '').split('.')[0].replace('-', ' ').title()
+
+
+def build_fallback_analysis(company_info, company_name):
+    """
+    Builds market_analysis and service_matches from a name-only fallback analysis,
+    used when the website could not be scraped.
+    """
+    # IMPORTANT: inject company_name so the email generator doesn't default to 'your company'
+    company_info['company_name'] = company_name
+    company_info.setdefault('contacts', [])
+
+    market_analysis = {
+        'industry': company_info.get('likely_industry', 'Unknown'),
+        'sub_category': company_info.get('sub_category', ''),
+        'business_model': company_info.get('business_model', 'B2B'),
+        'pain_points': company_info.get('common_pain_points', ['Lead Generation', 'Online Visibility']),
+        'growth_potential': 'High',
+        'online_presence': {'seo_status': 'Needs improvement'}
+    }
+    # Build dynamic service recommendations from AI knowledge
+    growth_opps = company_info.get('growth_opportunities', [])
+    recommended_services = []
+    for opp in growth_opps[:3]:
+        recommended_services.append({
+            'service_name': opp,
+            'why_relevant': f"Based on {company_info.get('likely_industry', 'industry')} dynamics and {company_name}'s market position",
+            'expected_impact': 'Increased organic visibility, traffic and qualified leads'
+        })
+    if not recommended_services:
+        recommended_services = [
+            {'service_name': 'Organic SEO', 'why_relevant': 'Improve online visibility and search rankings', 'expected_impact': 'More qualified leads from search'},
+            {'service_name': 'Local SEO', 'why_relevant': 'Dominate local search results', 'expected_impact': 'Increased local customer acquisition'}
+        ]
+    service_matches = {
+        'recommended_services': recommended_services,
+        'email_hook': f'Growth opportunities for {company_info.get("likely_industry", "your business")}',
+        'package_suggestion': 'Growth'
+    }
+    return market_analysis, service_matches
+
+
+def _draft_fields(draft):
+    return {
+        'subject': draft.get('subject'),
+        'body': draft.get('body', draft.get('body_html', '')),
+        'english_body': draft.get('english_body', ''),
+        'spanish_body': draft.get('spanish_body', ''),
+        'throttled': draft.get('throttled', False),
+    }
+
+
+async def scrape_site(url, crawl=None):
+    """
+    Single-page scrape, or a multi-page crawl of the likely contact pages when crawl=True
+    (SCRAPER_CRAWL when crawl is None). Both return {'content', 'emails', 'contacts'}.
+    Concurrent calls for the same URL share one scrape.
+    """
+    use_crawl = SCRAPER_CRAWL if crawl is None else crawl
+    key = ("scrape", normalize_url(url), use_crawl)
+    if use_crawl:
+        return await singleflight.do(key, crawl_website_detailed, url)
+    return await singleflight.do(key, scrape_website_detailed, url)
+
+
+def local_contacts_for(scraped):
+    """
+    Contacts from the page's structured markup when they are reliable enough to skip
+    LLM contact extraction (see modules/contact_extractor.py), else None.
+    """
+    local = scraped.get('contacts')
+    if not is_confident(local):
+        return None
+    contacts = to_analysis_contacts(local)
+    print(f"Using {len(contacts)} locally extracted contacts; skipping LLM contact extraction")
+    return contacts
+
+
+async def run_analysis_stages(scraped_text, company_name, fused=None, contacts=None):
+    """
+    Stage graph for one scraped site:
+
+        analyze_content --+
+                          +--> match_services
+        analyze_market ---+
+
+    Company and market analysis only share the scraped text (market analysis takes the
+    company name from the request or URL), so they run concurrently.
+    In fused mode (fused=True, or FUSED_ANALYSIS when fused is None) all three stages are
+    answered by a single structured-output call instead.
+    `contacts` (locally extracted) are used as-is and left out of the prompt.
+    Returns (company_info, market_analysis, service_matches).
+    """
+    use_fused = FUSED_ANALYSIS if fused is None else fused
+    if use_fused:
+        return await analyze_fused(scraped_text, company_name, contacts)
+
+    company_info, market_analysis = await asyncio.gather(
+        analyze_content(scraped_text, contacts),
+        analyze_market(scraped_text, company_name),
+    )
+    service_matches = await match_services(market_analysis, company_info)
+    return company_info, market_analysis, service_matches
+
+
+async def analyze_site(url, scraped, company_name, fused=None, crawl=None):
+    """
+    run_analysis_stages for a scraped site. Concurrent requests for the same URL,
+    company name and options share one analysis.
+    """
+    use_fused = FUSED_ANALYSIS if fused is None else fused
+    use_crawl = SCRAPER_CRAWL if crawl is None else crawl
+    key = ("analysis", normalize_url(url), company_name, use_fused, use_crawl)
+    return await singleflight.do(
+        key, run_analysis_stages, scraped['content'], company_name, use_fused, local_contacts_for(scraped)
+    )
+
+
+async def analyze_name_fallback(company_name):
+    """analyze_company_name_fallback, shared by concurrent requests for the same company"""
+    return await singleflight.do(("fallback", company_name), analyze_company_name_fallback, company_name)
+
+
+async def draft_emails_for_contacts(company_info, market_analysis, service_matches, contacts):
+    """
+    Generates the outreach (offering) and inbound (requesting) drafts for every contact
+    concurrently. With no contacts a single 'General' pair is drafted.
+    """
+    async def draft_pair(contact):
+        outreach_draft, inbound_draft = await asyncio.gather(
+            generate_serp_hawk_email(company_info, market_analysis, service_matches, contact, "outreach"),
+            generate_serp_hawk_email(company_info, market_analysis, service_matches, contact, "inbound"),
+        )
+        return {
+            'to_email': contact.get('email', '') if contact else '',
+            'recipient_name': contact.get('name') if contact else 'General',
+            'role': contact.get('role') if contact else 'N/A',
+            'outreach': _draft_fields(outreach_draft),
+            'inbound': _draft_fields(inbound_draft)
+        }
+
+    return list(await asyncio.gather(*(draft_pair(contact) for contact in (contacts or [None]))))
+
+
+def was_throttled(*results):
+    """True when any stage fell back because the OpenAI rate limit was hit (not a real error)"""
+    return any(bool(r and r.get('throttled')) for r in results)
+
+
+async def _emit(on_progress, stage, url):
+    if on_progress is not None:
+        await on_progress({'stage': stage, 'url': url})
+
+
+async def analyze_prospect(url, company_name, fused=None, crawl=None, refresh=False, on_progress=None):
+    """
+    Scrape + analysis for one prospect, served from the company intelligence store
+    (modules/company_intel.py) when a fresh entry exists for its domain and refresh is false.
+    New analyses are stored for the next request. When the site cannot be scraped the
+    name-only fallback analysis is used.
+    Returns (company_info, market_analysis, service_matches, intel) where intel is
+    {'cached', 'source', 'version', 'analyzed_at', 'scrape_error'}.
+    """
+    if not refresh:
+        intel = await run_in_threadpool(load_intel, url)
+        if intel is not None:
+            print(f"Using stored company intelligence for {intel['domain']} (v{intel['version']})")
+            await _emit(on_progress, 'scraped', url)
+            meta = {'cached': True, 'source': intel['source'], 'version': intel['version'],
+                    'analyzed_at': intel['analyzed_at'], 'scrape_error': None}
+            return intel['company_info'], intel['market_analysis'], intel['service_matches'], meta
+
+    # Step 1: Scrape
+    try:
+        scraped = await scrape_site(url, crawl)
+        scraped_text = scraped['content']
+        has_error = not scraped_text or "ERROR SCRAPING" in scraped_text.upper()
+    except Exception as e:
+        print(f"Exception during scraping {url}: {e}")
+        scraped = {}
+        scraped_text = f"ERROR SCRAPING: {str(e)}"
+        has_error = True
+    await _emit(on_progress, 'scraped', url)
+
+    if has_error:
+        company_info = await analyze_name_fallback(company_name)
+        company_name = company_info.get('company_name', company_name)
+        market_analysis, service_matches = build_fallback_analysis(company_info, company_name)
+        source = 'fallback'
+    else:
+        # Steps 2-4: Analyze company, market & match services
+        company_info, market_analysis, service_matches = await analyze_site(
+            url, scraped, company_name, fused, crawl
+        )
+        company_name = company_info.get('company_name', company_name)
+        source = 'website'
+
+    version = await run_in_threadpool(
+        save_intel, url, company_name, company_info, market_analysis, service_matches, source
+    )
+    meta = {'cached': False, 'source': source, 'version': version, 'analyzed_at': None,
+            'scrape_error': scraped_text if has_error else None}
+    return company_info, market_analysis, service_matches, meta
+
+
+async def process_generate_url(url, fused=None, on_progress=None, crawl=None, refresh=False):
+    """
+    Complete SERP Hawk outreach workflow for a single URL:
+    1. Scrape website
+    2. Analyze company
+    3. Analyze market & competitors
+    4. Match services
+    5. Generate email
+    6. Create image
+    `on_progress`, if given, is awaited with {'stage', 'url'} as each step completes.
+    `crawl` also fetches the site's contact/about/team pages (see modules/crawler.py).
+    Steps 1-4 are skipped when the domain has fresh stored intelligence, unless `refresh`.
+    """
+    print(f"Processing: {url}")
+
+    # Steps 1-4: Scrape, analyze company, market & match services
+    company_info, market_analysis, service_matches, intel = await analyze_prospect(
+        url, derive_company_name(url), fused, crawl, refresh, on_progress
+    )
+    scrape_error = intel['scrape_error']
+    company_name = company_info.get('company_name', 'Unknown Company')
+    await _emit(on_progress, 'analyzed', url)
+
+    # Step 5: Generate outreach + inbound emails for every contact at once
+    contacts = company_info.get('contacts', [])
+    generated_emails = await draft_emails_for_contacts(
+        company_info, market_analysis, service_matches, contacts
+    )
+    await _emit(on_progress, 'drafted', url)
+
+    # Step 6: Generate beautiful email image
+    services = service_matches.get('recommended_services', [])
+
+    safe_company_name = "".join(c for c in company_name if c.isalnum() or c in (' ', '-', '_')).strip()
+    safe_company_name = safe_company_name.replace(' ', '_')[:50]
+
+    image_filename = f"{safe_company_name}_email_image.html"
+    image_path = os.path.join('static', 'generated_images', image_filename)
+
+    generated_image = await run_in_threadpool(
+        generate_email_image,
+        company_name, services, image_path
+    )
+
+    return {
+        'url': url,
+        'analysis': {
+            'company_name': company_name,
+            'what_they_do': company_info.get('summary', 'Analysis available'),
+            'contacts': contacts,
+            'error': scrape_error
+        },
+        'intelligence': intel,
+        'throttled': was_throttled(
+            company_info, market_analysis, service_matches,
+            *(e[kind] for e in generated_emails for kind in ('outreach', 'inbound'))
+        ),
+        'emails': generated_emails,
+        'recommended_services': ", ".join([s.get('service_name', '') for s in services]) if services else None,
+        'image_url': f'/static/generated_images/{image_filename}' if generated_image else None,
+        'error': scrape_error
+    }
+
+
+async def build_lead_draft(company_name, normalized_url, primary_email, fused=None, crawl=None, refresh=False):
+    """
+    /draft-lead workflow for one prospect: scrape, analyze and draft a single outreach email.
+    Stored company intelligence is reused unless `refresh` (see analyze_prospect).
+    Returns the draft dict (subject, body, company_name, website_url, primary_email, recommended_services, intelligence).
+    """
+    print(f"Analyzing {normalized_url} for personalization...")
+
+    # Scrape & Analyze (name-only fallback when the site can't be scraped)
+    company_info, market_analysis, service_matches, intel = await analyze_prospect(
+        normalized_url, company_name, fused, crawl, refresh
+    )
+
+    subject = f"Partnership Opportunity with {company_name}"
+    body_html = f"<p>Hi {company_name} Team,</p><p>We'd love to partner.</p>"
+
+    # Extract dynamically found primary email from AI contacts if available
+    ai_extracted_email = None
+    if company_info and company_info.get("contacts"):
+        for c in company_info["contacts"]:
+            if c.get("email") and "@" in c["email"]:
+                ai_extracted_email = c["email"]
+                break
+
+    # Determine the best email to use
+    final_email = ai_extracted_email or primary_email or ""
+
+    contact = {'name': company_name, 'email': final_email, 'role': 'Decision Maker'}
+    email_draft = await generate_serp_hawk_email(
+        company_info, market_analysis, service_matches, contact
+    )
+
+    if email_draft:
+        subject = email_draft.get('subject', subject)
+        body_html = email_draft.get('body_html', body_html)
+
+    # Get services string
+    services = service_matches.get('recommended_services', [])
+    service_names = [s.get('service_name') for s in services]
+    recommended_services_str = ", ".join(service_names) if service_names else None
+
+    return {
+        'subject': subject,
+        'body': body_html,
+        'company_name': company_name,
+        'website_url': normalized_url,
+        'primary_email': final_email, # Return the dynamically extracted email
+        'recommended_services': recommended_services_str,
+        'throttled': was_throttled(company_info, market_analysis, service_matches, email_draft),
+        'intelligence': intel
+    }
+
+
+def resolve_concurrency(requested=None):
+    """Clamp a client-requested concurrency to [1, MAX_GENERATE_CONCURRENCY]"""
+    try:
+        value = int(requested) if requested is not None else GENERATE_CONCURRENCY
+    except (TypeError, ValueError):
+        value = GENERATE_CONCURRENCY
+    return max(1, min(value, MAX_GENERATE_CONCURRENCY))
+
+
+async def _process_guarded(url, semaphore, fused=None, on_progress=None, crawl=None, refresh=False):
+    """process_generate_url under the batch semaphore; errors are reported per URL"""
+    async with semaphore:
+        try:
+            return await process_generate_url(url, fused, on_progress, crawl, refresh)
+        except Exception as e:
+            traceback.print_exc()
+            return {'url': url, 'error': str(e)}
+
+
+async def generate_for_urls(urls, concurrency=None, fused=None, crawl=None, refresh=False):
+    """
+    Runs process_generate_url for every URL as concurrent tasks, at most `concurrency` at a time.
+    Results come back in input order; a failing URL yields {'url', 'error'} without affecting the others.
+    """
+    semaphore = asyncio.Semaphore(resolve_concurrency(concurrency))
+    return await asyncio.gather(*(_process_guarded(url, semaphore, fused, None, crawl, refresh) for url in urls))
+
+
+async def stream_generate(urls, concurrency=None, fused=None, progress=False, crawl=None, refresh=False):
+    """
+    Async generator version of generate_for_urls that yields events as soon as they happen:
+      {'type': 'progress', 'index', 'url', 'stage'}   (only with progress=True)
+      {'type': 'result', 'index', 'result'}           (one per URL, in completion order)
+      {'type': 'done', 'count'}
+    Each result is handed off as soon as it is yielded, so the batch is never held in memory;
+    the event queue holds at most `concurrency` events, so a slow consumer pauses the URL
+    tasks instead of letting finished results pile up.
+    If the consumer goes away (client disconnect), the remaining URL tasks are cancelled.
+    """
+    limit = resolve_concurrency(concurrency)
+    semaphore = asyncio.Semaphore(limit)
+    queue = asyncio.Queue(maxsize=limit)
+
+    async def run_one(index, url):
+        async def on_progress(event):
+            await queue.put({'type': 'progress', 'index': index, **event})
+
+        result = await _process_guarded(url, semaphore, fused, on_progress if progress else None, crawl, refresh)
+        await queue.put({'type': 'result', 'index': index, 'result': result})
+
+    tasks = [asyncio.create_task(run_one(index, url)) for index, url in enumerate(urls)]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await queue.get()
+            if event['type'] == 'result':
+                remaining -= 1
+            yield event
+        yield {'type': 'done', 'count': len(tasks)}
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,161 @@
+"""
+Content-addressed cache for LLM JSON responses.
+
+Entries are keyed by a SHA-256 of (model, messages, request params), so the same prompt
+over the same scraped text is answered from cache no matter which route asked for it.
+Two layers:
+- in-memory LRU with TTL (per process, fastest)
+- the llm_cache table (survives restarts, shared by every process on the same DB)
+"""
+import os
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session
+
+from database import engine, LLMCacheEntry
+
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1000))
+LLM_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "true").lower() == "true"
+
+
+class LLMCache:
+    """
+    Two-level (memory + database) TTL cache with LRU eviction in memory.
+    """
+
+    def __init__(self, ttl_seconds=LLM_CACHE_TTL_SECONDS, max_entries=LLM_CACHE_MAX_ENTRIES, persist=LLM_CACHE_PERSIST):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.persist = persist
+        self._entries = OrderedDict()  # key -> (expires_at epoch seconds, value)
+        self._lock = threading.Lock()
+        self.stats = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "errors": 0,
+        }
+
+    @staticmethod
+    def make_key(model, messages, **params):
+        """SHA-256 over a canonical JSON encoding of the request"""
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------ memory
+
+    def _memory_get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _memory_put(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    # ---------------------------------------------------------------- database
+
+    def _db_get(self, key):
+        with Session(engine) as session:
+            entry = session.get(LLMCacheEntry, key)
+            if entry is None:
+                return None
+            if entry.expires_at < datetime.utcnow():
+                session.delete(entry)
+                session.commit()
+                return None
+            return json.loads(entry.response), entry.expires_at
+
+    def _db_put(self, key, model, value, expires_at):
+        with Session(engine) as session:
+            entry = session.get(LLMCacheEntry, key)
+            if entry is None:
+                entry = LLMCacheEntry(key=key, model=model, response="", expires_at=expires_at)
+            entry.response = json.dumps(value)
+            entry.created_at = datetime.utcnow()
+            entry.expires_at = expires_at
+            session.add(entry)
+            session.commit()
+
+    # ------------------------------------------------------------------ public
+
+    async def get(self, key):
+        """Returns a copy of the cached value, or None on a miss"""
+        value = self._memory_get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return copy.deepcopy(value)
+
+        if self.persist:
+            try:
+                found = await run_in_threadpool(self._db_get, key)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"LLM cache read error: {e}")
+                found = None
+            if found is not None:
+                value, expires_at = found
+                remaining = (expires_at - datetime.utcnow()).total_seconds()
+                self._memory_put(key, value, time.time() + remaining)
+                self.stats["db_hits"] += 1
+                return copy.deepcopy(value)
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key, model, value):
+        """Stores a value in memory and (if enabled) in the database"""
+        self._memory_put(key, copy.deepcopy(value), time.time() + self.ttl_seconds)
+        self.stats["stores"] += 1
+        if self.persist:
+            expires_at = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+            try:
+                await run_in_threadpool(self._db_put, key, model, value, expires_at)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"LLM cache write error: {e}")
+
+    def clear_memory(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        """Hit/miss counters for the /metrics/llm-cache endpoint"""
+        hits = self.stats["memory_hits"] + self.stats["db_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "persistent": self.persist,
+        }
+
+
+llm_cache = LLMCache()
@@ -1,63 +1,58 @@
-import os
-from openai import OpenAI
 import json
+from modules.openai_client import chat_json, create_completion, is_throttled
+from modules.prompt_budget import fit_text
+
+CONTACTS_FIELD = """
+            "contacts": [
+                {
+                    "name": "Full Name",
+                    "role": "Job Title",
+                    "email": "Email address if found, else null",
+                    "context": "Any specific context or null"
+                }
+            ],"""
 
-def get_openai_client():
-    api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not found in environment variables")
-    return OpenAI(api_key=api_key)
 
-def analyze_content(text):
+async def analyze_content(text, contacts=None):
     """
     Analyzes website text using OpenAI.
+    If `contacts` were already extracted locally (modules/contact_extractor.py), the model is
+    not asked for them and they are returned as the result's contacts.
     """
     try:
-        client = get_openai_client()
+        contacts_field = CONTACTS_FIELD if contacts is None else ""
         prompt = f"""
         Analyze the following website content and return a JSON object with this exact structure:
         {{
             "company_name": "Name of the company",
-            "what_they_do": "Brief summary of their business (2-3 sentences)",
-            "contacts": [
-                {{
-                    "name": "Full Name",
-                    "role": "Job Title",
-                    "email": "Email address if found, else null",
-                    "context": "Any specific context or null"
-                }}
-            ],
+            "what_they_do": "Brief summary of their business (2-3 sentences)",{contacts_field}
             "key_value_props": ["prop1", "prop2"]
         }}
 
         Website Content:
-        {text[:15000]}
+        {fit_text(text, "analyze_content")}
         """
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-
-        result = json.loads(response.choices[0].message.content)
+        result = await chat_json([{"role": "user", "content": prompt}], cache=True, stage="analyze_content")
+        if contacts is not None:
+            result["contacts"] = contacts
         return result
     except Exception as e:
         print(f"Error in OpenAI analysis: {e}")
         return {
             "company_name": "Unknown",
             "what_they_do": "Analysis failed",
-            "contacts": [],
-            "error": str(e)
+            "contacts": contacts or [],
+            "error": str(e),
+            "throttled": is_throttled(e)
         }
 
-def generate_email(analysis, contact=None):
+async def generate_email(analysis, contact=None):
     """
     Generates a personalized bilingual cold email using OpenAI.
     Returns english_body (para 1) and spanish_body (para 2) separately.
     """
     try:
-        client = get_openai_client()
         recipient_info = f"Recipient: {contact.get('name')} ({contact.get('role')})" if contact else "General Inbox"
 
         prompt = f"""
@@ -78,26 +73,19 @@ def generate_email(analysis, contact=None):
         }}
         """
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-
-        result = json.loads(response.choices[0].message.content)
+        result = await chat_json([{"role": "user", "content": prompt}], stage="generate_email")
         # Ensure backward compatibility with 'body' key
         result["body"] = result.get("english_body", "") + "\n\n" + result.get("spanish_body", "")
         return result
     except Exception as e:
-        return {"subject": "Error", "english_body": str(e), "spanish_body": "", "body": str(e)}
+        return {"subject": "Error", "english_body": str(e), "spanish_body": "", "body": str(e), "throttled": is_throttled(e)}
 
-def analyze_document(image_bytes):
+async def analyze_document(image_bytes):
     """
     Analyzes a business card or ID card image using GPT-4o Vision and returns extracted JSON.
     Tries gpt-4o-mini first, falls back to gpt-4o on failure.
     """
     import base64
-    client = get_openai_client()
     base64_image = base64.b64encode(image_bytes).decode('utf-8')
 
     print(f"OCR: Received image, size={len(image_bytes)} bytes")
@@ -136,7 +124,8 @@ def analyze_document(image_bytes):
     for model in ["gpt-4o-mini", "gpt-4o"]:
         try:
             print(f"OCR: Trying model {model}...")
-            response = client.chat.completions.create(
+            response = await create_completion(
+                "analyze_document",
                 model=model,
                 messages=[
                     {
@@ -181,6 +170,7 @@ def analyze_document(image_bytes):
                     "company_name": "",
                     "mobile": "",
                     "email": "",
-                    "website": ""
+                    "website": "",
+                    "throttled": is_throttled(e)
                 }
             continue
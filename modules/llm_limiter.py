@@ -0,0 +1,201 @@
+"""
+Adaptive (AIMD) concurrency limiter and rate-limit budget shared by every OpenAI call.
+
+- Concurrency: the number of calls in flight grows by LLM_AIMD_INCREASE / limit per
+  successful call (about +1 per round of calls) and is multiplied by LLM_AIMD_DECREASE on
+  a 429, at most once per LLM_AIMD_COOLDOWN seconds, so throughput settles just under
+  the account limit.
+- Budget: the x-ratelimit-remaining-requests / -tokens headers of every response are
+  tracked; when the remaining requests or tokens (minus what is already in flight) run
+  out, new calls wait for the reset time the headers announce instead of hitting a 429.
+- Retries: the SDK's own retries are disabled; create_completion retries 429s, timeouts,
+  connection errors and 5xx with full-jitter exponential backoff, honouring Retry-After.
+"""
+import os
+import re
+import time
+import random
+import asyncio
+
+LLM_CONCURRENCY_START = float(os.getenv("LLM_CONCURRENCY_START", 8))
+LLM_CONCURRENCY_MIN = float(os.getenv("LLM_CONCURRENCY_MIN", 1))
+LLM_CONCURRENCY_MAX = float(os.getenv("LLM_CONCURRENCY_MAX", 64))
+LLM_AIMD_INCREASE = float(os.getenv("LLM_AIMD_INCREASE", 1))
+LLM_AIMD_DECREASE = float(os.getenv("LLM_AIMD_DECREASE", 0.5))
+LLM_AIMD_COOLDOWN = float(os.getenv("LLM_AIMD_COOLDOWN", 2))
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 30))
+
+# Completion tokens assumed per call when max_tokens is not set
+DEFAULT_COMPLETION_TOKENS = 600
+CHARS_PER_TOKEN = 4
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_SECONDS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def parse_reset(value):
+    """Seconds in an x-ratelimit-reset-* header ('1s', '6m0s', '20ms'), or None"""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_SECONDS[unit] for amount, unit in parts)
+
+
+def retry_after_seconds(headers):
+    """Server-requested delay from Retry-After / retry-after-ms, or None"""
+    if headers is None:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        return None
+    return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff for the given retry (1-based), at least Retry-After"""
+    cap = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** (attempt - 1)))
+    return max(retry_after or 0, random.uniform(0, cap))
+
+
+def estimate_request_tokens(kwargs):
+    """Rough token cost of a chat request (prompt chars / 4 + expected completion)"""
+    chars = 0
+    for message in kwargs.get('messages') or []:
+        content = message.get('content')
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            chars += sum(len(part.get('text', '')) for part in content if isinstance(part, dict))
+    completion = kwargs.get('max_tokens') or kwargs.get('max_completion_tokens') or DEFAULT_COMPLETION_TOKENS
+    return chars // CHARS_PER_TOKEN + completion
+
+
+class AIMDLimiter:
+    def __init__(self, initial=LLM_CONCURRENCY_START, minimum=LLM_CONCURRENCY_MIN, maximum=LLM_CONCURRENCY_MAX):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.inflight = 0
+        self.reserved_tokens = 0
+        self.remaining_requests = None
+        self.remaining_tokens = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self.pause_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = None
+        self.stats = {"successes": 0, "throttled": 0, "decreases": 0, "budget_waits": 0}
+
+    def _cond(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _budget_wait(self, now, tokens):
+        """Seconds to wait before the rate-limit budget allows another call"""
+        waits = [self.pause_until - now]
+        if self.remaining_requests is not None and self.requests_reset_at > now:
+            if self.remaining_requests - self.inflight <= 0:
+                waits.append(self.requests_reset_at - now)
+        if self.remaining_tokens is not None and self.tokens_reset_at > now:
+            if self.remaining_tokens - self.reserved_tokens < tokens:
+                waits.append(self.tokens_reset_at - now)
+        return max(waits)
+
+    async def acquire(self, tokens=0):
+        cond = self._cond()
+        async with cond:
+            waited = False
+            while True:
+                wait = self._budget_wait(time.monotonic(), tokens)
+                if wait <= 0 and self.inflight < max(1, int(self.limit)):
+                    break
+                if wait > 0:
+                    waited = True
+                    try:
+                        await asyncio.wait_for(cond.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await cond.wait()
+            if waited:
+                self.stats["budget_waits"] += 1
+            self.inflight += 1
+            self.reserved_tokens += tokens
+
+    async def release(self, tokens=0):
+        cond = self._cond()
+        async with cond:
+            self.inflight -= 1
+            self.reserved_tokens -= tokens
+            cond.notify_all()
+
+    def on_success(self):
+        """Additive increase: about +LLM_AIMD_INCREASE per full round of calls"""
+        self.stats["successes"] += 1
+        self.limit = min(self.maximum, self.limit + LLM_AIMD_INCREASE / max(self.limit, 1))
+
+    def on_throttled(self, retry_after=None):
+        """Multiplicative decrease on a 429 (once per cooldown), plus a pause if the server asked for one"""
+        now = time.monotonic()
+        self.stats["throttled"] += 1
+        if now - self._last_decrease >= LLM_AIMD_COOLDOWN:
+            self.limit = max(self.minimum, self.limit * LLM_AIMD_DECREASE)
+            self._last_decrease = now
+            self.stats["decreases"] += 1
+        if retry_after:
+            self.pause_until = max(self.pause_until, now + retry_after)
+
+    def update_from_headers(self, headers):
+        """Tracks the remaining request/token budget announced by the x-ratelimit-* headers"""
+        now = time.monotonic()
+        try:
+            if headers.get('x-ratelimit-remaining-requests') is not None:
+                self.remaining_requests = int(headers['x-ratelimit-remaining-requests'])
+                self.requests_reset_at = now + (parse_reset(headers.get('x-ratelimit-reset-requests')) or 0)
+            if headers.get('x-ratelimit-remaining-tokens') is not None:
+                self.remaining_tokens = int(headers['x-ratelimit-remaining-tokens'])
+                self.tokens_reset_at = now + (parse_reset(headers.get('x-ratelimit-reset-tokens')) or 0)
+        except ValueError:
+            pass
+
+    def snapshot(self):
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+            **self.stats,
+        }
+
+    def prometheus(self):
+        lines = [
+            "# HELP llm_concurrency_limit Current adaptive limit on concurrent LLM calls",
+            "# TYPE llm_concurrency_limit gauge",
+            f"llm_concurrency_limit {self.limit:.2f}",
+            "# HELP llm_inflight LLM calls currently in flight",
+            "# TYPE llm_inflight gauge",
+            f"llm_inflight {self.inflight}",
+            "# HELP llm_throttled_total 429 responses received",
+            "# TYPE llm_throttled_total counter",
+            f"llm_throttled_total {self.stats['throttled']}",
+            "# HELP llm_budget_waits_total Calls delayed to stay within the rate-limit budget",
+            "# TYPE llm_budget_waits_total counter",
+            f"llm_budget_waits_total {self.stats['budget_waits']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+llm_limiter = AIMDLimiter()
@@ -0,0 +1,182 @@
+"""
+Per-call LLM telemetry: latency, token usage, retries and estimated cost per stage.
+
+Every chat completion goes through modules.openai_client.create_completion, which
+records one sample here per call. The data is exposed as Prometheus text (/metrics)
+and as a JSON summary with latency percentiles (/metrics/llm).
+"""
+import os
+import json
+import math
+import threading
+from collections import deque
+
+# USD per 1M tokens: (input, cached input, output). Override with LLM_PRICES='{"model": [in, cached, out]}'
+LLM_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+}
+LLM_PRICES.update({model: tuple(prices) for model, prices in json.loads(os.getenv("LLM_PRICES", "{}")).items()})
+
+# Latency samples kept per stage/model for the percentiles
+LLM_TELEMETRY_WINDOW = int(os.getenv("LLM_TELEMETRY_WINDOW", 1000))
+
+# Histogram buckets (seconds) for the Prometheus latency metric
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13, 21, 34, 60)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    """Estimated USD cost of one call; 0 for models without a price"""
+    prices = LLM_PRICES.get(model)
+    if prices is None:
+        # Dated snapshots (gpt-4o-mini-2024-07-18) are priced like their base model
+        prices = next((p for name, p in LLM_PRICES.items() if model.startswith(name + "-")), None)
+    if prices is None:
+        return 0.0
+    input_price, cached_price, output_price = prices
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class _Series:
+    """Counters for one (stage, model) pair"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cost_usd = 0.0
+        self.latency_sum = 0.0
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.latencies = deque(maxlen=LLM_TELEMETRY_WINDOW)
+        self.error_types = {}
+
+
+class LLMTelemetry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._cache_hits = {}
+
+    def record(self, stage, model, latency, usage=None, retries=0, error=None):
+        """One finished call. `usage` is the response's usage object (None on errors)."""
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+
+        with self._lock:
+            series = self._series.setdefault((stage, model), _Series())
+            series.calls += 1
+            series.retries += retries
+            if error:
+                series.errors += 1
+                series.error_types[error] = series.error_types.get(error, 0) + 1
+            series.prompt_tokens += prompt_tokens
+            series.completion_tokens += completion_tokens
+            series.cached_tokens += cached_tokens
+            series.cost_usd += estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+            series.latency_sum += latency
+            series.latencies.append(latency)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    series.bucket_counts[i] += 1
+
+    def record_cache_hit(self, stage):
+        with self._lock:
+            self._cache_hits[stage] = self._cache_hits.get(stage, 0) + 1
+
+    def summary(self):
+        """
+        JSON-friendly per-stage summary with p50/p95/p99 latency (seconds). Cache hits make
+        no call, so they are counted per stage (cache_hits), not per stage/model series.
+        """
+        with self._lock:
+            stages = []
+            totals = {"calls": 0, "errors": 0, "retries": 0, "prompt_tokens": 0,
+                      "completion_tokens": 0, "cached_tokens": 0, "cost_usd": 0.0}
+            for (stage, model), s in sorted(self._series.items()):
+                latencies = sorted(s.latencies)
+                stages.append({
+                    "stage": stage,
+                    "model": model,
+                    "calls": s.calls,
+                    "errors": s.errors,
+                    "error_types": dict(s.error_types),
+                    "retries": s.retries,
+                    "latency_avg": round(s.latency_sum / s.calls, 4) if s.calls else None,
+                    "latency_p50": percentile(latencies, 50),
+                    "latency_p95": percentile(latencies, 95),
+                    "latency_p99": percentile(latencies, 99),
+                    "prompt_tokens": s.prompt_tokens,
+                    "completion_tokens": s.completion_tokens,
+                    "cached_tokens": s.cached_tokens,
+                    "cost_usd": round(s.cost_usd, 6),
+                })
+                for key in totals:
+                    totals[key] += getattr(s, key)
+            totals["cost_usd"] = round(totals["cost_usd"], 6)
+            totals["cache_hits"] = sum(self._cache_hits.values())
+            return {"stages": stages, "cache_hits": dict(sorted(self._cache_hits.items())),
+                    "totals": totals, "window": LLM_TELEMETRY_WINDOW}
+
+    def prometheus(self):
+        """Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            items = sorted(self._series.items())
+
+            metric("llm_requests_total", "counter", "LLM calls by stage, model and outcome")
+            for (stage, model), s in items:
+                labels = f'stage="{stage}",model="{model}"'
+                lines.append(f'llm_requests_total{{{labels},status="ok"}} {s.calls - s.errors}')
+                lines.append(f'llm_requests_total{{{labels},status="error"}} {s.errors}')
+
+            metric("llm_request_duration_seconds", "histogram", "LLM call latency including retries")
+            for (stage, model), s in items:
+                labels = f'stage="{stage}",model="{model}"'
+                for bound, count in zip(LATENCY_BUCKETS, s.bucket_counts):
+                    lines.append(f'llm_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'llm_request_duration_seconds_bucket{{{labels},le="+Inf"}} {s.calls}')
+                lines.append(f'llm_request_duration_seconds_sum{{{labels}}} {s.latency_sum:.6f}')
+                lines.append(f'llm_request_duration_seconds_count{{{labels}}} {s.calls}')
+
+            metric("llm_tokens_total", "counter", "Tokens used by type (cached is a subset of prompt)")
+            for (stage, model), s in items:
+                labels = f'stage="{stage}",model="{model}"'
+                lines.append(f'llm_tokens_total{{{labels},type="prompt"}} {s.prompt_tokens}')
+                lines.append(f'llm_tokens_total{{{labels},type="completion"}} {s.completion_tokens}')
+                lines.append(f'llm_tokens_total{{{labels},type="cached"}} {s.cached_tokens}')
+
+            metric("llm_retries_total", "counter", "Retries of rate-limited or failed LLM calls")
+            for (stage, model), s in items:
+                lines.append(f'llm_retries_total{{stage="{stage}",model="{model}"}} {s.retries}')
+
+            metric("llm_cost_usd_total", "counter", "Estimated cost in USD")
+            for (stage, model), s in items:
+                lines.append(f'llm_cost_usd_total{{stage="{stage}",model="{model}"}} {s.cost_usd:.6f}')
+
+            metric("llm_cache_hits_total", "counter", "Calls answered from the LLM cache")
+            for stage, hits in sorted(self._cache_hits.items()):
+                lines.append(f'llm_cache_hits_total{{stage="{stage}"}} {hits}')
+
+        return "\n".join(lines) + "\n"
+
+
+llm_telemetry = LLMTelemetry()
@@ -0,0 +1,182 @@
+"""
+Process-wide AsyncOpenAI client shared by every LLM module.
+
+One client means one pooled HTTP connection pool with keep-alive, so repeated calls
+reuse TLS connections instead of handshaking each time, and no worker thread is tied
+up for the duration of an LLM round trip.
+"""
+import os
+import json
+import time
+import asyncio
+
+import httpx
+from openai import (
+    AsyncOpenAI, DefaultAsyncHttpxClient, RateLimitError,
+    APIConnectionError, APITimeoutError, InternalServerError,
+)
+
+from modules.llm_cache import llm_cache
+from modules.llm_telemetry import llm_telemetry
+from modules.llm_limiter import (
+    llm_limiter, LLM_MAX_RETRIES, backoff_delay, retry_after_seconds, estimate_request_tokens,
+)
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 60))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 50))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", 20))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 60))
+# Batch API endpoint; point it at a local stand-in (e.g. http://localhost:9000/v1) for testing
+OPENAI_BATCH_BASE_URL = os.getenv("OPENAI_BATCH_BASE_URL") or None
+
+_client = None
+_batch_client = None
+
+
+class LLMThrottledError(Exception):
+    """Raised when a call is still rate limited (429) after all retries"""
+
+
+class LLMQuotaError(Exception):
+    """Raised when the account is out of credit (429 insufficient_quota): waiting will not help"""
+
+
+def is_throttled(error):
+    """True when an LLM failure came from rate limiting rather than a real error"""
+    if isinstance(error, RateLimitError) and error.code == 'insufficient_quota':
+        return False
+    return isinstance(error, (LLMThrottledError, RateLimitError))
+
+
+async def _track_rate_limits(response):
+    llm_limiter.update_from_headers(response.headers)
+
+
+def get_openai_client():
+    """
+    Returns the shared AsyncOpenAI client, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        api_key = os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY not found in environment variables")
+        _client = AsyncOpenAI(
+            api_key=api_key,
+            timeout=OPENAI_TIMEOUT,
+            # Retries are done by create_completion so they go through the shared limiter
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                timeout=OPENAI_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+                ),
+                event_hooks={"response": [_track_rate_limits]},
+            ),
+        )
+    return _client
+
+
+def get_batch_client():
+    """
+    AsyncOpenAI client for the Batch API (files + batches), honouring OPENAI_BATCH_BASE_URL.
+    Same as get_openai_client() when no separate base URL is configured.
+    """
+    global _batch_client
+    if OPENAI_BATCH_BASE_URL is None:
+        return get_openai_client()
+    if _batch_client is None:
+        _batch_client = AsyncOpenAI(
+            api_key=os.getenv('OPENAI_BATCH_API_KEY') or os.getenv('OPENAI_API_KEY') or 'local',
+            base_url=OPENAI_BATCH_BASE_URL,
+            timeout=OPENAI_TIMEOUT,
+        )
+    return _batch_client
+
+
+async def close_openai_client():
+    """Closes the shared clients' connection pools (called on app shutdown)"""
+    global _client, _batch_client
+    if _client is not None:
+        await _client.close()
+        _client = None
+    if _batch_client is not None:
+        await _batch_client.close()
+        _batch_client = None
+
+
+async def create_completion(stage, model=DEFAULT_MODEL, **kwargs):
+    """
+    client.chat.completions.create through the shared adaptive limiter (modules/llm_limiter.py),
+    with telemetry: latency, tokens, retries and cost are recorded under `stage`
+    (see modules/llm_telemetry.py).
+    429s, timeouts, connection errors and 5xx are retried with jittered backoff;
+    a call still rate limited after LLM_MAX_RETRIES raises LLMThrottledError.
+    An out-of-credit 429 (insufficient_quota) raises LLMQuotaError at once, without
+    shrinking the limiter's window.
+    """
+    client = get_openai_client()
+    tokens = estimate_request_tokens(kwargs)
+    started = time.perf_counter()
+    retries = 0
+    while True:
+        await llm_limiter.acquire(tokens)
+        try:
+            response = await client.chat.completions.create(model=model, **kwargs)
+        except RateLimitError as e:
+            # Out of credit is a billing failure, not throttling: it is not going to clear up by waiting
+            if e.code == 'insufficient_quota':
+                llm_telemetry.record(stage, model, time.perf_counter() - started, None, retries, 'insufficient_quota')
+                raise LLMQuotaError(f"OpenAI account is out of credit: {e}") from e
+            error = e
+            retry_after = retry_after_seconds(e.response.headers)
+            llm_limiter.on_throttled(retry_after)
+        except (APIConnectionError, APITimeoutError, InternalServerError) as e:
+            error = e
+            retry_after = retry_after_seconds(getattr(getattr(e, 'response', None), 'headers', None))
+        except Exception as e:
+            llm_telemetry.record(stage, model, time.perf_counter() - started, None, retries, type(e).__name__)
+            raise
+        else:
+            llm_limiter.on_success()
+            llm_telemetry.record(stage, model, time.perf_counter() - started, response.usage, retries)
+            return response
+        finally:
+            await llm_limiter.release(tokens)
+
+        if retries >= LLM_MAX_RETRIES:
+            llm_telemetry.record(stage, model, time.perf_counter() - started, None, retries, type(error).__name__)
+            if isinstance(error, RateLimitError):
+                raise LLMThrottledError(f"Rate limited after {retries} retries: {error}") from error
+            raise error
+        retries += 1
+        await asyncio.sleep(backoff_delay(retries, retry_after))
+
+
+async def chat_json(messages, model=DEFAULT_MODEL, cache=False, stage="chat_json", **kwargs):
+    """
+    Runs a JSON-mode chat completion and returns the parsed JSON object.
+    With cache=True the result is served from / stored in the LLM cache (modules/llm_cache.py),
+    keyed by a hash of the model, messages and request params.
+    `stage` labels the call in the LLM telemetry.
+    """
+    kwargs.setdefault("response_format", {"type": "json_object"})
+
+    cache_key = None
+    if cache:
+        cache_key = llm_cache.make_key(model, messages, **kwargs)
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            llm_telemetry.record_cache_hit(stage)
+            return cached
+
+    response = await create_completion(stage, model, messages=messages, **kwargs)
+    result = json.loads(response.choices[0].message.content)
+
+    if cache_key:
+        await llm_cache.set(cache_key, model, result)
+    return result
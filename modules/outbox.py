@@ -0,0 +1,367 @@
+"""
+Durable email outbox.
+
+/send-lead, /send and campaigns (modules/campaigns.py) add OutboxMessage rows in the
+same transaction as their ClientProfile / SentEmail / EmailLog writes and return right
+away; the SMTP work is done here, by a pool of background workers:
+
+- a dispatcher claims due rows (pending, next_attempt_at <= now) and hands them to
+  OUTBOX_WORKERS workers, which send through send_email_outlook in the threadpool
+  (or send_email_outlook_async on the asyncio SMTP transport with SMTP_ASYNC_ENABLED=true),
+  reusing the pooled SMTP connections and the background Sent-folder appender
+- failures are retried with exponential backoff up to OUTBOX_MAX_ATTEMPTS; refused
+  recipients fail at once
+- each result is reported to the sender pool (modules/sender_pool.py); a message whose
+  sender was taken out of rotation is moved to a healthy sender with free capacity, or
+  waits (without using an attempt) until one has room or its sender is back
+- on final failure the prospect is marked as not contacted again (Company.email_sent_status,
+  ClientProfile outbound/inbound flags) and an activity is logged
+
+Rows left 'sending' by a crashed process are retried on startup, so delivery is
+at-least-once. Passwords are only kept in memory (register_account).
+"""
+import os
+import asyncio
+import smtplib
+import traceback
+from datetime import datetime, timedelta
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
+from sqlmodel import Session, select, func
+
+from database import engine, OutboxMessage, Company, ClientProfile, ActivityLog, EmailLog
+from modules.email_sender import send_email_outlook, send_email_outlook_async
+from modules.async_smtp import SMTP_ASYNC_ENABLED
+from modules.sender_pool import sender_pool
+from modules.send_limiter import send_limiter, HOUR_SECONDS
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 4))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", 30))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", 5))
+
+# Errors that retrying will not fix
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused,)
+
+
+def queue_email(session, to_email, subject, body, sender_email, smtp_server, smtp_port,
+                imap_server=None, cc_emails=None, html=True, kind="send", client_id=None, company_id=None,
+                email_log_id=None):
+    """
+    Adds an OutboxMessage to the caller's session (committed with the caller's other writes).
+    Call outbox.notify() after the commit so a worker picks it up immediately.
+    """
+    message = OutboxMessage(
+        kind=kind,
+        to_email=to_email,
+        cc_emails=cc_emails,
+        subject=subject,
+        body=body or '',
+        html=html,
+        sender_email=sender_email,
+        smtp_server=smtp_server,
+        smtp_port=int(smtp_port),
+        imap_server=imap_server,
+        client_id=client_id,
+        company_id=company_id,
+        email_log_id=email_log_id,
+    )
+    session.add(message)
+    return message
+
+
+def outbox_dict(message):
+    return {
+        "id": message.id,
+        "kind": message.kind,
+        "to_email": message.to_email,
+        "subject": message.subject,
+        "status": message.status,
+        "attempts": message.attempts,
+        "last_error": message.last_error,
+        "next_attempt_at": message.next_attempt_at.isoformat() if message.status == 'pending' else None,
+        "created_at": message.created_at.isoformat(),
+        "sent_at": message.sent_at.isoformat() if message.sent_at else None,
+    }
+
+
+# ============================================================================
+# DB helpers (sync, run in the threadpool)
+# ============================================================================
+
+def _reset_inflight():
+    """Rows a previous process was sending when it stopped go back to pending"""
+    with Session(engine) as session:
+        result = session.execute(
+            update(OutboxMessage).where(OutboxMessage.status == 'sending').values(status='pending')
+        )
+        session.commit()
+        return result.rowcount
+
+
+def _claim_due(limit):
+    """Marks up to `limit` due pending rows as sending and returns their ids"""
+    now = datetime.utcnow()
+    claimed = []
+    with Session(engine) as session:
+        ids = session.exec(
+            select(OutboxMessage.id)
+            .where(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= now)
+            .order_by(OutboxMessage.next_attempt_at)
+            .limit(limit)
+        ).all()
+        for message_id in ids:
+            # Conditional update: only one claimer wins a row
+            result = session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id == message_id, OutboxMessage.status == 'pending')
+                .values(status='sending')
+            )
+            if result.rowcount:
+                claimed.append(message_id)
+        session.commit()
+    return claimed
+
+
+def _load(message_id):
+    with Session(engine) as session:
+        message = session.get(OutboxMessage, message_id)
+        if message is not None:
+            session.expunge(message)
+        return message
+
+
+def _reassign(message_id, sender):
+    """
+    Moves a message (and the CRM rows that name its sender) to another sender of the pool,
+    then gives back the slot it held on the old sender.
+    """
+    with Session(engine) as session:
+        message = session.get(OutboxMessage, message_id)
+        old_sender = message.sender_email
+        message.sender_email = sender.email
+        message.smtp_server = sender.smtp_server
+        message.smtp_port = sender.smtp_port
+        message.imap_server = sender.imap_server
+        session.add(message)
+        if message.email_log_id is not None:
+            session.execute(
+                update(EmailLog)
+                .where(EmailLog.id == message.email_log_id, EmailLog.sender_email == old_sender)
+                .values(sender_email=sender.email)
+            )
+        if message.company_id is not None:
+            session.execute(
+                update(Company)
+                .where(Company.id == message.company_id, Company.email_sender == old_sender)
+                .values(email_sender=sender.email)
+            )
+        session.commit()
+        created_at = message.created_at
+    # Only a slot still inside the old sender's hourly window is worth giving back
+    if datetime.utcnow() - created_at < timedelta(seconds=HOUR_SECONDS):
+        send_limiter.release(old_sender, 1)
+
+
+def _defer(message_id, seconds):
+    """Puts a claimed message back without counting an attempt"""
+    with Session(engine) as session:
+        message = session.get(OutboxMessage, message_id)
+        message.status = 'pending'
+        message.next_attempt_at = datetime.utcnow() + timedelta(seconds=seconds)
+        session.add(message)
+        session.commit()
+
+
+def _mark_sent(message_id):
+    with Session(engine) as session:
+        message = session.get(OutboxMessage, message_id)
+        message.status = 'sent'
+        message.attempts += 1
+        message.sent_at = datetime.utcnow()
+        message.last_error = None
+        session.add(message)
+        session.commit()
+
+
+def _mark_failed(message_id, error, permanent=False):
+    """Schedules a retry, or gives up and records the failure on the prospect"""
+    with Session(engine) as session:
+        message = session.get(OutboxMessage, message_id)
+        message.attempts += 1
+        message.last_error = error
+        if not permanent and message.attempts < OUTBOX_MAX_ATTEMPTS:
+            message.status = 'pending'
+            message.next_attempt_at = datetime.utcnow() + timedelta(
+                seconds=OUTBOX_RETRY_BASE_SECONDS * 2 ** (message.attempts - 1)
+            )
+            session.add(message)
+            session.commit()
+            return False
+
+        message.status = 'failed'
+        session.add(message)
+        if message.company_id and message.kind in ('outreach', 'send', 'campaign'):
+            company = session.get(Company, message.company_id)
+            if company is not None:
+                company.email_sent_status = False
+                session.add(company)
+        if message.client_id:
+            profile = session.get(ClientProfile, message.client_id)
+            if profile is not None:
+                if message.kind == 'outreach':
+                    profile.outbound_email_sent = False
+                elif message.kind == 'inbound':
+                    profile.inbound_email_sent = False
+                session.add(profile)
+                session.add(ActivityLog(
+                    userId=profile.userId,
+                    clientId=profile.id,
+                    action="Email Delivery Failed",
+                    method="Email",
+                    content=f"Could not deliver '{message.subject}' to {message.to_email} after {message.attempts} attempt(s)",
+                    details=error,
+                ))
+        session.commit()
+        return True
+
+
+def get_outbox_message(message_id):
+    message = _load(message_id)
+    return outbox_dict(message) if message is not None else None
+
+
+def list_outbox(status=None, limit=50):
+    with Session(engine) as session:
+        statement = select(OutboxMessage).order_by(OutboxMessage.id.desc()).limit(limit)
+        if status:
+            statement = statement.where(OutboxMessage.status == status)
+        messages = session.exec(statement).all()
+        counts = session.exec(
+            select(OutboxMessage.status, func.count(OutboxMessage.id)).group_by(OutboxMessage.status)
+        ).all()
+        return {
+            "counts": {s: c for s, c in counts},
+            "messages": [outbox_dict(m) for m in messages],
+        }
+
+
+# ============================================================================
+# Workers
+# ============================================================================
+
+class Outbox:
+    def __init__(self, workers=OUTBOX_WORKERS):
+        self.workers = workers
+        self._passwords = {}  # sender_email -> password (memory only)
+        self._queue = None
+        self._wake = None
+        self._tasks = []
+        self._busy = 0
+
+    def register_account(self, sender_email, password):
+        if sender_email and password:
+            self._passwords[sender_email] = password
+
+    def notify(self):
+        """Wakes the dispatcher (call after committing new outbox rows)"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._wake = asyncio.Event()
+        try:
+            reset = await run_in_threadpool(_reset_inflight)
+            if reset:
+                print(f"Outbox: retrying {reset} message(s) left in flight by the previous process")
+        except Exception as e:
+            print(f"Outbox resume note: {e}")
+        self._tasks = [asyncio.create_task(self._dispatcher())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _dispatcher(self):
+        while True:
+            try:
+                # Claim only what the workers can start now, so retries stay in the DB
+                free = self.workers - self._busy - self._queue.qsize()
+                if free > 0:
+                    for message_id in await run_in_threadpool(_claim_due, free):
+                        self._queue.put_nowait(message_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Outbox dispatcher error: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _worker(self):
+        while True:
+            message_id = await self._queue.get()
+            self._busy += 1
+            try:
+                await self._deliver(message_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._busy -= 1
+                self._queue.task_done()
+                # A finished send frees a worker: let the dispatcher claim the next row
+                self._wake.set()
+
+    async def _deliver(self, message_id):
+        message = await run_in_threadpool(_load, message_id)
+        if message is None:
+            return
+        sender = sender_pool.get(message.sender_email)
+        if sender is not None and not sender.healthy():
+            replacement = await run_in_threadpool(sender_pool.reserve, 1, {sender.email})
+            if replacement is None:
+                await run_in_threadpool(_defer, message_id, OUTBOX_RETRY_BASE_SECONDS)
+                return
+            print(f"Outbox: moving #{message_id} from {sender.email} to {replacement.email}")
+            await run_in_threadpool(_reassign, message_id, replacement)
+            message = await run_in_threadpool(_load, message_id)
+        password = self._passwords.get(message.sender_email)
+        if password is None:
+            await run_in_threadpool(_mark_failed, message_id, f"No credentials configured for {message.sender_email}", True)
+            return
+        try:
+            email = dict(
+                to_email=message.to_email,
+                subject=message.subject,
+                body=message.body,
+                sender_email=message.sender_email,
+                sender_password=password,
+                smtp_server=message.smtp_server,
+                smtp_port=message.smtp_port,
+                html=message.html,
+                cc_emails=message.cc_emails,
+                imap_server=message.imap_server
+            )
+            if SMTP_ASYNC_ENABLED:
+                await send_email_outlook_async(**email)
+            else:
+                await run_in_threadpool(send_email_outlook, **email)
+        except Exception as e:
+            sender_pool.record_failure(message.sender_email, e)
+            gave_up = await run_in_threadpool(_mark_failed, message_id, str(e), isinstance(e, PERMANENT_ERRORS))
+            print(f"Outbox: delivery of #{message_id} to {message.to_email} failed ({e}){'; giving up' if gave_up else '; will retry'}")
+            return
+        sender_pool.record_success(message.sender_email)
+        await run_in_threadpool(_mark_sent, message_id)
+
+
+outbox = Outbox()
@@ -0,0 +1,219 @@
+"""
+Token-aware budgeting of the website text and JSON that go into LLM prompts.
+
+Instead of cutting the input at a fixed number of characters, each stage gets a token
+budget. The text is first cleaned (duplicate lines and cookie/nav/footer boilerplate
+removed); if it still does not fit, the most information-dense lines are kept, in their
+original order, until the budget is full. Tokens are counted with tiktoken (a
+requirement); if it cannot be imported they are estimated at 4 characters per token,
+with a warning.
+"""
+import os
+import re
+import json
+import math
+import logging
+
+from modules.openai_client import DEFAULT_MODEL
+
+logger = logging.getLogger(__name__)
+
+# Set to false to go back to the plain character cut-offs
+PROMPT_BUDGET_ENABLED = os.getenv("PROMPT_BUDGET_ENABLED", "true").lower() == "true"
+
+# Input tokens per stage
+TOKEN_BUDGETS = {
+    "analyze_content": int(os.getenv("TOKEN_BUDGET_ANALYZE_CONTENT", 3000)),
+    "analyze_market": int(os.getenv("TOKEN_BUDGET_ANALYZE_MARKET", 2000)),
+    "fused": int(os.getenv("TOKEN_BUDGET_FUSED", 3000)),
+    "match_services": int(os.getenv("TOKEN_BUDGET_MATCH_SERVICES", 600)),
+}
+# Character cut-offs used when budgeting is disabled (the previous behaviour)
+LEGACY_CHAR_LIMITS = {
+    "analyze_content": 15000,
+    "analyze_market": 10000,
+    "fused": 15000,
+    "match_services": 3000,
+}
+
+CHARS_PER_TOKEN = 4
+# Lines longer than this are split into sentences before ranking
+MAX_LINE_CHARS = 800
+
+# Lines that always stay: the payload header and crawler page markers
+PINNED_PREFIXES = ("Source URL:", "Extracted Emails:", "Website Content:", "--- Page:")
+
+BOILERPLATE_PATTERN = re.compile(
+    r"cookie|accept all|privacy policy|terms (of|and) (use|service|conditions)|all rights reserved|©|"
+    r"copyright \d{4}|skip to (main )?content|newsletter|powered by|toggle navigation|back to top|"
+    r"javascript (is )?(disabled|required)|follow us",
+    re.IGNORECASE,
+)
+# Boilerplate phrases inside a longer paragraph don't make it boilerplate
+BOILERPLATE_MAX_CHARS = 200
+
+EMAIL_HINT = re.compile(r'@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+PHONE_HINT = re.compile(r'\+?\d[\d\s().-]{6,}\d')
+WORD_PATTERN = re.compile(r"[a-zA-Z][a-zA-Z'-]{2,}")
+STOPWORDS = frozenset(
+    "the and for with that this from your our are you was were have has had not but all can will "
+    "more about into they their them its it's what when where who how why which also than then".split()
+)
+
+_encoder = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+        except ImportError as e:
+            print(f"⚠ tiktoken could not be imported ({e}); prompt budgets will estimate tokens as {CHARS_PER_TOKEN} characters each")
+            return None
+        try:
+            _encoder = tiktoken.encoding_for_model(DEFAULT_MODEL)
+        except KeyError:
+            # Model name tiktoken does not know yet
+            _encoder = tiktoken.get_encoding("o200k_base")
+    return _encoder
+
+
+def count_tokens(text):
+    """Tokens in text (tiktoken, or len/4 if it cannot be imported)"""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _split_long(line):
+    if len(line) <= MAX_LINE_CHARS:
+        return [line]
+    parts, current = [], ''
+    for sentence in re.split(r'(?<=[.!?])\s+', line):
+        while len(sentence) > MAX_LINE_CHARS:
+            if current:
+                parts.append(current)
+                current = ''
+            parts.append(sentence[:MAX_LINE_CHARS])
+            sentence = sentence[MAX_LINE_CHARS:]
+        if current and len(current) + 1 + len(sentence) > MAX_LINE_CHARS:
+            parts.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        parts.append(current)
+    return parts
+
+
+def clean_lines(text):
+    """Lines of text without blanks, repeats (case/whitespace-insensitive) and boilerplate"""
+    seen = set()
+    lines = []
+    for raw in text.splitlines():
+        for line in _split_long(raw.strip()):
+            if not line:
+                continue
+            if not line.startswith(PINNED_PREFIXES):
+                key = ' '.join(line.lower().split())
+                if key in seen:
+                    continue
+                seen.add(key)
+                if len(line) <= BOILERPLATE_MAX_CHARS and BOILERPLATE_PATTERN.search(line):
+                    continue
+            lines.append(line)
+    return lines
+
+
+def line_score(line):
+    """
+    Information density of a line: distinct content words, with a bonus for contact
+    details and figures. Divided by the line's tokens when ranking.
+    """
+    words = {w.lower() for w in WORD_PATTERN.findall(line)} - STOPWORDS
+    score = len(words)
+    if EMAIL_HINT.search(line):
+        score += 10
+    if PHONE_HINT.search(line):
+        score += 5
+    if any(c.isdigit() for c in line):
+        score += 1
+    return score
+
+
+def fit_text(text, stage):
+    """
+    Website text for one stage's prompt, within TOKEN_BUDGETS[stage].
+    Logs the tokens saved compared to sending the input whole.
+    """
+    if not text:
+        return text
+    if not PROMPT_BUDGET_ENABLED:
+        return text[:LEGACY_CHAR_LIMITS[stage]]
+
+    budget = TOKEN_BUDGETS[stage]
+    tokens_in = count_tokens(text)
+    lines = clean_lines(text)
+    costs = [count_tokens(line) + 1 for line in lines]
+
+    if sum(costs) <= budget:
+        keep = set(range(len(lines)))
+    else:
+        keep = set()
+        used = 0
+        pinned = [i for i, line in enumerate(lines) if line.startswith(PINNED_PREFIXES)]
+        for i in pinned:
+            keep.add(i)
+            used += costs[i]
+        ranked = sorted(
+            (i for i in range(len(lines)) if i not in keep),
+            key=lambda i: (-line_score(lines[i]) / costs[i], i)
+        )
+        for i in ranked:
+            if used + costs[i] <= budget:
+                keep.add(i)
+                used += costs[i]
+
+    fitted = '\n'.join(line for i, line in enumerate(lines) if i in keep)
+    tokens_out = count_tokens(fitted)
+    logger.info(
+        f"Prompt budget [{stage}]: {tokens_in} -> {tokens_out} tokens "
+        f"(saved {tokens_in - tokens_out}, budget {budget}, kept {len(keep)}/{len(lines)} lines)"
+    )
+    return fitted
+
+
+def _shrink(value, max_items, max_chars):
+    if isinstance(value, dict):
+        return {k: _shrink(v, max_items, max_chars) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_shrink(v, max_items, max_chars) for v in value[:max_items]]
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars].rstrip() + '...'
+    return value
+
+
+def fit_json(data, stage):
+    """
+    Compact JSON for one stage's prompt, within TOKEN_BUDGETS[stage].
+    Long lists and strings are shortened until it fits, so the result is always valid JSON.
+    """
+    text = json.dumps(data, separators=(',', ':'), default=str)
+    if not PROMPT_BUDGET_ENABLED:
+        return json.dumps(data, default=str)[:LEGACY_CHAR_LIMITS[stage]]
+
+    budget = TOKEN_BUDGETS[stage]
+    tokens_in = count_tokens(json.dumps(data, default=str))
+    for max_items, max_chars in ((10, 500), (5, 200), (3, 100), (2, 60), (1, 40)):
+        if count_tokens(text) <= budget:
+            break
+        text = json.dumps(_shrink(data, max_items, max_chars), separators=(',', ':'), default=str)
+    tokens_out = count_tokens(text)
+    logger.info(f"Prompt budget [{stage}]: {tokens_in} -> {tokens_out} tokens (saved {tokens_in - tokens_out}, budget {budget})")
+    return text
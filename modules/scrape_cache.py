@@ -0,0 +1,95 @@
+"""
+Scrape cache keyed by normalized URL.
+
+Stores the cleaned page payload, the extracted emails and contacts and the ETag / Last-Modified
+validators. A fresh entry is returned without touching the network; a stale one is
+revalidated with If-None-Match / If-Modified-Since and reused as-is on a 304, so the
+page is neither downloaded nor parsed again.
+"""
+import os
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from sqlmodel import Session
+
+from database import engine, ScrapeCacheEntry
+
+SCRAPE_CACHE_ENABLED = os.getenv("SCRAPE_CACHE_ENABLED", "true").lower() == "true"
+# How long a cached page is served without revalidation
+SCRAPE_CACHE_TTL_SECONDS = int(os.getenv("SCRAPE_CACHE_TTL_SECONDS", 6 * 3600))
+
+scrape_cache_stats = {
+    "fresh_hits": 0,
+    "revalidated": 0,
+    "misses": 0,
+    "errors": 0,
+}
+
+
+def normalize_cache_url(url):
+    """
+    Canonical cache key for a URL: lower-cased scheme and host, no default port,
+    no fragment, no trailing slash, sorted query parameters.
+    """
+    url = url.strip()
+    if not url.lower().startswith(('http://', 'https://')):
+        url = 'https://' + url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and not ((scheme == 'http' and parts.port == 80) or (scheme == 'https' and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip('/')
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ''))
+
+
+def is_fresh(entry, ttl_seconds=None):
+    ttl = SCRAPE_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    return entry.validated_at > datetime.utcnow() - timedelta(seconds=ttl)
+
+
+def conditional_headers(entry):
+    """Validator headers for revalidating a cached entry"""
+    headers = {}
+    if entry is not None:
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+    return headers
+
+
+def get_entry(key):
+    with Session(engine) as session:
+        entry = session.get(ScrapeCacheEntry, key)
+        if entry is not None:
+            session.expunge(entry)
+        return entry
+
+
+def save_entry(key, content, emails, etag=None, last_modified=None, contacts=None):
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        entry = session.get(ScrapeCacheEntry, key)
+        if entry is None:
+            entry = ScrapeCacheEntry(url=key, content=content)
+        entry.content = content
+        entry.emails = emails
+        entry.contacts = contacts
+        entry.etag = etag
+        entry.last_modified = last_modified
+        entry.fetched_at = now
+        entry.validated_at = now
+        session.add(entry)
+        session.commit()
+
+
+def mark_validated(key):
+    """Records a 304 revalidation: the cached entry is fresh again"""
+    with Session(engine) as session:
+        entry = session.get(ScrapeCacheEntry, key)
+        if entry is not None:
+            entry.validated_at = datetime.utcnow()
+            session.add(entry)
+            session.commit()
@@ -1,68 +1,212 @@
+import os
 import re
-import requests
-from bs4 import BeautifulSoup
 import logging
+import importlib.util
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from modules.html_extract import extract_text, EMAIL_PATTERN
+from modules.contact_extractor import extract_contacts
+
+from modules.scrape_cache import (
+    SCRAPE_CACHE_ENABLED,
+    scrape_cache_stats,
+    normalize_cache_url,
+    is_fresh,
+    conditional_headers,
+    get_entry,
+    save_entry,
+    mark_validated,
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def scrape_website(url):
+SCRAPER_TIMEOUT = float(os.getenv("SCRAPER_TIMEOUT", 15))
+SCRAPER_MAX_CONNECTIONS = int(os.getenv("SCRAPER_MAX_CONNECTIONS", 100))
+SCRAPER_MAX_KEEPALIVE = int(os.getenv("SCRAPER_MAX_KEEPALIVE", 20))
+# HTTP/2 needs the optional 'h2' package (pip install httpx[http2])
+SCRAPER_HTTP2 = os.getenv("SCRAPER_HTTP2", "false").lower() == "true"
+# Response bodies are streamed and cut off after this many bytes
+SCRAPER_MAX_BYTES = int(os.getenv("SCRAPER_MAX_BYTES", 2 * 1024 * 1024))
+# Characters of page text handed to the LLM
+SCRAPER_MAX_CHARS = int(os.getenv("SCRAPER_MAX_CHARS", 15000))
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+}
+
+_client = None
+
+
+def get_http_client():
     """
-    Fetches the website content using Requests and BeautifulSoup.
-    This replaces Playwright to avoid browser download requirements.
+    Shared async HTTP client for all scraping: one connection pool with keep-alive
+    (and HTTP/2 when enabled), so concurrent scrapes cost sockets rather than threads.
     """
-    # Ensure URL has schema
-    if not url.startswith('http'):
-        url = 'https://' + url
-        
-    logger.info(f"Scraping URL: {url}")
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-    }
-    
-    try:
-        # 1. Fetch the page
-        # specific timeout to prevent hanging
-        response = requests.get(url, headers=headers, timeout=15)
+    global _client
+    if _client is None:
+        http2 = SCRAPER_HTTP2 and importlib.util.find_spec("h2") is not None
+        if SCRAPER_HTTP2 and not http2:
+            logger.warning("SCRAPER_HTTP2 is set but the 'h2' package is not installed; using HTTP/1.1")
+        _client = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=SCRAPER_TIMEOUT,
+            follow_redirects=True,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=SCRAPER_MAX_CONNECTIONS,
+                max_keepalive_connections=SCRAPER_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+async def close_http_client():
+    """Closes the shared scraper connection pool (called on app shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def format_content(url, emails, text):
+    """The payload handed to the LLM: source URL, extracted emails and page text"""
+    return f"Source URL: {url}\n\nExtracted Emails: {', '.join(emails)}\n\nWebsite Content:\n{text[:SCRAPER_MAX_CHARS]}"
+
+
+def extract_content(url, html):
+    """
+    Parses the page HTML into (final_content, found_emails, contacts).
+    CPU-bound, so callers run it in the threadpool.
+    """
+    # 2-5. Parse HTML, drop script/style/nav/etc. and clean whitespace,
+    # stopping once SCRAPER_MAX_CHARS of text have been extracted
+    text = extract_text(html, SCRAPER_MAX_CHARS)
+
+    # 6. Basic email extraction (fallback if LLM misses it)
+    found_emails = list(set(re.findall(EMAIL_PATTERN, html)))
+
+    # 7. Contacts from structured markup (mailto/tel links, JSON-LD, hCard)
+    contacts = extract_contacts(html)
+
+    # Combine text with found emails to help the LLM
+    return format_content(url, found_emails, text), found_emails, contacts
+
+
+async def read_capped(response, max_bytes=None):
+    """
+    Reads a streamed response body, stopping after max_bytes.
+    Returns the decoded text (undecodable bytes replaced).
+    """
+    max_bytes = SCRAPER_MAX_BYTES if max_bytes is None else max_bytes
+    body = bytearray()
+    async for chunk in response.aiter_bytes():
+        body.extend(chunk)
+        if len(body) >= max_bytes:
+            logger.info(f"Truncated {response.url} at {max_bytes} bytes")
+            del body[max_bytes:]
+            break
+    return body.decode(response.charset_encoding or 'utf-8', errors='replace')
+
+
+async def fetch_html(url):
+    """
+    GET a page with the shared client, body capped at SCRAPER_MAX_BYTES.
+    Returns (final_url, html) after redirects; raises httpx errors.
+    """
+    async with get_http_client().stream("GET", url) as response:
         response.raise_for_status()
-        
-        # 2. Parse HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 3. Clean up script and style elements
-        for script in soup(["script", "style", "nav", "footer", "header", "noscript", "iframe", "svg"]):
-            script.decompose()
-            
-        # 4. Extract text
-        text = soup.get_text(separator=' ')
-        
-        # 5. Clean whitespace
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        
-        # 6. Basic email extraction (fallback if LLM misses it)
-        email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-        found_emails = list(set(re.findall(email_pattern, response.text)))
-        
-        # Combine text with found emails to help the LLM
-        final_content = f"Source URL: {url}\n\nExtracted Emails: {', '.join(found_emails)}\n\nWebsite Content:\n{text[:15000]}" # Limit to 15k chars
-        
-        return final_content
-
-    except requests.exceptions.HTTPError as e:
+        return str(response.url), await read_capped(response)
+
+
+def scrape_error_message(url, e):
+    """Logs a failed fetch and returns the 'ERROR SCRAPING: ...' payload for it"""
+    if isinstance(e, httpx.HTTPStatusError):
         logger.error(f"HTTP Error scraping {url}: {e}")
         return f"ERROR SCRAPING: HTTP {e.response.status_code}"
-    except requests.exceptions.ConnectionError:
+    if isinstance(e, httpx.ConnectError):
         logger.error(f"Connection Error scraping {url}")
         return "ERROR SCRAPING: Connection refused or host unreachable"
-    except requests.exceptions.Timeout:
+    if isinstance(e, httpx.TimeoutException):
         logger.error(f"Timeout scraping {url}")
         return "ERROR SCRAPING: Request timed out"
+    logger.error(f"Unexpected error scraping {url}: {e}")
+    return f"ERROR SCRAPING: {str(e)}"
+
+
+def scrape_result(content, emails=None, contacts=None):
+    """Detailed scrape result: final_content payload, regex-found emails, structured contacts"""
+    return {'content': content, 'emails': emails or [], 'contacts': contacts}
+
+
+async def scrape_website(url, use_cache=True):
+    """
+    Fetches the website content using the shared async HTTP client; the text is extracted
+    by modules/html_extract.py with the fastest installed parser (selectolax, then lxml,
+    then html.parser, see SCRAPER_PARSER). This replaces Playwright to avoid browser
+    download requirements.
+    Returns the final_content payload (or an 'ERROR SCRAPING: ...' string).
+    """
+    return (await scrape_website_detailed(url, use_cache))['content']
+
+
+async def scrape_website_detailed(url, use_cache=True):
+    """
+    scrape_website, returning scrape_result() with the contacts found in structured markup.
+    Results are cached per normalized URL (see modules/scrape_cache.py): fresh entries skip
+    the network, stale ones are revalidated with a conditional GET and reused on a 304.
+    """
+    # Ensure URL has schema
+    if not url.startswith('http'):
+        url = 'https://' + url
+
+    use_cache = use_cache and SCRAPE_CACHE_ENABLED
+    cache_key = normalize_cache_url(url)
+    cached = None
+    if use_cache:
+        try:
+            cached = await run_in_threadpool(get_entry, cache_key)
+        except Exception as e:
+            scrape_cache_stats["errors"] += 1
+            logger.warning(f"Scrape cache read failed for {url}: {e}")
+        if cached is not None and is_fresh(cached):
+            scrape_cache_stats["fresh_hits"] += 1
+            logger.info(f"Scrape cache hit: {url}")
+            return scrape_result(cached.content, cached.emails, cached.contacts)
+
+    logger.info(f"Scraping URL: {url}")
+
+    try:
+        # 1. Fetch the page, streaming at most SCRAPER_MAX_BYTES (client-wide timeout prevents hanging)
+        async with get_http_client().stream("GET", url, headers=conditional_headers(cached)) as response:
+            if response.status_code == 304 and cached is not None:
+                scrape_cache_stats["revalidated"] += 1
+                logger.info(f"Scrape cache revalidated (304): {url}")
+                await run_in_threadpool(mark_validated, cache_key)
+                return scrape_result(cached.content, cached.emails, cached.contacts)
+
+            response.raise_for_status()
+            html = await read_capped(response)
+
+        content, found_emails, contacts = await run_in_threadpool(extract_content, url, html)
+
+        if use_cache:
+            scrape_cache_stats["misses"] += 1
+            try:
+                await run_in_threadpool(
+                    save_entry, cache_key, content, found_emails,
+                    response.headers.get('etag'), response.headers.get('last-modified'), contacts
+                )
+            except Exception as e:
+                scrape_cache_stats["errors"] += 1
+                logger.warning(f"Scrape cache write failed for {url}: {e}")
+
+        return scrape_result(content, found_emails, contacts)
+
     except Exception as e:
-        logger.error(f"Unexpected error scraping {url}: {e}")
-        return f"ERROR SCRAPING: {str(e)}"
+        return scrape_result(scrape_error_message(url, e))
@@ -0,0 +1,253 @@
+"""
+Per-sender sliding-window send limiter (HOURLY_EMAIL_LIMIT emails per hour by default;
+senders of the pool in modules/sender_pool.py set their own hourly and daily limits).
+
+Every send path reserves its slots here before queueing mail, instead of counting
+email_logs rows: the check and the increment happen under one lock, so two concurrent
+sends cannot both take the last slot, and a check costs the same however large
+email_logs grows. Each window is kept as per-minute counters (at most 60 per hour of
+window), mirrored to the send_rate_buckets table so a restart does not reset it.
+
+The lock only guards the in-memory windows; the table is read and written outside it
+(increments are applied as UPDATE count = count + n), so a slow DB round trip never
+holds up other senders' checks. The methods still touch the DB, so async code calls
+them through run_in_threadpool.
+
+The lock is per process: with several app workers each one enforces the limit on its
+own view of the counters.
+"""
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from database import engine, SendRateBucket
+
+HOURLY_EMAIL_LIMIT = int(os.getenv("HOURLY_EMAIL_LIMIT", 50))
+
+HOUR_SECONDS = 3600
+DAY_SECONDS = 86400
+BUCKET_SECONDS = 60
+
+
+def _bucket_start(now):
+    return now.replace(second=0, microsecond=0)
+
+
+class _Window:
+    def __init__(self, seconds, limit):
+        self.span = timedelta(seconds=seconds)
+        self.limit = limit
+        self.buckets = deque()  # [bucket_start, count], oldest first
+        self.total = 0
+
+    def expire(self, now):
+        # A minute bucket counts until its last second is out of the window
+        cutoff = _bucket_start(now - self.span)
+        while self.buckets and self.buckets[0][0] < cutoff:
+            self.total -= self.buckets.popleft()[1]
+
+    def add(self, bucket, count):
+        if self.buckets and self.buckets[-1][0] == bucket:
+            self.buckets[-1][1] += count
+        else:
+            self.buckets.append([bucket, count])
+        self.total += count
+
+    def remove_latest(self, count):
+        """Removes up to `count` of the most recent sends; returns [(bucket, removed)]"""
+        removed = []
+        while count > 0 and self.buckets:
+            entry = self.buckets[-1]
+            taken = min(count, entry[1])
+            entry[1] -= taken
+            self.total -= taken
+            count -= taken
+            removed.append((entry[0], taken))
+            if entry[1] == 0:
+                self.buckets.pop()
+        return removed
+
+    def status(self, now):
+        frees_in = 0
+        if self.total >= self.limit and self.buckets:
+            frees_in = max(0, int((self.buckets[0][0] + timedelta(seconds=BUCKET_SECONDS) + self.span - now).total_seconds()))
+        return {
+            "limit": self.limit,
+            "used": self.total,
+            "remaining": max(0, self.limit - self.total),
+            "window_seconds": int(self.span.total_seconds()),
+            "next_slot_in_seconds": frees_in,
+        }
+
+
+class SendRateLimiter:
+    def __init__(self, limit=HOURLY_EMAIL_LIMIT):
+        self.limit = limit  # hourly limit of senders without their own limits
+        self._limits = {}  # sender -> (hourly, daily or 0)
+        self._windows = {}  # sender -> [hour _Window, (day _Window)]
+        self._lock = threading.Lock()
+        self.stats = {"reserved": 0, "rejected": 0, "released": 0}
+
+    # ------------------------------------------------------------------ API
+
+    def set_limits(self, sender, hourly=None, daily=0):
+        """Per-sender limits (daily=0: no daily limit); takes effect on the sender's next check"""
+        with self._lock:
+            self._limits[sender] = (hourly or self.limit, daily or 0)
+            self._windows.pop(sender, None)
+
+    def try_reserve(self, sender, count=1):
+        """Takes `count` slots for the sender if they fit in all its windows; returns True on success"""
+        now = datetime.utcnow()
+        self._ensure_loaded(sender, now)
+        with self._lock:
+            windows = self._sender_windows(sender, now)
+            if any(w.total + count > w.limit for w in windows):
+                self.stats["rejected"] += 1
+                return False
+            bucket = _bucket_start(now)
+            new_minute = not windows[-1].buckets or windows[-1].buckets[-1][0] != bucket
+            for window in windows:
+                window.add(bucket, count)
+            self.stats["reserved"] += count
+            span = windows[-1].span
+        if new_minute:
+            self._prune_table(sender, now - span)
+        self._persist(sender, bucket, count)
+        return True
+
+    def release(self, sender, count=1):
+        """Gives back slots reserved for emails that were not queued after all"""
+        with self._lock:
+            windows = self._windows.get(sender)
+            if not windows:
+                return
+            removed = windows[-1].remove_latest(count)
+            for window in windows[:-1]:
+                window.remove_latest(count)
+            self.stats["released"] += sum(taken for _, taken in removed)
+        for bucket, taken in removed:
+            self._persist(sender, bucket, -taken)
+
+    def used(self, sender):
+        """Sends counted in the sender's hourly window"""
+        now = datetime.utcnow()
+        self._ensure_loaded(sender, now)
+        with self._lock:
+            return self._sender_windows(sender, now)[0].total
+
+    def remaining(self, sender):
+        """Sends the sender can still make now (the tightest of its windows)"""
+        now = datetime.utcnow()
+        self._ensure_loaded(sender, now)
+        with self._lock:
+            windows = self._sender_windows(sender, now)
+            return max(0, min(w.limit - w.total for w in windows))
+
+    def status(self, sender):
+        """Remaining capacity of a sender, and when its oldest counted send leaves each window"""
+        now = datetime.utcnow()
+        self._ensure_loaded(sender, now)
+        with self._lock:
+            windows = self._sender_windows(sender, now)
+            hourly = windows[0].status(now)
+            daily = windows[1].status(now) if len(windows) > 1 else None
+        remaining = hourly["remaining"] if daily is None else min(hourly["remaining"], daily["remaining"])
+        return {
+            "sender": sender,
+            **hourly,
+            "remaining": remaining,
+            "next_slot_in_seconds": max(hourly["next_slot_in_seconds"], daily["next_slot_in_seconds"] if daily else 0),
+            "daily": daily,
+        }
+
+    def snapshot(self):
+        with self._lock:
+            senders = {sender: w[0].total for sender, w in self._windows.items()}
+        return {**self.stats, "limit": self.limit, "used": senders}
+
+    # ------------------------------------------------------------ internals
+
+    def _new_windows(self, sender, rows=()):
+        hourly, daily = self._limits.get(sender, (self.limit, 0))
+        windows = [_Window(HOUR_SECONDS, hourly)]
+        if daily:
+            windows.append(_Window(DAY_SECONDS, daily))
+        for bucket, count in rows:
+            for window in windows:
+                window.add(bucket, count)
+        return windows
+
+    def _ensure_loaded(self, sender, now):
+        """Loads the sender's counters from the table on first use (query made outside the lock)"""
+        if sender in self._windows:
+            return
+        hourly, daily = self._limits.get(sender, (self.limit, 0))
+        since = _bucket_start(now - timedelta(seconds=DAY_SECONDS if daily else HOUR_SECONDS))
+        rows = []
+        try:
+            with Session(engine) as session:
+                rows = [
+                    (row.bucket, row.count)
+                    for row in session.exec(
+                        select(SendRateBucket)
+                        .where(SendRateBucket.sender_email == sender, SendRateBucket.bucket >= since)
+                        .order_by(SendRateBucket.bucket)
+                    ).all()
+                    if row.count > 0
+                ]
+        except Exception as e:
+            print(f"Send limiter could not load counters for {sender}: {e}")
+        with self._lock:
+            if sender not in self._windows:
+                self._windows[sender] = self._new_windows(sender, rows)
+
+    def _sender_windows(self, sender, now):
+        """The sender's windows (hourly first) with expired minutes dropped; call with the lock held"""
+        windows = self._windows.get(sender)
+        if windows is None:
+            # Limits were changed since _ensure_loaded: start from empty windows
+            windows = self._windows[sender] = self._new_windows(sender)
+        for window in windows:
+            window.expire(now)
+        return windows
+
+    def _persist(self, sender, bucket, delta):
+        """Applies a change to a minute counter in the table (atomic increment, safe without the lock)"""
+        try:
+            with Session(engine) as session:
+                result = session.execute(
+                    update(SendRateBucket)
+                    .where(SendRateBucket.sender_email == sender, SendRateBucket.bucket == bucket)
+                    .values(count=SendRateBucket.count + delta)
+                )
+                if not result.rowcount and delta > 0:
+                    session.add(SendRateBucket(sender_email=sender, bucket=bucket, count=delta))
+                session.commit()
+        except IntegrityError:
+            # Another thread created the row first: add to it
+            self._persist(sender, bucket, delta)
+        except Exception as e:
+            # The in-memory window still enforces the limit; only restart recovery is affected
+            print(f"Send limiter could not save counters for {sender}: {e}")
+
+    def _prune_table(self, sender, before):
+        try:
+            with Session(engine) as session:
+                session.execute(
+                    delete(SendRateBucket).where(
+                        SendRateBucket.sender_email == sender,
+                        SendRateBucket.bucket < _bucket_start(before),
+                    )
+                )
+                session.commit()
+        except Exception as e:
+            print(f"Send limiter could not prune counters for {sender}: {e}")
+
+
+send_limiter = SendRateLimiter()
@@ -0,0 +1,186 @@
+"""
+Pool of sender mailboxes that outgoing mail is spread across.
+
+SENDER_POOL is a JSON list of mailboxes, each with its own SMTP/IMAP settings and limits:
+
+    [{"email": "a@dapros.com", "password_env": "SENDER_A_PASSWORD",
+      "smtp_server": "smtp.office365.com", "smtp_port": 587, "imap_server": "outlook.office365.com",
+      "hourly_limit": 50, "daily_limit": 300}, ...]
+
+("password" may be given instead of "password_env"; missing settings default to
+SMTP_SERVER / SMTP_PORT / IMAP_SERVER / HOURLY_EMAIL_LIMIT / SENDER_DAILY_LIMIT).
+Without SENDER_POOL the pool is the single OUTLOOK_EMAIL / OUTLOOK_PASSWORD mailbox.
+
+reserve() picks the least-loaded healthy sender and takes its slots in the send limiter
+(modules/send_limiter.py) in one step. A sender whose sends keep failing (or whose
+login is rejected) is marked unhealthy and skipped for SENDER_COOLDOWN_SECONDS,
+doubling while it keeps failing.
+"""
+import os
+import json
+import time
+import smtplib
+import threading
+
+from modules.send_limiter import send_limiter, HOURLY_EMAIL_LIMIT
+
+SENDER_DAILY_LIMIT = int(os.getenv("SENDER_DAILY_LIMIT", 0))  # 0: no daily limit
+SENDER_FAILURE_THRESHOLD = int(os.getenv("SENDER_FAILURE_THRESHOLD", 3))
+SENDER_COOLDOWN_SECONDS = float(os.getenv("SENDER_COOLDOWN_SECONDS", 600))
+SENDER_MAX_COOLDOWN_SECONDS = float(os.getenv("SENDER_MAX_COOLDOWN_SECONDS", 6 * 3600))
+
+# Failures that say nothing about the mailbox itself
+RECIPIENT_ERRORS = (smtplib.SMTPRecipientsRefused,)
+
+
+class Sender:
+    def __init__(self, email, password, smtp_server, smtp_port, imap_server=None,
+                 hourly_limit=HOURLY_EMAIL_LIMIT, daily_limit=SENDER_DAILY_LIMIT):
+        self.email = email
+        self.password = password
+        self.smtp_server = smtp_server
+        self.smtp_port = int(smtp_port)
+        self.imap_server = imap_server
+        self.hourly_limit = int(hourly_limit)
+        self.daily_limit = int(daily_limit or 0)
+        # Health
+        self.consecutive_failures = 0
+        self.cooldowns = 0
+        self.unhealthy_until = 0.0
+        self.last_error = None
+        self.sent = 0
+        self.failed = 0
+
+    def healthy(self, now=None):
+        return (now or time.time()) >= self.unhealthy_until
+
+    def to_dict(self):
+        status = send_limiter.status(self.email)
+        return {
+            "email": self.email,
+            "smtp_server": self.smtp_server,
+            "smtp_port": self.smtp_port,
+            "imap_server": self.imap_server,
+            "healthy": self.healthy(),
+            "unhealthy_for_seconds": max(0, int(self.unhealthy_until - time.time())),
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "sent": self.sent,
+            "failed": self.failed,
+            "hourly": {k: status[k] for k in ("limit", "used", "next_slot_in_seconds")},
+            "daily": status["daily"],
+            "remaining": status["remaining"],
+        }
+
+
+def load_senders():
+    """Senders from SENDER_POOL, or the single OUTLOOK_EMAIL mailbox"""
+    smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+    smtp_port = int(os.getenv('SMTP_PORT', '587'))
+    imap_server = os.getenv('IMAP_SERVER')
+
+    raw = os.getenv("SENDER_POOL")
+    if not raw:
+        email, password = os.getenv('OUTLOOK_EMAIL'), os.getenv('OUTLOOK_PASSWORD')
+        if not email or not password:
+            return []
+        return [Sender(email, password, smtp_server, smtp_port, imap_server)]
+
+    senders = []
+    try:
+        entries = json.loads(raw)
+    except ValueError as e:
+        print(f"⚠ SENDER_POOL is not valid JSON: {e}")
+        return []
+    for entry in entries:
+        email = entry.get("email")
+        password = entry.get("password") or os.getenv(entry.get("password_env") or "")
+        if not email or not password:
+            print(f"⚠ Skipping sender {email or entry}: email and password (or password_env) are required")
+            continue
+        senders.append(Sender(
+            email, password,
+            entry.get("smtp_server", smtp_server),
+            entry.get("smtp_port", smtp_port),
+            entry.get("imap_server", imap_server),
+            entry.get("hourly_limit", HOURLY_EMAIL_LIMIT),
+            entry.get("daily_limit", SENDER_DAILY_LIMIT),
+        ))
+    return senders
+
+
+class SenderPool:
+    def __init__(self, senders=None):
+        self._lock = threading.Lock()
+        self.senders = []
+        self.configure(load_senders() if senders is None else senders)
+
+    def configure(self, senders):
+        self.senders = list(senders)
+        for sender in self.senders:
+            send_limiter.set_limits(sender.email, sender.hourly_limit, sender.daily_limit)
+
+    def get(self, email):
+        for sender in self.senders:
+            if sender.email == email:
+                return sender
+        return None
+
+    def reserve(self, count=1, exclude=()):
+        """
+        Least-loaded healthy sender with `count` free slots, with the slots already taken
+        (release them with send_limiter.release(sender.email, count) if unused), or None.
+        """
+        now = time.time()
+        candidates = [s for s in self.senders if s.email not in exclude and s.healthy(now)]
+        # Most free capacity first (relative to the sender's hourly limit)
+        candidates.sort(key=lambda s: send_limiter.remaining(s.email) / max(1, s.hourly_limit), reverse=True)
+        for sender in candidates:
+            if send_limiter.try_reserve(sender.email, count):
+                return sender
+        return None
+
+    def remaining(self):
+        """Sends the healthy senders can still make now"""
+        now = time.time()
+        return sum(send_limiter.remaining(s.email) for s in self.senders if s.healthy(now))
+
+    def used(self):
+        """Sends counted in the senders' hourly windows"""
+        return sum(send_limiter.used(s.email) for s in self.senders)
+
+    def record_success(self, email):
+        sender = self.get(email)
+        if sender is None:
+            return
+        with self._lock:
+            sender.sent += 1
+            sender.consecutive_failures = 0
+            sender.cooldowns = 0
+
+    def record_failure(self, email, error):
+        """Counts a failed send; too many in a row (or a rejected login) takes the sender out of rotation"""
+        sender = self.get(email)
+        if sender is None or isinstance(error, RECIPIENT_ERRORS):
+            return
+        with self._lock:
+            sender.failed += 1
+            sender.consecutive_failures += 1
+            sender.last_error = str(error)
+            if isinstance(error, smtplib.SMTPAuthenticationError) or sender.consecutive_failures >= SENDER_FAILURE_THRESHOLD:
+                cooldown = min(SENDER_MAX_COOLDOWN_SECONDS, SENDER_COOLDOWN_SECONDS * 2 ** sender.cooldowns)
+                sender.cooldowns += 1
+                sender.consecutive_failures = 0
+                sender.unhealthy_until = time.time() + cooldown
+                print(f"⚠ Sender {email} taken out of rotation for {int(cooldown)}s: {error}")
+
+    def snapshot(self):
+        senders = [s.to_dict() for s in self.senders]
+        return {
+            "senders": senders,
+            "healthy": sum(1 for s in senders if s["healthy"]),
+            "remaining": sum(s["remaining"] for s in senders if s["healthy"]),
+        }
+
+
+sender_pool = SenderPool()
@@ -0,0 +1,239 @@
+"""
+Background appender that saves copies of sent emails to the sender's IMAP Sent folder.
+
+send_email_outlook only writes the message to the sent_copies table and returns; a
+background thread drains the table in batches over one long-lived IMAP connection per
+account (NOOP-checked before reuse), with the Sent folder discovered once per account
+and cached. Rows stay in the table until appended (then they are deleted), so copies
+queued before a restart are appended afterwards. Passwords are only kept in memory: a pending row waits until
+its account's password is known again (registered at startup or by the next send).
+"""
+import os
+import time
+import imaplib
+import threading
+
+from sqlmodel import Session, select, func
+
+from database import engine, SentCopy
+
+SENT_APPEND_BACKGROUND = os.getenv("SENT_APPEND_BACKGROUND", "true").lower() == "true"
+SENT_APPEND_BATCH = int(os.getenv("SENT_APPEND_BATCH", 50))
+SENT_APPEND_INTERVAL_SECONDS = float(os.getenv("SENT_APPEND_INTERVAL_SECONDS", 30))
+SENT_APPEND_MAX_ATTEMPTS = int(os.getenv("SENT_APPEND_MAX_ATTEMPTS", 5))
+IMAP_IDLE_TIMEOUT_SECONDS = float(os.getenv("IMAP_IDLE_TIMEOUT_SECONDS", 600))
+
+SENT_CANDIDATES = ['Expected Sent Folder', 'Sent Items', 'Sent', 'INBOX.Sent', 'INBOX.Sent Items', 'Enviados']
+
+
+def find_sent_folder(mail):
+    """Name of the Sent folder of a logged-in IMAP connection, or None"""
+    status, folder_list = mail.list()
+    folders = []
+    if status == 'OK':
+        for f in folder_list:
+            # Parse folder name from bytes: b'(\HasNoChildren) "/" "Sent"'
+            if '"' in f.decode():
+                name = f.decode().split('"')[-2]
+            else:
+                name = f.decode().split(' ')[-1]
+            folders.append(name)
+
+    # 1. Try exact matches from our list
+    for candidate in SENT_CANDIDATES:
+        if candidate in folders:
+            return candidate
+    # 2. If not found, look for "Sent" in the name (case insensitive)
+    for folder in folders:
+        if 'sent' in folder.lower():
+            return folder
+    print(f"⚠ Could not find a 'Sent' folder. Available: {folders}")
+    return None
+
+
+def _logout(mail):
+    try:
+        mail.logout()
+    except Exception:
+        pass
+
+
+class _Connection:
+    def __init__(self, mail, folder):
+        self.mail = mail
+        self.folder = folder
+        self.last_used = time.monotonic()
+
+
+class SentAppender:
+    def __init__(self):
+        self._passwords = {}  # account -> password (memory only)
+        self._connections = {}  # (server, port, account) -> _Connection
+        self._folders = {}  # (server, port, account) -> Sent folder name
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.stats = {"appended": 0, "failed": 0, "logins": 0, "batches": 0}
+
+    # ------------------------------------------------------------------ API
+
+    def register_account(self, account, password):
+        """Makes an account's password available to the appender (kept in memory only)"""
+        if account and password:
+            self._passwords[account] = password
+
+    def enqueue(self, account, password, imap_server, msg, imap_port=993):
+        """Queues a copy of a sent message; returns immediately"""
+        self.register_account(account, password)
+        with Session(engine) as session:
+            session.add(SentCopy(account=account, imap_server=imap_server, imap_port=imap_port, message=msg.as_string()))
+            session.commit()
+        self._wake.set()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="sent-appender", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the thread after its current batch and logs out of every connection"""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout=30)
+        self._thread = None
+        for conn in self._connections.values():
+            _logout(conn.mail)
+        self._connections.clear()
+
+    def snapshot(self):
+        with Session(engine) as session:
+            rows = session.exec(select(SentCopy.status, func.count(SentCopy.id)).group_by(SentCopy.status)).all()
+        return {
+            **self.stats,
+            "queue": {status: count for status, count in rows},
+            "open_connections": len(self._connections),
+            "accounts_waiting_for_password": self._accounts_without_password(),
+        }
+
+    # --------------------------------------------------------------- worker
+
+    def _accounts_without_password(self):
+        with Session(engine) as session:
+            accounts = session.exec(
+                select(SentCopy.account).where(SentCopy.status == 'pending').distinct()
+            ).all()
+        return [a for a in accounts if a not in self._passwords]
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                while self._drain_batch():
+                    if self._stopped.is_set():
+                        return
+            except Exception as e:
+                print(f"Sent appender error: {e}")
+            self._close_idle()
+            self._wake.wait(timeout=SENT_APPEND_INTERVAL_SECONDS)
+            self._wake.clear()
+
+    def _drain_batch(self):
+        """Appends up to SENT_APPEND_BATCH pending copies; returns True if a full batch was processed"""
+        accounts = list(self._passwords)
+        if not accounts:
+            return False
+        with Session(engine) as session:
+            rows = session.exec(
+                select(SentCopy)
+                .where(SentCopy.status == 'pending', SentCopy.account.in_(accounts))
+                .order_by(SentCopy.id)
+                .limit(SENT_APPEND_BATCH)
+            ).all()
+            if not rows:
+                return False
+
+            broken = set()
+            appended = 0
+            for row in rows:
+                key = (row.imap_server, row.imap_port, row.account)
+                if key in broken:
+                    continue
+                try:
+                    conn = self._connection(key)
+                except Exception as e:
+                    # Server or login trouble: the account's rows wait for the next round, no attempt counted
+                    broken.add(key)
+                    print(f"❌ IMAP connection for {row.account} failed: {e}")
+                    continue
+                if conn.folder is None:
+                    row.status = 'failed'
+                    row.error = "No Sent folder found"
+                    self.stats["failed"] += 1
+                    session.add(row)
+                    continue
+                try:
+                    now = imaplib.Time2Internaldate(time.time())
+                    conn.mail.append(f'"{conn.folder}"', '\\Seen', now, row.message.encode('utf-8'))
+                    conn.last_used = time.monotonic()
+                    appended += 1
+                    self.stats["appended"] += 1
+                    session.delete(row)
+                except Exception as e:
+                    # Drop the connection; the rest of this account's rows wait for the next batch
+                    broken.add(key)
+                    self._drop(key)
+                    row.attempts += 1
+                    row.error = str(e)
+                    if row.attempts >= SENT_APPEND_MAX_ATTEMPTS:
+                        row.status = 'failed'
+                        self.stats["failed"] += 1
+                    print(f"❌ Failed to save copy to Sent folder for {row.account}: {e}")
+                    session.add(row)
+            session.commit()
+            self.stats["batches"] += 1
+            print(f"✓ Saved {appended}/{len(rows)} copies to Sent folders")
+            return len(rows) == SENT_APPEND_BATCH and not broken
+
+    def _connection(self, key):
+        """Logged-in connection for (server, port, account), reused while it answers NOOP"""
+        conn = self._connections.get(key)
+        if conn is not None:
+            try:
+                status, _ = conn.mail.noop()
+                if status == 'OK':
+                    return conn
+            except Exception:
+                pass
+            self._drop(key)
+
+        server, port, account = key
+        print(f"Connecting to IMAP {server} for {account}...")
+        mail = imaplib.IMAP4_SSL(server, port)
+        try:
+            mail.login(account, self._passwords[account])
+            if key not in self._folders:
+                self._folders[key] = find_sent_folder(mail)
+        except Exception:
+            _logout(mail)
+            raise
+        self.stats["logins"] += 1
+        conn = _Connection(mail, self._folders[key])
+        self._connections[key] = conn
+        return conn
+
+    def _drop(self, key):
+        conn = self._connections.pop(key, None)
+        if conn is not None:
+            _logout(conn.mail)
+
+    def _close_idle(self):
+        now = time.monotonic()
+        for key, conn in list(self._connections.items()):
+            if now - conn.last_used > IMAP_IDLE_TIMEOUT_SECONDS:
+                self._drop(key)
+
+
+sent_appender = SentAppender()
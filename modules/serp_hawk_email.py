@@ -1,34 +1,22 @@
-import os
-import json
-from openai import OpenAI
+from modules.openai_client import chat_json, is_throttled
 
-def get_openai_client():
-    api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not found in environment variables")
-    return OpenAI(api_key=api_key)
+SYSTEM_PROMPT = "You are a professional bilingual email copywriter for SERP Hawk. Return only valid JSON with the exact fields specified."
 
-def generate_serp_hawk_email(company_info, market_analysis, service_matches, contact=None, draft_type="outreach"):
-    """
-    Generates a personalized bilingual B2B email using OpenAI.
-    Para 1: English | Para 2: Spanish translation
-    Returns: { subject, english_body, spanish_body, body, body_html }
-    """
-    try:
-        client = get_openai_client()
-        
-        company_name = company_info.get('company_name', 'your company')
-        industry = market_analysis.get('industry', 'your industry')
-        services = service_matches.get('recommended_services', [])[:3]
-        
-        service_list = ", ".join(
-            svc.get('service_name', '') for svc in services
-        ) if services else "growth and digital marketing"
-        
-        salutation = f"Hi {contact.get('name').split()[0]}," if contact and contact.get('name') else f"Hi {company_name} Team,"
-
-        if draft_type == "inbound":
-            prompt = f"""
+
+def build_serp_hawk_email_messages(company_info, market_analysis, service_matches, contact=None, draft_type="outreach"):
+    """Chat messages for an outreach or inbound draft (also used by the batch mode)"""
+    company_name = company_info.get('company_name', 'your company')
+    industry = market_analysis.get('industry', 'your industry')
+    services = service_matches.get('recommended_services', [])[:3]
+    
+    service_list = ", ".join(
+        svc.get('service_name', '') for svc in services
+    ) if services else "growth and digital marketing"
+    
+    salutation = f"Hi {contact.get('name').split()[0]}," if contact and contact.get('name') else f"Hi {company_name} Team,"
+
+    if draft_type == "inbound":
+        prompt = f"""
 You are a professional bilingual email copywriter for SERP Hawk, represented by Team DaPros from Mexico.
 
 Write a professional inquiry email expressing interest in {company_name}'s services in the {industry} sector.
@@ -50,13 +38,13 @@ Return ONLY a JSON object with these fields:
     "spanish_body": "Full paragraph 2 in Spanish WITH the Spanish signature (plain text, no HTML tags)"
 }}
 """
-        else:
-            service_details = "\n".join([
-                f"- {svc.get('service_name', '')}: {svc.get('why_relevant', '')} (Expected: {svc.get('expected_impact', '')})"
-                for svc in services
-            ]) if services else "- Organic SEO: Improve search rankings and qualified traffic\n- Local SEO: Capture local market dominance"
+    else:
+        service_details = "\n".join([
+            f"- {svc.get('service_name', '')}: {svc.get('why_relevant', '')} (Expected: {svc.get('expected_impact', '')})"
+            for svc in services
+        ]) if services else "- Organic SEO: Improve search rankings and qualified traffic\n- Local SEO: Capture local market dominance"
 
-            prompt = f"""
+        prompt = f"""
 You are an expert B2B sales email writer for SERP Hawk, a full-service digital marketing agency, represented by Team DaPros from Mexico.
 
 Write a highly detailed, personalized, and persuasive cold outreach email to {company_name} in the {industry} industry.
@@ -88,36 +76,55 @@ Return ONLY a JSON object with these fields:
 }}
 """
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a professional bilingual email copywriter for SERP Hawk. Return only valid JSON with the exact fields specified."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def format_serp_hawk_email(result, company_name):
+    """Turns the model's JSON into { subject, english_body, spanish_body, body, body_html }"""
+    english = result.get("english_body", "")
+    spanish = result.get("spanish_body", "")
+    combined = f"{english}\n\n{spanish}"
+
+    return {
+        "subject": result.get("subject", f"Growth Partnership with {company_name}"),
+        "english_body": english,
+        "spanish_body": spanish,
+        # backward-compat keys
+        "body": combined,
+        "body_html": f"<p>{english}</p><p>{spanish}</p>",
+    }
+
+
+def serp_hawk_email_error(company_name, error, throttled=False):
+    """Placeholder draft returned when generation fails"""
+    error_msg = f"Could not generate email: {error}"
+    return {
+        "subject": f"Growth for {company_name}",
+        "english_body": error_msg,
+        "spanish_body": "",
+        "body": error_msg,
+        "body_html": f"<p>{error_msg}</p>",
+        "throttled": throttled
+    }
+
+
+async def generate_serp_hawk_email(company_info, market_analysis, service_matches, contact=None, draft_type="outreach"):
+    """
+    Generates a personalized bilingual B2B email using OpenAI.
+    Para 1: English | Para 2: Spanish translation
+    Returns: { subject, english_body, spanish_body, body, body_html }
+    """
+    company_name = company_info.get('company_name', 'your company')
+    try:
+        result = await chat_json(
+            build_serp_hawk_email_messages(company_info, market_analysis, service_matches, contact, draft_type),
+            stage=f"email_{draft_type}"
         )
-        
-        result = json.loads(response.choices[0].message.content)
-        english = result.get("english_body", "")
-        spanish = result.get("spanish_body", "")
-        combined = f"{english}\n\n{spanish}"
-        
-        return {
-            "subject": result.get("subject", f"Growth Partnership with {company_name}"),
-            "english_body": english,
-            "spanish_body": spanish,
-            # backward-compat keys
-            "body": combined,
-            "body_html": f"<p>{english}</p><p>{spanish}</p>",
-        }
-        
+        return format_serp_hawk_email(result, company_name)
+
     except Exception as e:
         print(f"Error in OpenAI email generation: {e}")
-        error_msg = f"Could not generate email: {str(e)}"
-        return {
-            "subject": f"Growth for {company_name}",
-            "english_body": error_msg,
-            "spanish_body": "",
-            "body": error_msg,
-            "body_html": f"<p>{error_msg}</p>"
-        }
+        return serp_hawk_email_error(company_name, str(e), is_throttled(e))
@@ -0,0 +1,48 @@
+"""
+In-flight request coalescing ("singleflight").
+
+When the same website is submitted again while its scrape or analysis is still running
+(double clicks on /draft-lead, /draft-lead and /generate together, ...), the later
+callers wait on the running computation instead of starting their own, and every caller
+gets the same result. Keys are (stage, normalized URL, options); nothing is kept once
+the computation finishes, so this complements rather than replaces the caches.
+"""
+import copy
+import asyncio
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}  # key -> running task
+        self.stats = {"started": 0, "coalesced": 0}
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved even if every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        Awaits fn(*args, **kwargs), or the already running call with the same key.
+        Each caller gets its own deep copy of the result, so callers may mutate it.
+        A caller being cancelled does not cancel the shared computation.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.stats["started"] += 1
+        else:
+            self.stats["coalesced"] += 1
+            print(f"Joining in-flight {key[0]} for {key[1]}")
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result)
+
+    def snapshot(self):
+        return {**self.stats, "in_flight": len(self._calls)}
+
+
+singleflight = SingleFlight()
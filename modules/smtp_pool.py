@@ -0,0 +1,178 @@
+"""
+Pool of authenticated SMTP sessions keyed by (server, port, user).
+
+Connecting, STARTTLS/SSL and AUTH are most of the time of a send, so a session is kept
+open after a message and reused for the next one to the same server and account:
+- a session idle for more than SMTP_NOOP_AFTER_SECONDS is health-checked with NOOP
+  before reuse; sessions idle past SMTP_IDLE_TIMEOUT_SECONDS are closed instead
+- a session is retired after SMTP_SESSION_MAX_MESSAGES messages or SMTP_SESSION_MAX_AGE_SECONDS
+- a reused session that turns out to be disconnected is replaced and the send retried once
+- sessions are checked out by one thread at a time, so the pool is safe to use from the
+  thread pool that runs the blocking sends
+"""
+import os
+import ssl
+import time
+import smtplib
+import hashlib
+import threading
+from collections import deque
+
+SMTP_POOL_ENABLED = os.getenv("SMTP_POOL_ENABLED", "true").lower() == "true"
+SMTP_POOL_MAX_IDLE = int(os.getenv("SMTP_POOL_MAX_IDLE", 2))  # idle sessions kept per key
+SMTP_SESSION_MAX_MESSAGES = int(os.getenv("SMTP_SESSION_MAX_MESSAGES", 50))
+SMTP_SESSION_MAX_AGE_SECONDS = float(os.getenv("SMTP_SESSION_MAX_AGE_SECONDS", 600))
+SMTP_IDLE_TIMEOUT_SECONDS = float(os.getenv("SMTP_IDLE_TIMEOUT_SECONDS", 120))
+SMTP_NOOP_AFTER_SECONDS = float(os.getenv("SMTP_NOOP_AFTER_SECONDS", 5))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+
+
+def open_smtp(smtp_server, smtp_port, sender_email, sender_password):
+    """Connected and logged-in smtplib session: SSL on port 465, STARTTLS otherwise"""
+    smtp_port = int(smtp_port)
+    print(f"Connecting to {smtp_server}:{smtp_port}...")
+    context = ssl.create_default_context()
+    if smtp_port == 465:
+        server = smtplib.SMTP_SSL(smtp_server, smtp_port, context=context, timeout=SMTP_TIMEOUT)
+    else:
+        server = smtplib.SMTP(smtp_server, smtp_port, timeout=SMTP_TIMEOUT)
+        server.starttls(context=context)
+    try:
+        server.login(sender_email, sender_password)
+    except Exception:
+        _close(server)
+        raise
+    return server
+
+
+def _close(server):
+    try:
+        server.quit()
+    except Exception:
+        try:
+            server.close()
+        except Exception:
+            pass
+
+
+def _secret_digest(password):
+    return hashlib.sha256((password or '').encode('utf-8')).hexdigest()
+
+
+class _Session:
+    def __init__(self, key, server, secret):
+        self.key = key
+        self.server = server
+        self.secret = secret
+        self.messages = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.reused = False
+
+
+class SMTPPool:
+    def __init__(self, enabled=SMTP_POOL_ENABLED, max_idle=SMTP_POOL_MAX_IDLE):
+        self.enabled = enabled
+        self.max_idle = max_idle
+        self._idle = {}  # (server, port, user) -> deque of idle _Session
+        self._lock = threading.Lock()
+        self.stats = {"connects": 0, "reuses": 0, "noop_failures": 0, "retired": 0, "reconnects": 0, "sends": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _usable(self, session, secret, now):
+        if session.secret != secret:
+            return False
+        if now - session.created_at > SMTP_SESSION_MAX_AGE_SECONDS or now - session.last_used > SMTP_IDLE_TIMEOUT_SECONDS:
+            self._count("retired")
+            return False
+        if now - session.last_used > SMTP_NOOP_AFTER_SECONDS:
+            try:
+                code, _ = session.server.noop()
+            except Exception:
+                code = None
+            if code != 250:
+                self._count("noop_failures")
+                return False
+        return True
+
+    def acquire(self, smtp_server, smtp_port, sender_email, sender_password):
+        """An idle healthy session for the key, or a new one"""
+        key = (smtp_server, int(smtp_port), sender_email)
+        secret = _secret_digest(sender_password)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                session = idle.pop() if idle else None
+            if session is None:
+                break
+            # NOOP outside the lock: other threads keep using the pool meanwhile
+            if self._usable(session, secret, time.monotonic()):
+                session.reused = True
+                self._count("reuses")
+                return session
+            _close(session.server)
+
+        server = open_smtp(smtp_server, smtp_port, sender_email, sender_password)
+        self._count("connects")
+        return _Session(key, server, secret)
+
+    def release(self, session, healthy=True):
+        """Returns a session to the pool, or closes it when unhealthy, used up or the pool is full"""
+        session.last_used = time.monotonic()
+        if healthy and self.enabled and session.messages < SMTP_SESSION_MAX_MESSAGES:
+            with self._lock:
+                idle = self._idle.setdefault(session.key, deque())
+                if len(idle) < self.max_idle:
+                    idle.append(session)
+                    return
+        if session.messages >= SMTP_SESSION_MAX_MESSAGES:
+            self._count("retired")
+        _close(session.server)
+
+    def sendmail(self, smtp_server, smtp_port, sender_email, sender_password, recipients, message):
+        """
+        Sends one message through a pooled session. A reused session that was dropped by the
+        server is replaced and the message sent once more on a fresh connection.
+        """
+        while True:
+            session = self.acquire(smtp_server, smtp_port, sender_email, sender_password)
+            try:
+                session.server.sendmail(sender_email, recipients, message)
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                self.release(session, healthy=False)
+                if not session.reused:
+                    raise
+                print(f"Pooled SMTP session to {smtp_server} was dropped ({e}); reconnecting")
+                self._count("reconnects")
+                continue
+            except smtplib.SMTPRecipientsRefused:
+                # Refused recipients leave the session in a clean state
+                session.messages += 1
+                self.release(session)
+                raise
+            except Exception:
+                self.release(session, healthy=False)
+                raise
+            session.messages += 1
+            self._count("sends")
+            self.release(session)
+            return
+
+    def close_all(self):
+        """Closes every idle session (called on app shutdown)"""
+        with self._lock:
+            sessions = [s for idle in self._idle.values() for s in idle]
+            self._idle.clear()
+        for session in sessions:
+            _close(session.server)
+
+    def snapshot(self):
+        with self._lock:
+            idle = sum(len(q) for q in self._idle.values())
+        return {**self.stats, "idle_sessions": idle, "enabled": self.enabled}
+
+
+smtp_pool = SMTPPool()
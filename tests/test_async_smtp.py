@@ -0,0 +1,213 @@
+"""
+modules/async_smtp.py against a local aiosmtpd server (STARTTLS with a throwaway
+self-signed certificate, AUTH, PIPELINING advertised).
+
+    pip install -r requirements-dev.txt
+    python -m pytest tests
+"""
+import ssl
+import shutil
+import socket
+import asyncio
+import smtplib
+import subprocess
+
+import pytest
+
+pytest.importorskip("aiosmtpd")
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+from modules import async_smtp
+from modules.async_smtp import AsyncSMTPConnection, AsyncSMTPPool
+
+USER = "sender@test.local"
+PASSWORD = "secret"
+
+
+class Handler:
+    def __init__(self):
+        self.messages = []
+        self.commands = []
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        session.host_name = hostname
+        # aiosmtpd reads pipelined commands fine but does not advertise the extension
+        return responses[:-1] + ["250-PIPELINING", responses[-1]]
+
+    async def handle_MAIL(self, server, session, envelope, address, mail_options):
+        self.commands.append(("MAIL", address))
+        envelope.mail_from = address
+        return "250 OK"
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        self.commands.append(("RCPT", address))
+        if address.startswith("refused"):
+            return "550-Mailbox unavailable\r\n550 5.1.1 User unknown"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.mail_from, list(envelope.rcpt_tos), envelope.content))
+        if b"X-Test: slow" in envelope.content:
+            await asyncio.sleep(1)
+        if b"X-Test: drop" in envelope.content:
+            # Accepted, but the connection goes away before the reply
+            server.transport.close()
+        return "250 Message accepted"
+
+
+def authenticator(server, session, envelope, mechanism, auth_data):
+    # handled=False: aiosmtpd answers a failure with 535 itself
+    return AuthResult(success=auth_data.login == USER.encode() and auth_data.password == PASSWORD.encode(), handled=False)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def certificate(tmp_path_factory):
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl is needed to make the test certificate")
+    path = tmp_path_factory.mktemp("tls")
+    cert, key = path / "cert.pem", path / "key.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost",
+         "-keyout", str(key), "-out", str(cert)],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+@pytest.fixture
+def server(certificate, monkeypatch):
+    cert, key = certificate
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(cert, key)
+    # The client verifies the server certificate: trust the test one
+    client_context = ssl.create_default_context(cafile=str(cert))
+    monkeypatch.setattr(async_smtp.ssl, "create_default_context", lambda: client_context)
+
+    handler = Handler()
+    controller = Controller(
+        handler, hostname="localhost", port=_free_port(),
+        tls_context=server_context, require_starttls=True, authenticator=authenticator,
+    )
+    controller.start()
+    handler.port = controller.port
+    yield handler
+    controller.stop()
+
+
+def test_multiline_replies(server):
+    async def run():
+        connection = await AsyncSMTPConnection("localhost", server.port).connect(USER, PASSWORD)
+        try:
+            return connection.extensions
+        finally:
+            await connection.quit()
+
+    extensions = asyncio.run(run())
+    # Every line of the multiline EHLO reply was parsed, before and after STARTTLS
+    assert "pipelining" in extensions
+    assert "auth" in extensions
+    assert "starttls" not in extensions
+
+
+def test_refused_recipient_in_pipelined_batch(server):
+    async def run():
+        connection = await AsyncSMTPConnection("localhost", server.port).connect(USER, PASSWORD)
+        try:
+            refused = await connection.sendmail(USER, ["a@test.local", "refused@test.local", "b@test.local"], "Subject: hi\n\nbody\n.dot")
+            # The connection is still in step after the refusal
+            second = await connection.sendmail(USER, ["c@test.local"], "Subject: again\n\nbody")
+            return refused, second
+        finally:
+            await connection.quit()
+
+    refused, second = asyncio.run(run())
+    assert list(refused) == ["refused@test.local"]
+    code, text = refused["refused@test.local"]
+    assert code == 550
+    assert b"Mailbox unavailable" in text and b"User unknown" in text
+    assert second == {}
+    assert [m[1] for m in server.messages] == [["a@test.local", "b@test.local"], ["c@test.local"]]
+    assert server.messages[0][2].endswith(b"body\r\n.dot\r\n")
+
+
+def test_all_recipients_refused(server):
+    async def run():
+        connection = await AsyncSMTPConnection("localhost", server.port).connect(USER, PASSWORD)
+        try:
+            with pytest.raises(smtplib.SMTPRecipientsRefused) as error:
+                await connection.sendmail(USER, ["refused1@test.local", "refused2@test.local"], "Subject: hi\n\nbody")
+            # RSET put the session back: the next message goes through
+            await connection.sendmail(USER, ["ok@test.local"], "Subject: hi\n\nbody")
+            return error.value
+        finally:
+            await connection.quit()
+
+    error = asyncio.run(run())
+    assert set(error.recipients) == {"refused1@test.local", "refused2@test.local"}
+    assert [m[1] for m in server.messages] == [["ok@test.local"]]
+
+
+def test_auth_failure(server):
+    async def run():
+        await AsyncSMTPConnection("localhost", server.port).connect(USER, "wrong")
+
+    with pytest.raises(smtplib.SMTPAuthenticationError) as error:
+        asyncio.run(run())
+    assert error.value.smtp_code == 535
+    assert server.commands == []
+
+
+def test_reply_timeout_is_not_a_disconnect(server):
+    async def run():
+        connection = await AsyncSMTPConnection("localhost", server.port, timeout=0.3).connect(USER, PASSWORD)
+        try:
+            await connection.sendmail(USER, ["a@test.local"], "X-Test: slow\n\nbody")
+        finally:
+            connection.close()
+
+    with pytest.raises(socket.timeout) as error:
+        asyncio.run(run())
+    assert not isinstance(error.value, smtplib.SMTPServerDisconnected)
+
+
+def test_pool_does_not_resend_after_data(server):
+    async def run():
+        pool = AsyncSMTPPool(connections=1)
+        try:
+            await pool.sendmail("localhost", server.port, USER, PASSWORD, ["first@test.local"], "Subject: 1\n\nbody")
+            # Goes over the reused connection, which drops after the body was sent
+            with pytest.raises(smtplib.SMTPServerDisconnected):
+                await pool.sendmail("localhost", server.port, USER, PASSWORD, ["second@test.local"], "X-Test: drop\n\nbody")
+            return pool.snapshot()
+        finally:
+            await pool.close_all()
+
+    stats = asyncio.run(run())
+    assert stats["reuses"] == 1 and stats["reconnects"] == 0
+    assert [m[1] for m in server.messages] == [["first@test.local"], ["second@test.local"]]
+
+
+def test_pool_reuses_connections(server):
+    async def run():
+        pool = AsyncSMTPPool(connections=2)
+        try:
+            await asyncio.gather(*[
+                pool.sendmail("localhost", server.port, USER, PASSWORD, [f"r{i}@test.local"], f"Subject: {i}\n\nbody")
+                for i in range(6)
+            ])
+            return pool.snapshot()
+        finally:
+            await pool.close_all()
+
+    stats = asyncio.run(run())
+    assert stats["sends"] == 6 and stats["pipelined"] == 6
+    assert sorted(m[1][0] for m in server.messages) == sorted(f"r{i}@test.local" for i in range(6))
@@ -0,0 +1,41 @@
+"""
+modules/contact_extractor.py: when structured markup is trusted enough to skip the LLM.
+
+    python -m pytest tests
+"""
+import pytest
+
+pytest.importorskip("bs4")
+
+from modules.contact_extractor import extract_contacts, is_confident
+
+
+@pytest.mark.parametrize("text", ["Contact Us", "Email Us", "Get in Touch", "Send Us A Message", "info@acme.io"])
+def test_mailto_only_page_goes_to_the_llm(text):
+    local = extract_contacts(f'<p>Questions? <a href="mailto:info@acme.io">{text}</a></p>')
+    assert local['emails'] == ['info@acme.io']
+    assert local['people'] == []
+    assert not is_confident(local)
+
+
+def test_named_mailto_link_is_not_enough():
+    local = extract_contacts('<a href="mailto:maria@acme.io">Maria Lopez</a>')
+    assert [(p['name'], p['source']) for p in local['people']] == [('Maria Lopez', 'mailto')]
+    assert not is_confident(local)
+
+
+def test_json_ld_person_skips_the_llm():
+    local = extract_contacts(
+        '<script type="application/ld+json">'
+        '{"@type": "Person", "name": "Ann Lee", "jobTitle": "CEO", "email": "ann@acme.io"}'
+        '</script>'
+    )
+    assert is_confident(local)
+
+
+def test_hcard_person_skips_the_llm():
+    local = extract_contacts(
+        '<div class="vcard"><span class="fn">Ann Lee</span><span class="title">CEO</span>'
+        '<a class="email" href="mailto:ann@acme.io">ann@acme.io</a></div>'
+    )
+    assert is_confident(local)